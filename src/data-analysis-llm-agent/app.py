@@ -1,39 +1,71 @@
 import chainlit as cl
 from dotenv import load_dotenv
 import logging
-from plotly.graph_objs import Figure
-
-from utils import generate_sqlite_table_info_query, format_table_info
-from tools import tools_schema, run_sqlite_query, plot_chart
-from bot import ChatBot
+from functools import lru_cache
+
+from utils import generate_postgres_table_info_query, format_table_info
+from tools import tools_schema, run_query, run_postgres_query, plot_chart, read_result, db_backend, is_figure
+from catalog import get_schema_catalog
+from rollups import get_rollup_store
+from config import env_str
+from bot import ChatBot, message_to_dict
+from tracing import annotate, setup_logging, trace
+from metrics import TURN_ITERATIONS, start_metrics_exporters
+from session_store import get_session_manager
 
 # Load environment variables from .env file
 load_dotenv("../.env")
 
-# Configure logging
-logging.basicConfig(filename='chatbot.log', level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+# JSON logs written to a rotating chatbot.log by a background thread (see tracing.py)
+setup_logging()
 logger = logging.getLogger()
-logger.addHandler(logging.FileHandler('chatbot.log'))
+# Prometheus endpoint (METRICS_PORT) and/or periodic dump (METRICS_DUMP_PATH), see metrics.py
+start_metrics_exporters()
 
 MAX_ITER = 5
-schema_table_pairs = []
+# Postgres tables described in the prompt, e.g. PG_SCHEMA_TABLES="public.machinelogs"
+schema_table_pairs = [tuple(pair.split('.', 1)) for pair in env_str('PG_SCHEMA_TABLES', '').split(',') if '.' in pair]
 
-tool_run_sqlite_query = cl.step(type="tool", show_input="json", language="str")(run_sqlite_query)
+tool_run_query = cl.step(type="tool", show_input="json", language="str")(run_query)
 tool_plot_chart = cl.step(type="tool", show_input="json", language="json")(plot_chart)
-original_run_sqlite_query = tool_run_sqlite_query.__wrapped__
+tool_read_result = cl.step(type="tool", show_input="json", language="str")(read_result)
 
-@cl.on_chat_start
-async def on_chat_start():
-    await cl.Message(content="Hi, I’m DataQube, your intelligent AI assistant. I can help you query data and generate insightful charts. How can I assist you today?").send()
-    
-    # Build schema query
-    table_info_query = generate_sqlite_table_info_query(schema_table_pairs)
+_postgres_table_info = None
+
+
+async def get_table_info():
+    """Schema description for the prompt, shared by all sessions instead of queried per session."""
+    global _postgres_table_info
+    if db_backend() == 'postgres':
+        if _postgres_table_info is None:
+            # Build schema query and format column details
+            table_info_query = generate_postgres_table_info_query(schema_table_pairs)
+            result, column_names = await run_postgres_query(table_info_query, markdown=False)
+            _postgres_table_info = format_table_info(result, column_names)
+        return _postgres_table_info
+
+    # Loaded on first use and reloaded only when the database changes
+    catalog = await get_schema_catalog().refresh()
 
-    # Execute query
-    result, column_names = await original_run_sqlite_query(table_info_query, markdown=False)
-    table_info = '\n'.join([item[0] for item in result])
+    # Starts a background rollup (re)build if the data changed since the last one
+    rollups = get_rollup_store()
+    if rollups is not None:
+        rollups.ensure_fresh()
 
-    system_message = f"""You are an expert in data analysis. You will provide valuable insights for business users based on their request.
+    # The columnar backend loads (or memory-maps) the table in the background on first use
+    if db_backend() == 'columnar':
+        from columnar import get_column_store
+
+        columns = get_column_store()
+        if columns is not None:
+            columns.ensure_fresh()
+
+    return catalog.table_info
+
+
+@lru_cache(maxsize=4)
+def build_system_message(table_info):
+    return f"""You are an expert in data analysis. You will provide valuable insights for business users based on their request.
     Before responding, make sure that user requests pertain to data analysis on the provided schema; else, decline.
     If the user requests some data, you will build an SQL query based on the user request for SQLite DB from the provided schema/table details and call query_db tools to fetch data from the database with the correct/relevant query that gives the correct result.
     You have access to tools to execute database queries and get results and to plot the query results. 
@@ -59,22 +91,62 @@ async def on_chat_start():
     Here are the complete schema details with column details:
     {table_info}"""
 
+
+async def new_bot():
+    table_info = await get_table_info()
+    system_message = build_system_message(table_info)
+
     tool_functions = {
-        "query_db": tool_run_sqlite_query,
-        "plot_chart": tool_plot_chart
+        "query_db": tool_run_query,
+        "plot_chart": tool_plot_chart,
+        "read_result": tool_read_result,
     }
 
-    cl.user_session.set("bot", ChatBot(system_message, tools_schema, tool_functions))
+    return ChatBot(system_message, tools_schema, tool_functions)
+
+
+async def session_bot():
+    """The session's ChatBot; with SESSION_STORE it may be rehydrated from state saved by another worker."""
+    sessions = get_session_manager()
+    if sessions is None:
+        return cl.user_session.get("bot")
+    bot = await sessions.get(cl.user_session.get("id"), new_bot)
+    cl.user_session.set("bot", bot)
+    return bot
+
+
+@cl.on_chat_start
+async def on_chat_start():
+    await cl.Message(content="Hi, I’m DataQube, your intelligent AI assistant. I can help you query data and generate insightful charts. How can I assist you today?").send()
+
+    if get_session_manager() is not None:
+        # A reconnect to this worker continues the stored conversation
+        await session_bot()
+    else:
+        cl.user_session.set("bot", await new_bot())
+
+@cl.on_stop
+async def on_stop():
+    # The user stopped the run: cancel the session's in-flight tool calls
+    bot = cl.user_session.get("bot")
+    if bot is not None:
+        bot.cancel()
 
 @cl.on_message
 async def on_message(message: cl.Message):
-    bot = cl.user_session.get("bot")
+    # One trace per turn: model calls, tool calls and DB work are timed as spans under it
+    with trace("turn", session=cl.user_session.get("id")):
+        await handle_message(message)
+
+
+async def handle_message(message: cl.Message):
+    bot = await session_bot()
 
     msg = cl.Message(author="Assistant", content="")
     await msg.send()
 
-    # Step 1: User request and first response from the bot
-    response_message = await bot(message.content)
+    # Step 1: User request and first response from the bot, streamed token by token
+    response_message = await bot(message.content, on_token=msg.stream_token)
     msg.content = response_message.content or ""
     
     # Pending message to be sent
@@ -86,12 +158,14 @@ async def on_message(message: cl.Message):
     tool_calls = response_message.tool_calls
     while cur_iter <= MAX_ITER:
         if tool_calls:
-            bot.messages.append(response_message)  # Add tool call to messages before executing function calls
-            response_message, function_responses = await bot.call_functions(tool_calls)
+            bot.messages.append(message_to_dict(response_message))  # Add tool call to messages before executing function calls
+            followup_msg = cl.Message(author="Assistant", content="")
+            response_message, function_responses = await bot.call_functions(tool_calls, on_token=followup_msg.stream_token)
 
             # Response message is response after completing function calls and sending it back to the bot
             if response_message.content and len(response_message.content) > 0:
-                await cl.Message(author="Assistant", content=response_message.content).send()
+                followup_msg.content = response_message.content
+                await followup_msg.send()
 
             # Reassign tool_calls from new response
             tool_calls = response_message.tool_calls
@@ -99,7 +173,7 @@ async def on_message(message: cl.Message):
             # Some responses like charts should be displayed explicitly
             function_responses_to_display = [res for res in function_responses if res['name'] in bot.exclude_functions]
             for function_res in function_responses_to_display:
-                if isinstance(function_res["content"], Figure):
+                if is_figure(function_res["content"]):
                     try:
                         chart = cl.Plotly(name="chart", figure=function_res['content'], display="inline")
                         await cl.Message(author="Assistant", content="", elements=[chart]).send()
@@ -108,3 +182,11 @@ async def on_message(message: cl.Message):
         else:
             break
         cur_iter += 1
+
+    TURN_ITERATIONS.observe(cur_iter)
+    annotate(iterations=cur_iter)
+
+    sessions = get_session_manager()
+    if sessions is not None:
+        # Saved before the next turn can reach another worker
+        await sessions.save(cl.user_session.get("id"), bot)
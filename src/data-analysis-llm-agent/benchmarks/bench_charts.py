@@ -0,0 +1,66 @@
+"""
+Benchmark: plot_chart build time and figure payload with and without decimation.
+
+For each --points size a noisy line series and a random scatter series are
+charted with decimation off (CHART_MAX_POINTS=0) and on, and then again from
+the figure cache. Payload is the figure JSON that cl.Plotly sends to the
+browser. Needs plotly.
+
+    python benchmarks/bench_charts.py --points 1000 100000 1000000
+"""
+import argparse
+import math
+import os
+import random
+import time
+
+import common  # noqa: F401  (puts the app directory on sys.path)
+from common import percentile
+from charts import get_figure_cache
+from tools import cached_chart
+
+
+def timed(repeat, function, *args):
+    timings = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function(*args)
+        timings.append(time.perf_counter() - start)
+    return result, percentile(timings, 50)
+
+
+def main(args):
+    rng = random.Random(0)
+    # The first figure pays for plotly's imports and validators
+    cached_chart([0, 1], [0, 1], "warm-up", "x", "y", "line", None)
+    for points in args.points:
+        x_values = list(range(points))
+        series = {
+            "line": [math.sin(i / max(points / 20, 1)) + rng.random() * 0.2 for i in x_values],
+            "scatter": [rng.gauss(0, 1) + i / points for i in x_values],
+        }
+        print(f"\n{points} points")
+        for plot_type, y_values in series.items():
+            args_ = (x_values, y_values, "bench", "x", "y", plot_type, None)
+            os.environ["CHART_MAX_POINTS"] = "0"
+            get_figure_cache().clear()
+            full, full_s = timed(1, cached_chart, *args_)
+            full_bytes = len(full.to_json())
+
+            os.environ["CHART_MAX_POINTS"] = str(args.max_points)
+            get_figure_cache().clear()
+            reduced, reduced_s = timed(1, cached_chart, *args_)
+            reduced_bytes = len(reduced.to_json())
+            _, hit_s = timed(args.repeat, cached_chart, *args_)
+            print(f"{plot_type:<8} full {full_s * 1000:8.1f}ms {full_bytes / 1024:9.0f}KB   "
+                  f"decimated {reduced_s * 1000:8.1f}ms {reduced_bytes / 1024:7.0f}KB ({len(reduced.data[0].x)} points)   "
+                  f"cache hit p50 {hit_s * 1000:7.1f}ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--points", type=int, nargs="+", default=[1000, 100000])
+    parser.add_argument("--max-points", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=5)
+    main(parser.parse_args())
@@ -0,0 +1,78 @@
+"""
+Benchmark: completion cache and request coalescing in ChatBot.execute.
+
+--sessions chat sessions each ask --turns questions drawn from a small set of
+onboarding questions, all at once, against a fake Groq client (fake_groq.py)
+with simulated latency. Tool calls run against the real database. The run is
+repeated with LLM_CACHE_ENABLED off and on; upstream model calls and turn
+latency are reported.
+
+    python benchmarks/bench_completion_cache.py --sessions 50 --turns 3
+"""
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+
+import common  # noqa: F401  (puts the app directory on sys.path)
+from common import report
+from fake_groq import FakeGroq, QUESTION_SQL
+from bench_load import SYSTEM, run_turn
+import bot
+import completion_cache
+from tools import plot_chart, run_query, tools_schema
+
+
+async def session(questions, latencies):
+    chat_bot = bot.ChatBot(SYSTEM, tools_schema, {"query_db": run_query, "plot_chart": plot_chart})
+    for question in questions:
+        start = time.perf_counter()
+        await run_turn(chat_bot, question)
+        latencies.append(time.perf_counter() - start)
+
+
+async def run(args, enabled, store_path=None):
+    os.environ["LLM_CACHE_ENABLED"] = "1" if enabled else "0"
+    os.environ["LLM_CACHE_CONTEXT_TURNS"] = str(args.context_turns)
+    if store_path:
+        os.environ["LLM_CACHE_PATH"] = store_path
+    completion_cache._cache = None
+    client = FakeGroq(ttft_s=args.ttft_ms / 1000, token_s=args.token_ms / 1000)
+    bot._client = client
+
+    rng = random.Random(0)
+    # Variants that differ in spacing and punctuation only share completions; case is kept in the key
+    questions = list(QUESTION_SQL) + [" ".join(question.split()).replace(" ", "  ") + "?" for question in QUESTION_SQL]
+    latencies = []
+    start = time.perf_counter()
+    await asyncio.gather(*(
+        session([rng.choice(questions) for _ in range(args.turns)], latencies) for _ in range(args.sessions)
+    ))
+    wall_s = time.perf_counter() - start
+    label = f"cache {'on' if enabled else 'off'}{' +store' if store_path else ''}"
+    report(label, latencies, wall_s)
+    print(f"{'':<28} upstream calls={client.calls} (max concurrent {client.max_active})")
+    cache = completion_cache.get_completion_cache()
+    if cache is not None:
+        print(f"{'':<28} {cache.stats()}")
+
+
+async def main(args):
+    await run(args, enabled=False)
+    await run(args, enabled=True)
+    # A second process start with the SQLite store already filled
+    store_path = os.path.join(tempfile.mkdtemp(prefix="llm-cache-"), "completions.db")
+    await run(args, enabled=True, store_path=store_path)
+    await run(args, enabled=True, store_path=store_path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sessions", type=int, default=50)
+    parser.add_argument("--turns", type=int, default=3)
+    parser.add_argument("--ttft-ms", type=float, default=400)
+    parser.add_argument("--token-ms", type=float, default=10)
+    parser.add_argument("--context-turns", type=int, default=0, help="LLM_CACHE_CONTEXT_TURNS for the cached runs")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,70 @@
+"""
+Microbenchmark: fetchall + convert_to_json + json_to_markdown_table vs ResultFormatter.
+
+Builds an in-memory copy of the ai4i2020 table at each size and formats a
+SELECT * over it, reporting time, peak Python memory and output size.
+
+    python benchmarks/bench_formatting.py --sizes 1000 10000 100000
+"""
+import argparse
+import random
+import sqlite3
+import time
+import tracemalloc
+
+import common  # noqa: F401  (puts the app directory on sys.path)
+from formatting import ResultFormatter
+from utils import convert_to_json, json_to_markdown_table
+
+COLUMNS = ['"UDI" INTEGER', '"Product ID" TEXT', '"Type" TEXT', '"Air temperature [K]" REAL',
+           '"Process temperature [K]" REAL', '"Rotational speed [rpm]" INTEGER', '"Torque [Nm]" REAL',
+           '"Tool wear [min]" INTEGER', '"Machine failure" INTEGER']
+
+
+def build_db(rows):
+    rng = random.Random(42)
+    connection = sqlite3.connect(":memory:")
+    connection.execute(f"CREATE TABLE Machinelogs ({', '.join(COLUMNS)})")
+    connection.executemany(
+        "INSERT INTO Machinelogs VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        ((i, f"{t}{10000 + i}", t, round(rng.gauss(300, 2), 1), round(rng.gauss(310, 1.5), 1),
+          int(rng.gauss(1540, 180)), round(rng.gauss(40, 10), 1), rng.randint(0, 250), int(rng.random() < 0.034))
+         for i, t in ((i, rng.choice("LMH")) for i in range(1, rows + 1))),
+    )
+    return connection
+
+
+def old_path(connection):
+    cursor = connection.execute("SELECT * FROM Machinelogs")
+    column_names = [desc[0] for desc in cursor.description]
+    result = cursor.fetchall()
+    return json_to_markdown_table(convert_to_json(result, column_names))
+
+
+def measure(label, fn, size):
+    tracemalloc.start()
+    start = time.perf_counter()
+    output = fn()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{size:>8} rows  {label:<30} {elapsed * 1000:9.1f}ms  peak={peak / 1e6:8.2f}MB  output={len(output) / 1e3:9.1f}KB")
+
+
+def main(args):
+    for size in args.sizes:
+        connection = build_db(size)
+        measure("convert_to_json+markdown", lambda: old_path(connection), size)
+        unlimited = ResultFormatter("markdown", max_rows=None, max_bytes=None)
+        measure("ResultFormatter (no limit)", lambda: unlimited.write_cursor(connection.execute("SELECT * FROM Machinelogs")), size)
+        capped = ResultFormatter("markdown", max_rows=args.max_rows, max_bytes=args.max_bytes)
+        measure(f"ResultFormatter ({args.max_rows} rows)", lambda: capped.write_cursor(connection.execute("SELECT * FROM Machinelogs")), size)
+        connection.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--max-rows", type=int, default=100)
+    parser.add_argument("--max-bytes", type=int, default=16000)
+    main(parser.parse_args())
@@ -0,0 +1,71 @@
+"""
+Benchmark: index advisor on a scaled-up synthetic copy of ai4i2020.
+
+Builds a synthetic Machinelogs with --rows rows, replays a workload of the
+filters the model typically writes (Type, Machine failure, failure flags,
+sensor ranges) through the advisor, creates the suggested indexes and prints
+before/after latency for every query they serve.
+
+    python benchmarks/bench_index_advisor.py --rows 1000000
+"""
+import argparse
+import os
+import sqlite3
+import tempfile
+import time
+
+import common  # noqa: F401  (puts the app directory on sys.path)
+from common import build_synthetic_db
+from index_advisor import IndexAdvisor, format_report
+
+WORKLOAD = [
+    'SELECT "Product ID", Type, "Tool wear [min]" FROM Machinelogs WHERE "Machine failure" = 1 ORDER BY "Tool wear [min]" DESC LIMIT 20',
+    'SELECT COUNT(*) FROM Machinelogs WHERE "Machine failure" = 1',
+    'SELECT Type, COUNT(*) FROM Machinelogs WHERE "Machine failure" = 1 GROUP BY Type',
+    "SELECT AVG(\"Torque [Nm]\") FROM Machinelogs WHERE Type = 'L' AND TWF = 1",
+    "SELECT \"Product ID\", \"Tool wear [min]\" FROM Machinelogs WHERE Type = 'H' AND \"Tool wear [min]\" > 200",
+    "SELECT COUNT(*) FROM Machinelogs WHERE Type = 'M' AND HDF = 1",
+    'SELECT UDI, "Air temperature [K]", "Process temperature [K]" FROM Machinelogs WHERE OSF = 1 LIMIT 50',
+]
+
+
+def main(args):
+    workdir = args.workdir or tempfile.mkdtemp(prefix="index-bench-")
+    db_path = os.path.join(workdir, "synthetic.db")
+    start = time.perf_counter()
+    build_synthetic_db(db_path, args.rows)
+    print(f"synthetic table: {args.rows} rows in {time.perf_counter() - start:.1f}s")
+
+    # Replay the workload the way query_db would record it
+    advisor = IndexAdvisor(db_path, log_path=os.path.join(workdir, "query_log.jsonl"), interval=0,
+                           max_indexes=args.max_indexes)
+    connection = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    for _ in range(args.replay):
+        for sql_query in WORKLOAD:
+            start = time.perf_counter()
+            connection.execute(sql_query).fetchall()
+            advisor.record(sql_query, time.perf_counter() - start)
+    connection.close()
+
+    suggestions = advisor.suggest()
+    for suggestion in suggestions:
+        print(suggestion.describe())
+        print("  " + suggestion.ddl())
+    report = advisor.apply(suggestions, repeat=args.repeat)
+    for line in format_report(report):
+        print(line)
+    served = {result["sql"] for result in report}
+    for sql_query in WORKLOAD:
+        if sql_query not in served:
+            print(f"not served by any suggestion: {sql_query}")
+    advisor.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--replay", type=int, default=3, help="times the workload is replayed before advising")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--max-indexes", type=int, default=5)
+    parser.add_argument("--workdir", default=None, help="where to write the synthetic database (default: a temp dir)")
+    main(parser.parse_args())
@@ -0,0 +1,100 @@
+"""
+Benchmark: CSV ingestion into SQLite with ingest.py.
+
+Writes a synthetic multi-million-row CSV shaped like ai4i2020.csv, loads it into
+a fresh database, appends a second batch incrementally by UDI, re-runs the same
+append (every row is skipped) and reports rows/second for each step. A baseline
+resembling the notebook's pandas to_sql (Python-side type conversion, default
+pragmas, one executemany) is timed on the first --baseline-rows rows.
+
+    python benchmarks/bench_ingest.py --rows 5000000
+"""
+import argparse
+import csv
+import os
+import random
+import sqlite3
+import tempfile
+import time
+
+import common  # noqa: F401  (puts the app directory on sys.path)
+from config import BASE_DIR
+from ingest import ingest_csv
+
+SOURCE_CSV = os.path.join(BASE_DIR, '../data/ai4i2020.csv')
+
+
+def write_synthetic_csv(path, rows, first_udi=1):
+    """Replicate the source CSV with jittered sensor values and continuing UDIs."""
+    with open(SOURCE_CSV, newline="", encoding="utf-8-sig") as f:
+        reader = csv.reader(f)
+        header = next(reader)
+        source = list(reader)
+    rng = random.Random(first_udi)
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(header)
+        for i in range(rows):
+            row = list(source[i % len(source)])
+            row[0] = str(first_udi + i)
+            row[3] = f"{float(row[3]) + rng.randint(-5, 5) / 10:.1f}"
+            row[6] = f"{max(float(row[6]) + rng.randint(-10, 10) / 10, 0.1):.1f}"
+            writer.writerow(row)
+    return path
+
+
+def baseline(csv_path, db_path, rows):
+    """Roughly what pandas.read_csv + to_sql does: convert in Python, default pragmas, one transaction."""
+    if os.path.exists(db_path):
+        os.remove(db_path)
+    start = time.perf_counter()
+    with open(csv_path, newline="", encoding="utf-8") as f:
+        reader = csv.reader(f)
+        header = next(reader)
+        data = []
+        for i, row in enumerate(reader):
+            if i >= rows:
+                break
+            data.append([int(row[0]), row[1], row[2], float(row[3]), float(row[4]), int(row[5]), float(row[6]),
+                         *(int(value) for value in row[7:])])
+    connection = sqlite3.connect(db_path)
+    columns = ", ".join(f'"{name}"' for name in header)
+    connection.execute(f'CREATE TABLE "Machinelogs" ({columns})')
+    connection.executemany(f'INSERT INTO "Machinelogs" VALUES ({", ".join("?" * len(header))})', data)
+    connection.commit()
+    connection.close()
+    return len(data) / (time.perf_counter() - start)
+
+
+def main(args):
+    workdir = args.workdir or tempfile.mkdtemp(prefix="ingest-bench-")
+    first_csv = os.path.join(workdir, "batch1.csv")
+    second_csv = os.path.join(workdir, "batch2.csv")
+    db_path = os.path.join(workdir, "ingest.db")
+    start = time.perf_counter()
+    write_synthetic_csv(first_csv, args.rows)
+    write_synthetic_csv(second_csv, args.append_rows, first_udi=args.rows + 1)
+    print(f"synthetic CSVs: {args.rows} + {args.append_rows} rows in {time.perf_counter() - start:.1f}s")
+
+    rate = baseline(first_csv, os.path.join(workdir, "baseline.db"), args.baseline_rows)
+    print(f"{'baseline (to_sql-like)':<28} {args.baseline_rows:>9} rows  {rate:10.0f} rows/s")
+
+    steps = [("fresh load", first_csv), ("incremental append", second_csv), ("repeated append (skips)", second_csv)]
+    for label, csv_path in steps:
+        stats = ingest_csv(csv_path, db_path)
+        print(f"{label:<28} {stats['rows_inserted']:>9} rows  {stats['rows_per_s']:10.0f} rows/s  "
+              f"load={stats['load_s']:6.2f}s  indexes={stats['index_s']:5.2f}s  skipped={stats['rows_skipped']}")
+
+    connection = sqlite3.connect(db_path)
+    total = connection.execute('SELECT COUNT(*), COUNT(DISTINCT "UDI") FROM "Machinelogs"').fetchone()
+    connection.close()
+    print(f"table rows={total[0]} distinct UDI={total[1]} (expected {args.rows + args.append_rows})")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=2000000)
+    parser.add_argument("--append-rows", type=int, default=500000)
+    parser.add_argument("--baseline-rows", type=int, default=500000)
+    parser.add_argument("--workdir", default=None, help="where to write the CSVs and databases (default: a temp dir)")
+    main(parser.parse_args())
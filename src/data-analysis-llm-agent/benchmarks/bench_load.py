@@ -0,0 +1,216 @@
+"""
+End-to-end load benchmark: concurrent chat sessions through the ChatBot loop.
+
+Every session creates a ChatBot and sends --turns questions (seeded, so runs
+are repeatable). Each turn is driven the way app.on_message drives it:
+completion, tool calls (query_db against the real database, plot_chart), and
+follow-up completions until the model stops calling tools. Charts are
+serialized as cl.Plotly would. The model is fake_groq's scripted model, served
+either over HTTP by fake_groq_server.py in a subprocess and reached through
+the real Groq client (--client http, needs the groq package) or in-process
+(--client inproc).
+
+Reported: throughput, p50/p95/p99 turn latency and time to first token,
+per-stage latency from the metrics registry, and, in a second pass under
+tracemalloc, memory retained per session. In http mode with hundreds of
+sessions, time to first token grows well past --ttft-ms because the client
+side saturates one core (httpx connection pool bookkeeping and pydantic
+parsing of every stream chunk): that is the per-worker ceiling this benchmark
+is meant to expose, compare with --client inproc to separate it from the agent
+loop itself.
+
+    python benchmarks/bench_load.py --sessions 200 --turns 3 --ttft-ms 400
+"""
+import argparse
+import asyncio
+import gc
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import common
+from common import percentile, report
+from fake_groq import FakeGroq, QUESTION_SQL
+import bot
+from bot import ChatBot, message_to_dict
+from metrics import STAGE_SECONDS, TURN_ITERATIONS
+from tools import is_figure, plot_chart, run_query, tools_schema
+from tracing import setup_logging, trace
+
+# Same bound as app.MAX_ITER (app.py needs chainlit to import)
+MAX_ITER = 5
+SYSTEM = "You are a data analysis assistant for the Machinelogs table. Use query_db and plot_chart."
+QUESTIONS = list(QUESTION_SQL)
+
+
+async def run_turn(chat_bot, question, on_token=None):
+    """One user turn as app.on_message drives it; returns the number of tool rounds."""
+    response_message = await chat_bot(question, on_token=on_token)
+    cur_iter = 0
+    tool_calls = response_message.tool_calls
+    while cur_iter <= MAX_ITER:
+        if not tool_calls:
+            break
+        chat_bot.messages.append(message_to_dict(response_message))
+        response_message, function_responses = await chat_bot.call_functions(tool_calls, on_token=on_token)
+        tool_calls = response_message.tool_calls
+        for function_res in function_responses:
+            if function_res["name"] in chat_bot.exclude_functions and is_figure(function_res["content"]):
+                # cl.Plotly sends the figure JSON to the browser
+                function_res["content"].to_json()
+        cur_iter += 1
+    TURN_ITERATIONS.observe(cur_iter)
+    return cur_iter
+
+
+async def session(index, args, latencies, bots):
+    rng = random.Random(args.seed + index)
+    await asyncio.sleep(args.ramp_s * index / max(args.sessions, 1))
+    chat_bot = ChatBot(SYSTEM, tools_schema, {"query_db": run_query, "plot_chart": plot_chart})
+    bots.append(chat_bot)
+    tokens = 0
+
+    async def on_token(text):
+        nonlocal tokens
+        tokens += 1
+
+    for _ in range(args.turns):
+        question = rng.choice(QUESTIONS)
+        start = time.perf_counter()
+        with trace("turn", session=index):
+            await run_turn(chat_bot, question, on_token)
+        latencies.append(time.perf_counter() - start)
+        if args.think_ms:
+            await asyncio.sleep(rng.uniform(0, 2 * args.think_ms) / 1000)
+
+
+async def run_sessions(args, sessions):
+    latencies = []
+    bots = []
+    start = time.perf_counter()
+    await asyncio.gather(*(session(i, args, latencies, bots) for i in range(sessions)))
+    return latencies, bots, time.perf_counter() - start
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_client(args):
+    """Configure bot's client; returns (description, server process or None, in-process fake or None)."""
+    if args.client == "inproc":
+        fake = FakeGroq(ttft_s=args.ttft_ms / 1000, token_s=args.token_ms / 1000)
+        bot._client = fake
+        return "in-process fake", None, fake
+
+    port = free_port()
+    server = subprocess.Popen(
+        [sys.executable, os.path.join(common.APP_DIR, "benchmarks", "fake_groq_server.py"),
+         "--port", str(port), "--ttft-ms", str(args.ttft_ms), "--token-ms", str(args.token_ms)],
+        stdout=subprocess.DEVNULL,
+    )
+    deadline = time.monotonic() + 10
+    while True:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.2).close()
+            break
+        except OSError:
+            if time.monotonic() > deadline or server.poll() is not None:
+                server.kill()
+                raise SystemExit("fake Groq server did not start")
+            time.sleep(0.05)
+    os.environ["GROQ_BASE_URL"] = f"http://127.0.0.1:{port}"
+    os.environ.setdefault("Groq_API_KEY", "fake")
+    bot._client = None
+    return f"fake Groq server on port {port} via the groq client", server, None
+
+
+async def main(args):
+    # Log through the app's queue handler, to a scratch file unless LOG_PATH is set
+    os.environ.setdefault("LOG_PATH", os.path.join(tempfile.mkdtemp(prefix="load-bench-"), "chatbot.log"))
+    setup_logging()
+    description, server, fake = start_client(args)
+    print(f"{args.sessions} sessions x {args.turns} turns, model {description}, "
+          f"ttft {args.ttft_ms:g}ms, {args.token_ms:g}ms/token")
+    try:
+        # Warm up imports, pools and plotly outside the measurement
+        await run_sessions(argparse.Namespace(**{**vars(args), "turns": 1, "ramp_s": 0}), 2)
+        STAGE_SECONDS._values.clear()
+        TURN_ITERATIONS._values.clear()
+
+        latencies, bots, wall_s = await run_sessions(args, args.sessions)
+        report("turn latency", latencies, wall_s)
+        ttfts = [ttft for chat_bot in bots for ttft in chat_bot.ttft_s]
+        if ttfts:
+            report("time to first token", ttfts)
+        if fake is not None:
+            print(f"upstream calls: {fake.calls} (max concurrent {fake.max_active})")
+
+        print("stage                        count      p50       p95       p99   (bucket interpolated)")
+        stages = STAGE_SECONDS.snapshot()
+        for labels, summary in sorted(stages.items(), key=lambda item: -item[1]["sum"]):
+            print(f"{labels:<28} {summary['count']:>6} {summary['p50'] * 1000:8.1f}ms {summary['p95'] * 1000:8.1f}ms "
+                  f"{summary['p99'] * 1000:8.1f}ms")
+        del bots
+        gc.collect()
+
+        # Memory retained per session (bots stay alive, as they do in cl.user_session)
+        memory_sessions = min(args.sessions, args.memory_sessions)
+        tracemalloc.start()
+        baseline = tracemalloc.get_traced_memory()[0]
+        _, memory_bots, _ = await run_sessions(argparse.Namespace(**{**vars(args), "ramp_s": 0}), memory_sessions)
+        gc.collect()
+        retained = tracemalloc.get_traced_memory()[0] - baseline
+        tracemalloc.stop()
+        per_session = retained / max(len(memory_bots), 1)
+        print(f"memory per session after {args.turns} turns: {per_session / 1024:.1f}KB ({memory_sessions} sessions)")
+
+        if args.json_out:
+            with open(args.json_out, "w") as f:
+                json.dump({
+                    "args": vars(args),
+                    "turns": len(latencies),
+                    "wall_s": wall_s,
+                    "throughput_turns_per_s": len(latencies) / wall_s,
+                    "turn_p50_s": percentile(latencies, 50),
+                    "turn_p95_s": percentile(latencies, 95),
+                    "turn_p99_s": percentile(latencies, 99),
+                    "ttft_p50_s": percentile(ttfts, 50),
+                    "memory_per_session_bytes": per_session,
+                    "stages": stages,
+                }, f, indent=1)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=200)
+    parser.add_argument("--turns", type=int, default=3)
+    parser.add_argument("--ttft-ms", type=float, default=400)
+    parser.add_argument("--token-ms", type=float, default=10)
+    parser.add_argument("--think-ms", type=float, default=0, help="mean pause between a session's turns")
+    parser.add_argument("--ramp-s", type=float, default=1.0, help="sessions start spread over this many seconds")
+    parser.add_argument("--client", choices=["http", "inproc"], default=None,
+                        help="default: http when the groq package is installed, else inproc")
+    parser.add_argument("--memory-sessions", type=int, default=100, help="sessions in the tracemalloc pass")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json-out", default=None, help="also write the results as JSON, for comparing runs")
+    args = parser.parse_args()
+    if args.client is None:
+        try:
+            import groq  # noqa: F401
+            args.client = "http"
+        except ImportError:
+            args.client = "inproc"
+    asyncio.run(main(args))
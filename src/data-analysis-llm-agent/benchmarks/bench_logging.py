@@ -0,0 +1,87 @@
+"""
+Benchmark: cost of a log call on the calling thread, and of a span.
+
+Compares the old setup (basicConfig file handler plus a second FileHandler on
+the same file, formatted and written on the caller's thread) with the queue
+based JSON logging of tracing.setup_logging, where the caller only enqueues
+the record. --slow-write-ms simulates a slow disk (or a network mount) by
+delaying every flush. Also times an empty span with and without span export
+to a file.
+
+    python benchmarks/bench_logging.py --records 2000 --slow-write-ms 1
+"""
+import argparse
+import logging
+import os
+import tempfile
+import time
+
+import common  # noqa: F401  (puts the app directory on sys.path)
+from common import report
+import tracing
+
+
+def time_records(records, message):
+    timings = []
+    for i in range(records):
+        start = time.perf_counter()
+        logging.info(f"{message} {i}")
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def reset_root():
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+        handler.close()
+
+
+def main(args):
+    workdir = tempfile.mkdtemp(prefix="logging-bench-")
+    if args.slow_write_ms:
+        flush = logging.StreamHandler.flush
+
+        def slow_flush(handler):
+            time.sleep(args.slow_write_ms / 1000)
+            flush(handler)
+
+        logging.StreamHandler.flush = slow_flush
+    message = "Tool Call: " + "x" * args.message_bytes
+
+    reset_root()
+    path = os.path.join(workdir, "direct.log")
+    logging.basicConfig(filename=path, level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    logging.getLogger().addHandler(logging.FileHandler(path))
+    start = time.perf_counter()
+    timings = time_records(args.records, message)
+    report("direct file handlers x2", timings, time.perf_counter() - start)
+
+    reset_root()
+    os.environ["LOG_PATH"] = os.path.join(workdir, "queued.log")
+    tracing.setup_logging()
+    start = time.perf_counter()
+    with tracing.trace("bench"):
+        timings = time_records(args.records, message)
+    report("queue + json", timings, time.perf_counter() - start)
+    tracing.shutdown_logging()
+
+    for export in ("", os.path.join(workdir, "spans.jsonl")):
+        os.environ["TRACE_EXPORT"] = export
+        tracing._exporter_checked = False
+        timings = []
+        with tracing.trace("bench"):
+            for _ in range(args.records):
+                start = time.perf_counter()
+                with tracing.span("stage", rows=1):
+                    pass
+                timings.append(time.perf_counter() - start)
+        report(f"span{' + file export' if export else ''}", timings)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--records", type=int, default=20000)
+    parser.add_argument("--message-bytes", type=int, default=200)
+    parser.add_argument("--slow-write-ms", type=float, default=0, help="simulated delay per log file flush")
+    main(parser.parse_args())
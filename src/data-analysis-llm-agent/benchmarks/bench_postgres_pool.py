@@ -0,0 +1,74 @@
+"""
+Benchmark for the Postgres backend: connect-per-call vs the PostgresPool.
+
+By default runs against fake_postgres (simulated handshake/round trip latency over
+the SQLite file). Pass --real to use asyncpg with the DB_* environment variables.
+
+    python benchmarks/bench_postgres_pool.py --sessions 50 --queries 10
+"""
+import argparse
+import asyncio
+import time
+
+import common  # noqa: F401  (puts the app directory on sys.path)
+from common import report
+from config import sqlite_db_path
+from fake_postgres import fake_connect_factory
+from pg_pool import PostgresPool, asyncpg_connect, postgres_settings
+
+QUERIES = [
+    'SELECT "Type", COUNT(*) FROM Machinelogs GROUP BY "Type"',
+    'SELECT AVG("Torque [Nm]") FROM Machinelogs WHERE "Machine failure" = 1',
+    'SELECT "Product ID", "Air temperature [K]" FROM Machinelogs ORDER BY "UDI" DESC LIMIT 5',
+]
+
+
+async def run_sessions(fetch, sessions, queries_per_session):
+    latencies = []
+
+    async def session(session_id):
+        for i in range(queries_per_session):
+            start = time.perf_counter()
+            await fetch(QUERIES[(session_id + i) % len(QUERIES)])
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(session(s) for s in range(sessions)))
+    return latencies, time.perf_counter() - start
+
+
+async def main(args):
+    if args.real:
+        settings = postgres_settings()
+        connect = lambda: asyncpg_connect(**settings)
+    else:
+        connect = fake_connect_factory(sqlite_db_path(), handshake_s=args.handshake_ms / 1000.0)
+
+    # Connect-per-call uses a throwaway single-connection pool, i.e. a fresh handshake per query
+    async def connect_per_call(sql_query):
+        pool = PostgresPool(connect=connect, min_size=0, max_size=1)
+        try:
+            return await pool.fetch(sql_query)
+        finally:
+            await pool.close()
+
+    latencies, wall = await run_sessions(connect_per_call, args.sessions, args.queries)
+    report("connect-per-call", latencies, wall)
+
+    pool = await PostgresPool(connect=connect, min_size=args.min_size, max_size=args.max_size).open()
+    try:
+        latencies, wall = await run_sessions(pool.fetch, args.sessions, args.queries)
+        report(f"pool(max={args.max_size})", latencies, wall)
+    finally:
+        await pool.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--real", action="store_true", help="use asyncpg with DB_* settings instead of the fake")
+    parser.add_argument("--sessions", type=int, default=50)
+    parser.add_argument("--queries", type=int, default=10)
+    parser.add_argument("--min-size", type=int, default=2)
+    parser.add_argument("--max-size", type=int, default=10)
+    parser.add_argument("--handshake-ms", type=float, default=20.0, help="simulated connect cost for the fake")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,133 @@
+"""
+Benchmark: compact tool-result encoding (result_encoding.py) against str() of each result.
+
+Per result: query_db results of typical questions against the real database
+and plot_chart figures, each as the model received it before (markdown, the
+repr of the figure) and as encoded now. Sizes are in characters and in
+estimated prompt tokens (memory.count_tokens).
+
+Per turn: --sessions chat sessions each ask the fake model's questions (counts,
+breakdowns, a 300-row listing, a bar and a line chart) in --turns turns, once
+with TOOL_RESULT_ENCODING=raw and once compact. The fake model's time to first
+token grows by --prefill-ms-per-1k for every 1000 prompt tokens, standing in
+for prefill on a real model. Reported: turn latency, prompt tokens per
+completion and tool rounds per turn (which must match between the two runs).
+
+    python benchmarks/bench_result_encoding.py --sessions 20 --turns 6 --prefill-ms-per-1k 100
+"""
+import argparse
+import asyncio
+import os
+import random
+import time
+
+import common  # noqa: F401  (puts the app directory on sys.path)
+from common import report
+import fake_groq
+from bench_load import SYSTEM, run_turn
+import bot
+from bot import ChatBot
+from memory import count_tokens
+from metrics import TOOL_RESULT_CHARS, TURN_ITERATIONS
+from result_encoding import encode_tool_results
+from tools import build_chart, plot_chart, read_result, run_query, tools_schema
+
+SAMPLE_QUERIES = {
+    "count": 'SELECT COUNT(*) FROM Machinelogs WHERE "Machine failure" = 1',
+    "failure rate by type": ('SELECT Type, COUNT(*) AS machines, AVG("Machine failure") AS failure_rate, '
+                             'AVG("Torque [Nm]") AS torque FROM Machinelogs GROUP BY Type'),
+    "sensors by tool wear bin": ('SELECT "Tool wear [min]" / 10 * 10 AS wear, AVG("Air temperature [K]") AS air, '
+                                 'AVG("Process temperature [K]") AS process, AVG("Rotational speed [rpm]") AS speed, '
+                                 'AVG("Torque [Nm]") AS torque FROM Machinelogs GROUP BY wear'),
+    "300-row listing": ('SELECT UDI, "Product ID", Type, "Air temperature [K]", "Torque [Nm]", "Tool wear [min]" '
+                        'FROM Machinelogs LIMIT 300'),
+}
+LISTING_QUESTION = "list torque and tool wear of 300 machines"
+
+
+def sample_charts(rng):
+    return {
+        "bar chart, 3 bars": build_chart(["H", "L", "M"], [21, 235, 83], "Failures by type", "Type", "Failures", "bar"),
+        "line chart, 50 points": build_chart(list(range(50)), [rng.uniform(20, 60) for _ in range(50)],
+                                             "Torque", "UDI", "Torque [Nm]", "line"),
+        "line chart, 10000 points": build_chart(list(range(10000)), [rng.uniform(20, 60) for _ in range(10000)],
+                                                "Torque", "UDI", "Torque [Nm]", "line"),
+    }
+
+
+def print_size(label, raw, encoded):
+    print(f"{label:<28} raw {len(raw):>7} chars {count_tokens(raw):>6} tokens   "
+          f"encoded {len(encoded):>6} chars {count_tokens(encoded):>5} tokens   "
+          f"{count_tokens(raw) / max(count_tokens(encoded), 1):5.1f}x")
+
+
+async def per_result(args):
+    rng = random.Random(args.seed)
+    results = {label: ("query_db", await run_query(sql)) for label, sql in SAMPLE_QUERIES.items()}
+    results.update({label: ("plot_chart", figure) for label, figure in sample_charts(rng).items()})
+    for label, (name, content) in results.items():
+        encoded = encode_tool_results([{"tool_call_id": "call_1", "role": "tool", "name": name, "content": content}])
+        print_size(label, str(content), encoded[0]["content"])
+        if label == "300-row listing":
+            handle = encoded[0]["content"].split('read_result("')[1].split('"')[0]
+            page = await read_result(handle, 20, 30)
+            print(f"{'':<28} read_result({handle}, 20, 30): {len(page)} chars {count_tokens(page)} tokens")
+
+
+async def session(index, args, latencies):
+    rng = random.Random(args.seed + index)
+    await asyncio.sleep(args.ramp_s * index / max(args.sessions, 1))
+    chat_bot = ChatBot(SYSTEM, tools_schema, {"query_db": run_query, "plot_chart": plot_chart, "read_result": read_result})
+    questions = list(fake_groq.QUESTION_SQL)
+    for turn in range(args.turns):
+        question = questions[turn % len(questions)] if turn < len(questions) else rng.choice(questions)
+        start = time.perf_counter()
+        await run_turn(chat_bot, question)
+        latencies.append(time.perf_counter() - start)
+
+
+async def per_turn(args, encoding):
+    os.environ["TOOL_RESULT_ENCODING"] = encoding
+    client = fake_groq.FakeGroq(ttft_s=args.ttft_ms / 1000, token_s=args.token_ms / 1000,
+                                prefill_s_per_1k=args.prefill_ms_per_1k / 1000)
+    bot._client = client
+    TURN_ITERATIONS._values.clear()
+    TOOL_RESULT_CHARS._values.clear()
+    latencies = []
+    start = time.perf_counter()
+    await asyncio.gather(*(session(i, args, latencies) for i in range(args.sessions)))
+    report(f"turn, {encoding}", latencies, time.perf_counter() - start)
+    rounds = TURN_ITERATIONS.snapshot().get("", {})
+    chars = TOOL_RESULT_CHARS.snapshot()
+    print(f"{'':<28} {client.calls} completions, {client.prompt_tokens / max(client.calls, 1):.0f} prompt tokens each, "
+          f"{rounds.get('sum', 0) / max(rounds.get('count', 1), 1):.2f} tool rounds per turn"
+          + (f", text results {chars.get('raw', 0):.0f} -> {chars.get('encoded', 0):.0f} chars" if encoding != "raw" else ""))
+    return latencies, client.prompt_tokens / max(client.calls, 1)
+
+
+async def main(args):
+    print("per result")
+    await per_result(args)
+    # Warm up the database, plotly and the result cache outside the measurement
+    await per_turn(argparse.Namespace(**{**vars(args), "sessions": 1, "turns": 1, "ramp_s": 0}), "raw")
+    print(f"\nper turn: {args.sessions} sessions x {args.turns} turns, ttft {args.ttft_ms:g}ms "
+          f"+ {args.prefill_ms_per_1k:g}ms per 1k prompt tokens")
+    raw, raw_tokens = await per_turn(args, "raw")
+    compact, compact_tokens = await per_turn(args, "compact")
+    print(f"prompt tokens per completion {raw_tokens:.0f} -> {compact_tokens:.0f} "
+          f"({1 - compact_tokens / max(raw_tokens, 1):.0%} fewer), mean turn "
+          f"{sum(raw) / len(raw) * 1000:.0f}ms -> {sum(compact) / len(compact) * 1000:.0f}ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=20)
+    parser.add_argument("--turns", type=int, default=6)
+    parser.add_argument("--ttft-ms", type=float, default=300)
+    parser.add_argument("--token-ms", type=float, default=5)
+    parser.add_argument("--prefill-ms-per-1k", type=float, default=100)
+    parser.add_argument("--ramp-s", type=float, default=2.0, help="sessions start spread over this many seconds")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    fake_groq.QUESTION_SQL[LISTING_QUESTION] = SAMPLE_QUERIES["300-row listing"]
+    asyncio.run(main(args))
@@ -0,0 +1,111 @@
+"""
+Benchmark: failure analytics queries against the raw table vs the precomputed rollups.
+
+Builds a synthetic copy of ai4i2020 with --rows rows (10M takes a few minutes and
+~1GB of disk), builds the rollups, checks each routed query returns the same
+result and reports per-query latency both ways. With --check the run fails if
+a routed query disagrees with the source table; shapes that only look like
+bins (float divisors, a sensor on the right of * or / or after ||) must not be
+routed, and aliases named like rollup columns must still mean the SELECT item.
+
+    python benchmarks/bench_rollups.py --rows 10000000
+    python benchmarks/bench_rollups.py --rows 100000 --repeat 1 --check
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+import common  # noqa: F401  (puts the app directory on sys.path)
+from common import build_synthetic_db, percentile
+from rollups import RollupStore, rewrite_to_rollup
+
+QUERIES = [
+    'SELECT Type, COUNT(*) AS machines, SUM("Machine failure") AS failures, ROUND(AVG("Machine failure") * 100, 2) AS failure_rate FROM Machinelogs GROUP BY Type ORDER BY failure_rate DESC',
+    'SELECT SUM(TWF) AS twf, SUM(HDF) AS hdf, SUM(PWF) AS pwf, SUM(OSF) AS osf, SUM(RNF) AS rnf FROM Machinelogs',
+    'SELECT Type, SUM(TWF), SUM(HDF), SUM(PWF), SUM(OSF), SUM(RNF) FROM Machinelogs GROUP BY Type',
+    'SELECT CAST("Tool wear [min]" / 50 AS INTEGER) * 50 AS tool_wear, COUNT(*), AVG("Machine failure") FROM Machinelogs GROUP BY 1 ORDER BY 1',
+    'SELECT CAST("Torque [Nm]" / 10 AS INTEGER) * 10 AS torque, SUM(OSF) FROM Machinelogs GROUP BY 1 ORDER BY 1',
+    'SELECT CAST("Process temperature [K]" AS INTEGER), AVG(HDF) FROM Machinelogs GROUP BY 1',
+    'SELECT Type, AVG("Torque [Nm]"), AVG("Rotational speed [rpm]") FROM Machinelogs WHERE "Machine failure" = 1 GROUP BY Type',
+    'SELECT "Tool wear [min]" / 10 AS wear, COUNT(*) FROM Machinelogs GROUP BY 1 ORDER BY 1',
+    'SELECT "Tool wear [min]" / 20 * 20 AS wear, SUM("Machine failure") FROM Machinelogs GROUP BY 1 ORDER BY 1',
+    'SELECT "Rotational speed [rpm]" / 100 AS speed, AVG("Machine failure") FROM Machinelogs GROUP BY speed ORDER BY speed',
+    # Aliases named like rollup columns (tool_wear_bin, n) must not bind to them
+    'SELECT "Tool wear [min]" / 50 AS tool_wear_bin, SUM("Machine failure") AS failures FROM Machinelogs GROUP BY tool_wear_bin',
+    'SELECT Type AS n, COUNT(*) AS sum_torque FROM Machinelogs GROUP BY n ORDER BY sum_torque DESC',
+    'SELECT "Tool wear [min]" / 20 AS max_tool_wear, MAX("Tool wear [min]") AS n FROM Machinelogs GROUP BY max_tool_wear ORDER BY n',
+    'SELECT NOT TWF, COUNT(*) FROM Machinelogs GROUP BY 1',
+    # Not bins: a float divisor keeps the fraction, and here the product is divided, not the column
+    'SELECT "Rotational speed [rpm]" / 100.0 AS speed, COUNT(*) FROM Machinelogs GROUP BY 1 ORDER BY 1',
+    'SELECT 2 * "Tool wear [min]" / 10 AS wear, COUNT(*) FROM Machinelogs GROUP BY 1 ORDER BY 1',
+    'SELECT 1.0 * "Rotational speed [rpm]" / 100 AS speed, COUNT(*) FROM Machinelogs GROUP BY 1 ORDER BY 1',
+    # || binds tighter than /, so the concatenation is divided
+    'SELECT \'x\' || "Tool wear [min]" / 10 AS w, COUNT(*) FROM Machinelogs GROUP BY 1',
+]
+
+
+def timed(connection, sql_query, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        rows = connection.execute(sql_query).fetchall()
+        timings.append(time.perf_counter() - start)
+    return rows, timings
+
+
+def same(a, b):
+    return len(a) == len(b) and all(
+        all(x == y or isinstance(x, float) and abs(x - y) <= 1e-6 * max(1.0, abs(x)) for x, y in zip(ra, rb))
+        for ra, rb in zip(a, b)
+    )
+
+
+def main(args):
+    workdir = args.workdir or tempfile.mkdtemp(prefix="rollup-bench-")
+    db_path = os.path.join(workdir, "synthetic.db")
+    start = time.perf_counter()
+    build_synthetic_db(db_path, args.rows)
+    print(f"synthetic table: {args.rows} rows in {time.perf_counter() - start:.1f}s")
+
+    store = RollupStore(db_path)
+    start = time.perf_counter()
+    store.build()
+    print(f"rollups built in {time.perf_counter() - start:.1f}s")
+
+    source = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    rollup = sqlite3.connect(f"file:{store.rollup_path}?mode=ro", uri=True)
+    mismatches = 0
+    for sql_query in QUERIES:
+        routed = rewrite_to_rollup(sql_query)
+        if routed is None:
+            print(f"NOT ROUTED  {sql_query[:70]}")
+            continue
+        table, rollup_query = routed
+        rows, raw = timed(source, sql_query, args.repeat)
+        try:
+            rollup_rows, fast = timed(rollup, rollup_query, args.repeat)
+        except sqlite3.Error as e:
+            print(f"ERROR    {e}  {rollup_query}")
+            mismatches += 1
+            continue
+        status = "ok" if same(rows, rollup_rows) else "MISMATCH"
+        mismatches += status == "MISMATCH"
+        print(f"{status:<8} raw p50={percentile(raw, 50) * 1000:9.2f}ms  {table:<24} p50={percentile(fast, 50) * 1000:8.2f}ms  "
+              f"speedup={percentile(raw, 50) / max(percentile(fast, 50), 1e-9):8.1f}x  {sql_query[:60]}")
+    source.close()
+    rollup.close()
+    return mismatches
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--workdir", default=None, help="where to write the synthetic database (default: a temp dir)")
+    parser.add_argument("--check", action="store_true", help="exit 1 if a routed query returns a different result")
+    args = parser.parse_args()
+    if main(args) and args.check:
+        sys.exit(1)
@@ -0,0 +1,139 @@
+"""
+Benchmark: externalized session state across several app workers.
+
+--workers SessionManagers (one per simulated worker, each with its own local
+LRU of ChatBots) share one store: a SQLite file (--store sqlite) or the
+Redis stand-in (--store local). --sessions sessions take --turns turns each,
+every turn routed to a worker by a load balancer that is sticky (same worker
+while it is up) or random. Each turn loads the session, runs it through the
+ChatBot loop against the in-process fake model and saves it, as app.py does.
+
+Reported: turn latency with and without the store, session.load and
+session.save latency, where sessions came from (local, store, new), stored
+state size against the plain JSON of the conversation, and a check that every
+session resumed with its whole history.
+
+    python benchmarks/bench_sessions.py --workers 4 --sessions 100 --turns 5 --routing random
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import tempfile
+import time
+
+import common  # noqa: F401  (puts the app directory on sys.path)
+from common import report
+from bench_load import QUESTIONS, SYSTEM, run_turn
+from fake_groq import FakeGroq
+import bot
+from bot import ChatBot
+from metrics import STAGE_SECONDS
+from session_store import LocalRedis, RedisSessionStore, SessionManager, SQLiteSessionStore
+from tools import plot_chart, run_query, tools_schema
+
+
+async def new_bot():
+    return ChatBot(SYSTEM, tools_schema, {"query_db": run_query, "plot_chart": plot_chart})
+
+
+def route(args, rng, session_index, turn):
+    if args.routing == "sticky":
+        return session_index % args.workers
+    return rng.randrange(args.workers)
+
+
+async def session(index, args, managers, latencies, final_bots):
+    rng = random.Random(args.seed + index)
+    session_id = f"session-{index}"
+    local_bot = None
+    for turn in range(args.turns):
+        question = rng.choice(QUESTIONS)
+        start = time.perf_counter()
+        if managers is None:
+            local_bot = local_bot or await new_bot()
+            await run_turn(local_bot, question)
+        else:
+            manager = managers[route(args, rng, index, turn)]
+            chat_bot = await manager.get(session_id, new_bot)
+            await run_turn(chat_bot, question)
+            await manager.save(session_id, chat_bot)
+            local_bot = chat_bot
+        latencies.append(time.perf_counter() - start)
+    final_bots[session_id] = local_bot
+
+
+async def run(args, managers):
+    latencies = []
+    final_bots = {}
+    start = time.perf_counter()
+    await asyncio.gather(*(session(i, args, managers, latencies, final_bots) for i in range(args.sessions)))
+    return latencies, final_bots, time.perf_counter() - start
+
+
+def make_store(args, directory):
+    if args.store == "sqlite":
+        return SQLiteSessionStore(os.path.join(directory, "sessions.db"))
+    return RedisSessionStore(LocalRedis())
+
+
+async def main(args):
+    bot._client = FakeGroq(ttft_s=args.ttft_ms / 1000, token_s=args.token_ms / 1000)
+    print(f"{args.sessions} sessions x {args.turns} turns, {args.workers} workers, "
+          f"{args.routing} routing, {args.store} store")
+
+    # Warm up imports, plotly and the database outside the measurement
+    await run(argparse.Namespace(**{**vars(args), "sessions": 2, "turns": 1}), None)
+    baseline, _, baseline_wall = await run(args, None)
+    report("turn, in-process sessions", baseline, baseline_wall)
+
+    directory = tempfile.mkdtemp(prefix="session-bench-")
+    store = make_store(args, directory)
+    managers = [SessionManager(store) for _ in range(args.workers)]
+    STAGE_SECONDS._values.clear()
+    latencies, final_bots, wall_s = await run(args, managers)
+    report(f"turn, {args.store} store", latencies, wall_s)
+
+    stages = STAGE_SECONDS.snapshot()
+    for stage in ("session.load", "session.save"):
+        summary = stages.get(f"{stage},ok")
+        if summary:
+            print(f"{stage:<28} n={summary['count']:<6} p50={summary['p50'] * 1000:8.2f}ms "
+                  f"p95={summary['p95'] * 1000:8.2f}ms  (bucket interpolated)")
+
+    loads = {"local": 0, "store": 0, "new": 0}
+    saves = saved_bytes = 0
+    for manager in managers:
+        stats = manager.stats()
+        for source, count in stats["loads"].items():
+            loads[source] += count
+        saves += manager.saves
+        saved_bytes += manager.saved_bytes
+    print(f"session loads: {loads['local']} held by the worker, {loads['store']} rehydrated, {loads['new']} new")
+
+    # The same conversations as plain JSON, system prompt included
+    plain = [len(json.dumps(chat_bot.messages)) for chat_bot in final_bots.values()]
+    print(f"state per save: {saved_bytes / max(saves, 1) / 1024:.1f}KB stored, "
+          f"final conversations {sum(plain) / max(len(plain), 1) / 1024:.1f}KB as plain JSON")
+
+    # Every session must resume with its whole history, wherever its turns ran
+    resumed = 0
+    for session_id in final_bots:
+        chat_bot = await managers[0].get(session_id, new_bot)
+        if sum(message.get("role") == "user" for message in chat_bot.messages) == args.turns:
+            resumed += 1
+    print(f"sessions resumed with all {args.turns} turns: {resumed}/{len(final_bots)}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--sessions", type=int, default=100)
+    parser.add_argument("--turns", type=int, default=5)
+    parser.add_argument("--routing", choices=["sticky", "random"], default="random")
+    parser.add_argument("--store", choices=["sqlite", "local"], default="sqlite")
+    parser.add_argument("--ttft-ms", type=float, default=100)
+    parser.add_argument("--token-ms", type=float, default=2)
+    parser.add_argument("--seed", type=int, default=0)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,127 @@
+"""
+Benchmark: speculative prefetch of follow-up queries.
+
+Builds a synthetic copy of ai4i2020 with --rows rows. Each of --sessions chat
+sessions asks a lead question (failures by Type above a per-session tool wear
+threshold, so no two sessions share results), pauses --think-ms and asks a
+follow-up: the failure-mode breakdown or the failure rate for the same
+machines (both covered by the templates in speculation.py) or, in a third of
+sessions, the top products by torque, which speculation cannot predict. The
+model is the in-process fake; queries run against the real database with
+rollups off, so every query scans the table.
+
+The run is repeated with SPECULATION_ENABLED off and on, each time on an empty
+result cache. Reported: follow-up turn latency and query_db time, and how many
+prefetched results were used. Speculation spends idle database time: with
+more --sessions than the database has spare cores, prefetches compete with
+real queries and follow-ups get slower, which SPECULATION_MAX_BUSY limits.
+
+    python benchmarks/bench_speculation.py --rows 500000 --sessions 10 --ramp-s 20
+"""
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+
+import common  # noqa: F401  (puts the app directory on sys.path)
+from common import build_synthetic_db, report
+import fake_groq
+from bench_load import SYSTEM, run_turn
+import bot
+from bot import ChatBot
+from metrics import STAGE_SECONDS
+
+LEAD_SQL = ('SELECT Type, SUM("Machine failure") AS failures FROM Machinelogs '
+            'WHERE "Tool wear [min]" > {threshold} GROUP BY Type')
+# As a model might write them: same statements as the templates, different case and spacing
+FOLLOW_UPS = {
+    "failure modes by type": ('select Type, sum("TWF") as TWF, sum("HDF") as HDF, sum("PWF") as PWF, '
+                              'sum("OSF") as OSF, sum("RNF") as RNF\nfrom Machinelogs\n'
+                              'where "Tool wear [min]" > {threshold}\ngroup by Type'),
+    "failure rate by type": ('SELECT Type, COUNT(*) AS machines, SUM("Machine failure") AS failures, '
+                             'ROUND(AVG("Machine failure") * 100, 2) AS failure_rate_pct FROM Machinelogs '
+                             'WHERE "Tool wear [min]" > {threshold} GROUP BY Type'),
+    "top products by torque": ('SELECT "Product ID", MAX("Torque [Nm]") AS torque FROM Machinelogs '
+                               'WHERE "Tool wear [min]" > {threshold} GROUP BY "Product ID" ORDER BY 2 DESC LIMIT 5'),
+}
+
+
+def script(index, rng):
+    """(lead question, follow-up question) of a session, registered with the fake model."""
+    threshold = 20 + index
+    lead = f"failures by type for tool wear over {threshold}"
+    follow_up_kind = rng.choice(list(FOLLOW_UPS))
+    follow_up = f"{follow_up_kind} for tool wear over {threshold}"
+    fake_groq.QUESTION_SQL[lead] = LEAD_SQL.format(threshold=threshold)
+    fake_groq.QUESTION_SQL[follow_up] = FOLLOW_UPS[follow_up_kind].format(threshold=threshold)
+    return lead, follow_up
+
+
+async def session(index, args, follow_up_latencies):
+    rng = random.Random(args.seed + index)
+    lead, follow_up = script(index, rng)
+    await asyncio.sleep(args.ramp_s * index / max(args.sessions, 1))
+    chat_bot = ChatBot(SYSTEM, [], {"query_db": run_query})
+    await run_turn(chat_bot, lead)
+    await asyncio.sleep(rng.uniform(0.5, 1.5) * args.think_ms / 1000)
+    start = time.perf_counter()
+    await run_turn(chat_bot, follow_up)
+    follow_up_latencies.append(time.perf_counter() - start)
+
+
+async def run(args, enabled):
+    os.environ["SPECULATION_ENABLED"] = "1" if enabled else "0"
+    speculation._speculator = None
+    get_query_cache("sqlite").clear()
+    STAGE_SECONDS._values.clear()
+    latencies = []
+    start = time.perf_counter()
+    await asyncio.gather(*(session(i, args, latencies) for i in range(args.sessions)))
+    wall_s = time.perf_counter() - start
+    report(f"follow-up turn, {'on' if enabled else 'off'}", latencies, wall_s)
+    queries = STAGE_SECONDS.snapshot().get("tool.query_db,ok")
+    if queries:
+        print(f"{'':<28} query_db calls={queries['count']} mean={queries['sum'] / queries['count'] * 1000:.1f}ms")
+    speculator = speculation.get_speculator()
+    if speculator is not None:
+        # Let prefetches still running finish before reading the counters
+        await asyncio.gather(*speculator._tasks, return_exceptions=True)
+        stats = speculator.stats()
+        print(f"{'':<28} speculation: {stats['prefetched']} prefetched, {stats['used']} used "
+              f"({stats['use_rate']:.0%}), {stats['cached']} already cached, {stats['dropped']} dropped, "
+              f"{stats['busy']} busy, {stats['budget']} over budget, {stats['timeout']} timed out, saved {stats['saved_s']:.2f}s of queries")
+
+
+async def main(args):
+    bot._client = fake_groq.FakeGroq(ttft_s=args.ttft_ms / 1000, token_s=args.token_ms / 1000)
+    print(f"{args.rows} rows, {args.sessions} sessions, ttft {args.ttft_ms:g}ms, think {args.think_ms:g}ms")
+    await run(args, False)
+    await run(args, True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=500000)
+    parser.add_argument("--sessions", type=int, default=10)
+    parser.add_argument("--ttft-ms", type=float, default=400)
+    parser.add_argument("--token-ms", type=float, default=10)
+    parser.add_argument("--think-ms", type=float, default=1000, help="mean pause before the follow-up question")
+    parser.add_argument("--ramp-s", type=float, default=20.0, help="sessions start spread over this many seconds")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(prefix="speculation-bench-"), "machinelogs.db")
+    print(f"building {path}")
+    build_synthetic_db(path, args.rows)
+    os.environ["SQLITE_DB_PATH"] = path
+    os.environ["ROLLUPS_ENABLED"] = "0"
+    os.environ["INDEX_ADVISOR_ENABLED"] = "0"
+    os.environ.setdefault("SPECULATION_BUDGET_S", "60")
+    # Imported after the environment is set: the pool and caches read it on first use
+    import speculation
+    from query_cache import get_query_cache
+    from tools import run_query
+
+    asyncio.run(main(args))
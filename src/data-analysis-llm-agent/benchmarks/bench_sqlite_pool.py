@@ -0,0 +1,91 @@
+"""
+Load benchmark for run_sqlite_query: connect-per-call (old path) vs the shared pool.
+
+Simulates N concurrent chat sessions each issuing Q queries and reports p50/p99 query
+latency plus event loop lag, i.e. how long every other session is stalled.
+
+    python benchmarks/bench_sqlite_pool.py --sessions 50 --queries 10
+"""
+import argparse
+import asyncio
+import sqlite3
+import time
+
+import common  # noqa: F401  (puts the app directory on sys.path)
+from common import report
+from config import sqlite_db_path
+from db_pool import SQLitePool
+
+QUERIES = [
+    'SELECT Type, COUNT(*), AVG("Machine failure") FROM Machinelogs GROUP BY Type',
+    'SELECT AVG("Torque [Nm]"), MAX("Tool wear [min]") FROM Machinelogs WHERE "Machine failure" = 1',
+    'SELECT "Product ID", "Air temperature [K]" FROM Machinelogs ORDER BY UDI DESC LIMIT 5',
+    'SELECT SUM(TWF), SUM(HDF), SUM(PWF), SUM(OSF), SUM(RNF) FROM Machinelogs',
+]
+
+
+async def old_path(db_path, sql_query):
+    # Mirrors the original run_sqlite_query: blocking connect/execute/close inside a coroutine
+    connection = sqlite3.connect(db_path)
+    try:
+        cursor = connection.cursor()
+        cursor.execute(sql_query)
+        result = cursor.fetchall()
+        cursor.close()
+        return result
+    finally:
+        connection.close()
+
+
+async def probe_loop_lag(lags, interval=0.005):
+    # Measures how late the event loop wakes up; this is what other sessions feel
+    while True:
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        lags.append(time.perf_counter() - start - interval)
+
+
+async def run_sessions(execute, sessions, queries_per_session):
+    latencies = []
+    lags = []
+    probe = asyncio.ensure_future(probe_loop_lag(lags))
+
+    async def session(session_id):
+        for i in range(queries_per_session):
+            sql_query = QUERIES[(session_id + i) % len(QUERIES)]
+            start = time.perf_counter()
+            await execute(sql_query)
+            latencies.append(time.perf_counter() - start)
+            # Yield between queries as a real session would while waiting on the LLM
+            await asyncio.sleep(0)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(session(s) for s in range(sessions)))
+    wall = time.perf_counter() - start
+    probe.cancel()
+    return latencies, lags, wall
+
+
+async def main(args):
+    db_path = args.db or sqlite_db_path()
+
+    latencies, lags, wall = await run_sessions(lambda q: old_path(db_path, q), args.sessions, args.queries)
+    report("connect-per-call", latencies, wall)
+    report("  event loop lag", lags)
+
+    pool = SQLitePool(db_path, size=args.pool_size)
+    try:
+        latencies, lags, wall = await run_sessions(pool.run, args.sessions, args.queries)
+        report(f"pool(size={args.pool_size})", latencies, wall)
+        report("  event loop lag", lags)
+    finally:
+        pool.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--db", default=None, help="SQLite database (defaults to SQLITE_DB_PATH / ai4i2020.db)")
+    parser.add_argument("--sessions", type=int, default=50)
+    parser.add_argument("--queries", type=int, default=10)
+    parser.add_argument("--pool-size", type=int, default=4)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,80 @@
+"""
+Benchmark: import (cold start) time of the app modules, from python -X importtime.
+
+Each module is imported in a fresh interpreter --repeat times; the best
+cumulative import time is reported along with the heaviest modules it pulled
+in. With --check the run fails if importing a module loads one of the lazily
+imported dependencies (plotly, the Groq client, numpy, asyncpg, ...), or takes
+longer than --max-ms, so regressions are caught in CI.
+
+    python benchmarks/bench_startup.py --check
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+import common
+
+# Dependencies only needed by optional paths; they must not load at import time
+LAZY_MODULES = ("plotly", "groq", "numpy", "asyncpg", "psycopg2", "pandas")
+
+
+def import_times(module):
+    """Import module in a fresh interpreter; return ({module: (self_us, cumulative_us)}, error)."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=common.APP_DIR, capture_output=True, text=True,
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        times[name.strip()] = (int(self_us), int(cumulative_us))
+    error = None
+    if result.returncode != 0:
+        error = (result.stderr.strip().splitlines() or ["import failed"])[-1]
+    return times, error
+
+
+def main(args):
+    failures = []
+    for module in args.modules:
+        best = None
+        for _ in range(args.repeat):
+            times, error = import_times(module)
+            if error:
+                break
+            if best is None or times[module][1] < best[module][1]:
+                best = times
+        if error:
+            print(f"{module:<10} not importable here: {error}")
+            continue
+
+        total_ms = best[module][1] / 1000
+        lazy = sorted({name.split(".")[0] for name in best if name.split(".")[0] in LAZY_MODULES})
+        print(f"{module:<10} {total_ms:8.1f}ms  eagerly imported optional deps: {', '.join(lazy) or 'none'}")
+        top_level = {name: cumulative for name, (_, cumulative) in best.items() if "." not in name and name != module}
+        for name, cumulative in sorted(top_level.items(), key=lambda item: -item[1])[:args.top]:
+            print(f"    {name:<28} {cumulative / 1000:8.1f}ms")
+
+        if lazy:
+            failures.append(f"{module} imports {', '.join(lazy)} at startup")
+        if args.max_ms and total_ms > args.max_ms:
+            failures.append(f"{module} took {total_ms:.1f}ms to import (limit {args.max_ms}ms)")
+
+    if args.check and failures:
+        for failure in failures:
+            print(f"FAIL: {failure}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("modules", nargs="*", default=["tools", "bot", "app"])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--top", type=int, default=5, help="heaviest imported packages to list per module")
+    parser.add_argument("--check", action="store_true", help="exit 1 on eager optional imports or --max-ms")
+    parser.add_argument("--max-ms", type=float, default=0, help="import time limit per module in ms (0: none)")
+    main(parser.parse_args())
@@ -0,0 +1,66 @@
+import os
+import sys
+
+# Benchmarks live one level below the app modules, which use flat imports
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if APP_DIR not in sys.path:
+    sys.path.insert(0, APP_DIR)
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers (pct in 0-100)."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, int(round(pct / 100.0 * len(ordered) + 0.5)) - 1))
+    return ordered[rank]
+
+
+def report(label, latencies_s, wall_s=None):
+    """Print a one-line latency summary for a list of per-operation timings in seconds."""
+    line = (f"{label:<28} n={len(latencies_s):<6} "
+            f"p50={percentile(latencies_s, 50) * 1000:8.2f}ms "
+            f"p95={percentile(latencies_s, 95) * 1000:8.2f}ms "
+            f"p99={percentile(latencies_s, 99) * 1000:8.2f}ms")
+    if wall_s is not None:
+        line += f" wall={wall_s:7.2f}s throughput={len(latencies_s) / wall_s:9.1f}/s"
+    print(line)
+
+
+def build_synthetic_db(path, rows, source_path=None):
+    """
+    Write a scaled-up copy of Machinelogs with `rows` rows to a new SQLite file.
+
+    The 10k source rows are replicated with small random jitter on the sensor
+    columns, so value distributions and failure rates stay realistic.
+    """
+    import sqlite3
+    from config import sqlite_db_path
+
+    if os.path.exists(path):
+        os.remove(path)
+    connection = sqlite3.connect(path)
+    try:
+        connection.execute("PRAGMA journal_mode = OFF")
+        connection.execute("PRAGMA synchronous = OFF")
+        connection.execute("ATTACH DATABASE ? AS src", (f"file:{source_path or sqlite_db_path()}?mode=ro",))
+        connection.execute('CREATE TABLE "Machinelogs" AS SELECT * FROM src.Machinelogs WHERE 0')
+        source_rows = connection.execute("SELECT COUNT(*) FROM src.Machinelogs").fetchone()[0]
+        copies = -(-rows // source_rows)
+        connection.execute(f"""
+            WITH RECURSIVE copy(k) AS (SELECT 0 UNION ALL SELECT k + 1 FROM copy WHERE k + 1 < {copies})
+            INSERT INTO "Machinelogs"
+            SELECT "UDI" + k * {source_rows}, "Product ID", "Type",
+                   ROUND("Air temperature [K]" + (ABS(RANDOM()) % 11 - 5) / 10.0, 1),
+                   ROUND("Process temperature [K]" + (ABS(RANDOM()) % 11 - 5) / 10.0, 1),
+                   "Rotational speed [rpm]" + ABS(RANDOM()) % 21 - 10,
+                   ROUND(MAX("Torque [Nm]" + (ABS(RANDOM()) % 21 - 10) / 10.0, 0.1), 1),
+                   "Tool wear [min]",
+                   "Machine failure", "TWF", "HDF", "PWF", "OSF", "RNF"
+            FROM copy, src.Machinelogs
+            WHERE "UDI" + k * {source_rows} <= {rows}
+        """)
+        connection.commit()
+    finally:
+        connection.close()
+    return path
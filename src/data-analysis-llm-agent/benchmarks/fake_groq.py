@@ -0,0 +1,143 @@
+"""
+Scripted stand-in for the Groq chat completions API used by bot.ChatBot.
+
+script_reply plays the model: a user question is answered with a query_db tool
+call; a query_db result is followed by a plot_chart call when the question
+asks for a chart, and by a short text answer otherwise. FakeGroq serves these
+replies in-process (chat.completions.create, streaming and not);
+fake_groq_server.py serves the same replies over HTTP for the real client.
+Time to first token (optionally growing with the prompt, as prefill does) and
+per-token delay are simulated and every upstream call is counted, so the agent loop can be measured without network access or an
+API key.
+"""
+import asyncio
+import csv
+import json
+import re
+from types import SimpleNamespace
+
+import common  # noqa: F401  (puts the app directory on sys.path)
+from memory import message_tokens
+
+QUESTION_SQL = {
+    "how many machines failed": 'SELECT COUNT(*) FROM Machinelogs WHERE "Machine failure" = 1',
+    "failure by type": 'SELECT Type, SUM("Machine failure") FROM Machinelogs GROUP BY Type',
+    "average process temperature": 'SELECT AVG("Process temperature [K]") FROM Machinelogs',
+    "bar chart of failures by type": 'SELECT Type, SUM("Machine failure") AS failures FROM Machinelogs GROUP BY Type',
+    "line chart of torque over the last 50 machines": 'SELECT UDI, "Torque [Nm]" FROM Machinelogs ORDER BY UDI DESC LIMIT 50',
+}
+DEFAULT_SQL = "SELECT COUNT(*) FROM Machinelogs"
+
+
+def _last_question(messages):
+    for message in reversed(messages):
+        if message.get("role") == "user":
+            return str(message.get("content") or "").strip().lower().rstrip("?")
+    return ""
+
+
+def _table_rows(content):
+    content = str(content)
+    if re.match(r"(over )?\d+ rows x \d+ columns", content):
+        # Compact typed CSV (result_encoding.py): shape line, typed header, rows, optional stats line
+        lines = [line for line in content.split("\n")[2:] if line and not line.startswith("stats over")]
+        return list(csv.reader(lines))
+    lines = [line for line in content.split("\n") if line.startswith("|")]
+    return [[cell.strip() for cell in line.strip("|").split("|")] for line in lines[2:]]
+
+
+def _table_series(content):
+    """First two columns of a markdown or compact CSV table as (x, y) lists; numeric y only."""
+    x_values, y_values = [], []
+    for cells in _table_rows(content):
+        if len(cells) < 2:
+            continue
+        try:
+            y_values.append(float(cells[1]))
+        except ValueError:
+            continue
+        x_values.append(cells[0])
+    return x_values, y_values
+
+
+def script_reply(messages, call_id):
+    """
+    The scripted model turn for a request.
+
+    Returns:
+    tuple: (content or None, list of {"id", "name", "arguments"} tool calls)
+    """
+    last = messages[-1]
+    question = _last_question(messages)
+    if last.get("role") == "tool":
+        if last.get("name") == "query_db" and ("chart" in question or "plot" in question):
+            x_values, y_values = _table_series(last.get("content"))
+            if not y_values:
+                x_values, y_values = ["a", "b", "c"], [1, 2, 3]
+            arguments = {
+                "plot_type": "bar" if "bar" in question else "line",
+                "x_values": x_values,
+                "y_values": y_values,
+                "plot_title": question[:40],
+                "x_label": "x",
+                "y_label": "y",
+            }
+            return None, [{"id": call_id, "name": "plot_chart", "arguments": json.dumps(arguments)}]
+        return f"Here is what the data shows: {str(last.get('content'))[:120]}", []
+    sql = QUESTION_SQL.get(question, DEFAULT_SQL)
+    return None, [{"id": call_id, "name": "query_db", "arguments": json.dumps({"sql_query": sql})}]
+
+
+class FakeCompletions:
+    def __init__(self, client):
+        self._client = client
+
+    async def create(self, model, messages, tools=None, stream=False, **kwargs):
+        self._client.calls += 1
+        self._client.active += 1
+        self._client.max_active = max(self._client.max_active, self._client.active)
+        try:
+            prompt_tokens = sum(message_tokens(message) for message in messages if isinstance(message, dict))
+            self._client.prompt_tokens += prompt_tokens
+            await asyncio.sleep(self._client.ttft_s + self._client.prefill_s_per_1k * prompt_tokens / 1000)
+            self._client.call_ids += 1
+            content, tool_calls = script_reply(messages, f"call_fake{self._client.call_ids}")
+        finally:
+            self._client.active -= 1
+        if stream:
+            return self._stream(content, tool_calls)
+        calls = [SimpleNamespace(id=call["id"], type="function",
+                                 function=SimpleNamespace(name=call["name"], arguments=call["arguments"]))
+                 for call in tool_calls]
+        message = SimpleNamespace(role="assistant", content=content, tool_calls=calls or None)
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+    async def _stream(self, content, tool_calls):
+        for word in (content or "").split(" ") if content else []:
+            await asyncio.sleep(self._client.token_s)
+            delta = SimpleNamespace(content=word + " ", tool_calls=None)
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=delta)])
+        for index, call in enumerate(tool_calls):
+            fragment = SimpleNamespace(index=index, id=call["id"],
+                                       function=SimpleNamespace(name=call["name"], arguments=call["arguments"]))
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=None, tool_calls=[fragment]))])
+
+
+class FakeGroq:
+    """
+    Parameters:
+    ttft_s (float): Simulated time before the first token (or the full response).
+    token_s (float): Simulated delay per streamed word.
+    prefill_s_per_1k (float): Added to the time to first token per 1000 prompt tokens.
+    """
+
+    def __init__(self, ttft_s=0.4, token_s=0.01, prefill_s_per_1k=0.0):
+        self.ttft_s = ttft_s
+        self.token_s = token_s
+        self.prefill_s_per_1k = prefill_s_per_1k
+        self.prompt_tokens = 0
+        self.calls = 0
+        self.call_ids = 0
+        self.active = 0
+        self.max_active = 0
+        self.chat = SimpleNamespace(completions=FakeCompletions(self))
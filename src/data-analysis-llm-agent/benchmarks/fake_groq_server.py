@@ -0,0 +1,143 @@
+"""
+Local mock of the Groq (OpenAI-compatible) chat completions endpoint.
+
+Answers POST .../chat/completions with the scripted replies of fake_groq.py,
+streamed as server-sent events (with x_groq.usage on the last chunk, as Groq
+does) or as a single JSON body, after a configurable time to first token and
+per-token delay. Point the app or bench_load.py at it with GROQ_BASE_URL:
+
+    python benchmarks/fake_groq_server.py --port 8765 --ttft-ms 400
+    GROQ_BASE_URL=http://127.0.0.1:8765 Groq_API_KEY=fake chainlit run app.py
+"""
+import argparse
+import itertools
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import common  # noqa: F401  (puts the app directory on sys.path)
+from fake_groq import script_reply
+from memory import message_tokens
+
+
+class FakeGroqServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # Hundreds of sessions connect at once
+    request_queue_size = 1024
+
+    def __init__(self, address, ttft_s=0.4, token_s=0.01):
+        super().__init__(address, FakeGroqHandler)
+        self.ttft_s = ttft_s
+        self.token_s = token_s
+        self.calls = 0
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def next_id(self):
+        with self._lock:
+            self.calls += 1
+            return next(self._ids)
+
+
+class FakeGroqHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Streamed chunks are small writes; Nagle would hold each one back for the client's delayed ACK
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, body):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_chunk(self, payload):
+        data = f"data: {payload}\n\n".encode("utf-8")
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": f"unknown path {self.path}"}})
+            return
+        server = self.server
+        number = server.next_id()
+        messages = body.get("messages") or []
+        content, tool_calls = script_reply(messages, f"call_fake{number}")
+        completion_id = f"chatcmpl-fake{number}"
+        model = body.get("model", "fake")
+        usage = {
+            "prompt_tokens": sum(message_tokens(message) for message in messages),
+            "completion_tokens": message_tokens({"content": content, "tool_calls": [
+                {"function": {"name": call["name"], "arguments": call["arguments"]}} for call in tool_calls]}),
+        }
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+        time.sleep(server.ttft_s)
+
+        tool_call_items = [
+            {"index": index, "id": call["id"], "type": "function",
+             "function": {"name": call["name"], "arguments": call["arguments"]}}
+            for index, call in enumerate(tool_calls)
+        ]
+        finish_reason = "tool_calls" if tool_calls else "stop"
+        if not body.get("stream"):
+            message = {"role": "assistant", "content": content}
+            if tool_calls:
+                message["tool_calls"] = [{key: value for key, value in item.items() if key != "index"} for item in tool_call_items]
+            self._send_json(200, {
+                "id": completion_id, "object": "chat.completion", "created": int(time.time()), "model": model,
+                "choices": [{"index": 0, "message": message, "finish_reason": finish_reason}],
+                "usage": usage,
+            })
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        def chunk(delta, finish=None, extra=None):
+            item = {"id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()), "model": model,
+                    "choices": [{"index": 0, "delta": delta, "finish_reason": finish}]}
+            if extra:
+                item.update(extra)
+            self._send_chunk(json.dumps(item))
+
+        chunk({"role": "assistant", "content": ""})
+        for word in content.split(" ") if content else []:
+            time.sleep(server.token_s)
+            chunk({"content": word + " "})
+        for item in tool_call_items:
+            chunk({"tool_calls": [item]})
+        chunk({}, finish_reason, {"x_groq": {"id": completion_id, "usage": usage}})
+        self._send_chunk("[DONE]")
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+
+def start_server(port=0, ttft_s=0.4, token_s=0.01, host="127.0.0.1"):
+    """Start a FakeGroqServer on a daemon thread; returns it (its base URL is http://host:server_port)."""
+    server = FakeGroqServer((host, port), ttft_s=ttft_s, token_s=token_s)
+    threading.Thread(target=server.serve_forever, name="fake-groq", daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--ttft-ms", type=float, default=400)
+    parser.add_argument("--token-ms", type=float, default=10)
+    args = parser.parse_args()
+    server = FakeGroqServer((args.host, args.port), ttft_s=args.ttft_ms / 1000, token_s=args.token_ms / 1000)
+    print(f"Fake Groq API on http://{args.host}:{server.server_port} (GROQ_BASE_URL)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
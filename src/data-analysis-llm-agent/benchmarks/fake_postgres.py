@@ -0,0 +1,75 @@
+"""
+Protocol-compatible stand-in for an asyncpg connection, backed by SQLite.
+
+Implements the subset PostgresPool relies on (prepare/cursor/fetch, transaction,
+fetchval, close, is_closed) and simulates connection handshake and per-query
+network latency, so the pool can be exercised and benchmarked without a server.
+"""
+import asyncio
+import sqlite3
+from collections import namedtuple
+from contextlib import asynccontextmanager
+
+Attribute = namedtuple("Attribute", ["name"])
+
+
+class FakeCursor:
+    def __init__(self, cursor, round_trip_s):
+        self._cursor = cursor
+        self._round_trip_s = round_trip_s
+
+    async def fetch(self, n):
+        await asyncio.sleep(self._round_trip_s)
+        return self._cursor.fetchmany(n)
+
+
+class FakeStatement:
+    def __init__(self, connection, sql_query):
+        self._connection = connection
+        self._sql_query = sql_query
+        # Describe the result without running the query, like a Postgres Parse/Describe
+        described = f"SELECT * FROM ({sql_query.strip().rstrip(';')}) LIMIT 0"
+        self._description = connection._db.execute(described).description or []
+
+    def get_attributes(self):
+        return [Attribute(desc[0]) for desc in self._description]
+
+    async def cursor(self, *args):
+        await asyncio.sleep(self._connection.round_trip_s)
+        return FakeCursor(self._connection._db.execute(self._sql_query, args), self._connection.round_trip_s)
+
+
+class FakeConnection:
+    def __init__(self, db_path, round_trip_s):
+        self._db = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+        self.round_trip_s = round_trip_s
+        self._closed = False
+
+    @asynccontextmanager
+    async def transaction(self):
+        yield self
+
+    async def prepare(self, sql_query):
+        await asyncio.sleep(self.round_trip_s)
+        return FakeStatement(self, sql_query)
+
+    async def fetchval(self, sql_query, *args):
+        await asyncio.sleep(self.round_trip_s)
+        return self._db.execute(sql_query, args).fetchone()[0]
+
+    def is_closed(self):
+        return self._closed
+
+    async def close(self):
+        self._closed = True
+        self._db.close()
+
+
+def fake_connect_factory(db_path, handshake_s=0.02, round_trip_s=0.0005):
+    """Return a connect() coroutine function opening FakeConnections after a simulated handshake."""
+    async def connect():
+        # TCP + TLS + auth usually costs several round trips
+        await asyncio.sleep(handshake_s)
+        return FakeConnection(db_path, round_trip_s)
+
+    return connect
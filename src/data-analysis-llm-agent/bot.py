@@ -2,17 +2,73 @@ import asyncio
 import logging
 import os
 import json
+import time
+import uuid
+from types import SimpleNamespace
 
-logging.info(f"User message")
-
-import httpx
-from groq import AsyncGroq
+from config import env_bool, env_int
+from completion_cache import completion_key, get_completion_cache
+from memory import memory_from_env, message_tokens
+from metrics import LLM_REQUESTS, record_tokens
+from result_encoding import encode_tool_results
+from executor import ToolTimeoutError, get_tool_executor
+from speculation import get_speculator
+from tracing import annotate, span
 
 
 model = "llama3-groq-70b-8192-tool-use-preview"
-client = AsyncGroq(
-    api_key=os.environ.get("Groq_API_KEY")
-)
+streaming = env_bool('LLM_STREAMING', True)
+
+_client = None
+
+
+def get_client():
+    """Groq client, created on first use so importing this module stays cheap."""
+    global _client
+    if _client is None:
+        from groq import AsyncGroq
+
+        _client = AsyncGroq(
+            api_key=os.environ.get("Groq_API_KEY")
+        )
+    return _client
+
+
+def message_to_dict(message):
+    """Assistant message (SDK object or streamed) in the dict form sent back to the API."""
+    data = {"role": "assistant", "content": message.content or ""}
+    if message.tool_calls:
+        data["tool_calls"] = [
+            {
+                "id": tool_call.id,
+                "type": "function",
+                "function": {"name": tool_call.function.name, "arguments": tool_call.function.arguments},
+            }
+            for tool_call in message.tool_calls
+        ]
+    return data
+
+
+def estimate_tokens(messages, reply):
+    """(prompt, completion) token estimates for when the API does not report usage."""
+    return sum(message_tokens(message) for message in messages), message_tokens(reply)
+
+
+def message_from_dict(data):
+    """Assistant message from its cached dict form, with fresh tool call ids so replays never collide."""
+    tool_calls = [
+        _tool_call({"id": f"call_{uuid.uuid4().hex[:24]}", "name": call["function"]["name"], "arguments": call["function"]["arguments"]})
+        for call in data.get("tool_calls") or []
+    ]
+    return SimpleNamespace(role="assistant", content=data.get("content") or None, tool_calls=tool_calls or None)
+
+
+def _tool_call(call):
+    return SimpleNamespace(
+        id=call["id"],
+        type="function",
+        function=SimpleNamespace(name=call["name"], arguments=call["arguments"]),
+    )
 
 # Main chatbot class
 class ChatBot:
@@ -22,12 +78,43 @@ class ChatBot:
         self.exclude_functions = ["plot_chart"]
         self.tool_functions = tool_functions
         self.messages = []
+        self.ttft_s = []  # time to first token of each completion
+        self._tool_tasks = {}  # tool_call_id -> task started while the completion was streaming
+        self.memory = memory_from_env(summarizer=self.summarize)
+        self.tool_session = get_tool_executor().session()
+        self.last_sql = None  # last successful query_db SQL, for speculative prefetch
         if self.system:
             self.messages.append({"role": "system", "content": system})
 
-    async def __call__(self, message):
+    def to_state(self):
+        """
+        Conversation state for a session store: the messages after the system
+        prompt (which each worker builds itself) and the memory bookkeeping.
+
+        Call between turns. Tool outputs of the finished turn are digested first,
+        as the next request would do anyway, which keeps stored states small.
+        """
+        if self.memory is not None:
+            self.memory.compact(self.messages, finished=True)
+        start = 1 if self.system and self.messages and self.messages[0].get("role") == "system" else 0
+        return {
+            "messages": self.messages[start:],
+            "memory": self.memory.state() if self.memory is not None else None,
+            "last_sql": self.last_sql,
+        }
+
+    def restore(self, state):
+        """Continue a conversation saved by to_state (possibly on another worker)."""
+        self.messages = self.messages[:1] if self.system else []
+        self.messages.extend(state["messages"])
+        if self.memory is not None and state.get("memory"):
+            self.memory.restore(state["memory"])
+        self.last_sql = state.get("last_sql")
+
+    async def __call__(self, message, on_token=None):
+        self._cancel_tool_tasks()
         self.messages.append({"role": "user", "content": f"""{message}"""})
-        response_message = await self.execute()
+        response_message = await self.execute(on_token)
         # for function call sometimes this can be empty
         if response_message.content:
             self.messages.append({"role": "assistant", "content": response_message.content})
@@ -37,24 +124,160 @@ class ChatBot:
 
         return response_message
 
-    async def execute(self):
-        #print(self.messages)
-        completion = await client.chat.completions.create(
+    async def execute(self, on_token=None):
+        messages = await self.request_messages()
+        cache = get_completion_cache()
+        if cache is None:
+            LLM_REQUESTS.inc(source="upstream")
+            return await self.complete(messages, on_token)
+
+        # Identical requests reuse a cached or in-flight completion instead of calling the model again
+        own_message = None
+
+        async def create():
+            nonlocal own_message
+            own_message = await self.complete(messages, on_token)
+            return message_to_dict(own_message)
+
+        key = completion_key(model, messages, self.tools, env_int('LLM_CACHE_CONTEXT_TURNS', 0))
+        with span("llm.cache") as cache_span:
+            data, source = await cache.get_or_create(key, create)
+            cache_span.set(source=source)
+        LLM_REQUESTS.inc(source="upstream" if source == "miss" else source)
+        if own_message is not None:
+            return own_message
+        assistant_message = message_from_dict(data)
+        if on_token is not None and assistant_message.content:
+            await on_token(assistant_message.content)
+        return assistant_message
+
+    async def complete(self, messages, on_token=None):
+        with span("llm.completion", model=model, stream=streaming, messages=len(messages)):
+            if streaming:
+                return await self.execute_streaming(messages, on_token)
+
+            completion = await get_client().chat.completions.create(
+                model=model,
+                messages=messages,
+                tools = self.tools
+            )
+            assistant_message = completion.choices[0].message
+            usage = getattr(completion, "usage", None)
+            if usage is not None:
+                record_tokens(usage.prompt_tokens, usage.completion_tokens)
+            else:
+                record_tokens(*estimate_tokens(messages, message_to_dict(assistant_message)), source="estimated")
+
+            return assistant_message
+
+    async def request_messages(self):
+        # Bounded view of the conversation: compacted tool outputs and a sliding window of turns
+        if self.memory is None:
+            return self.messages
+        return await self.memory.build(self.messages)
+
+    async def summarize(self, messages):
+        transcript = "\n".join(f"{m.get('role')}: {m.get('content')}" for m in messages if m.get("content"))
+        completion = await get_client().chat.completions.create(
             model=model,
-            messages=self.messages,
-            tools = self.tools
+            messages=[
+                {"role": "system", "content": "Summarize this data analysis conversation in at most 5 short sentences. Keep the user's goals, filters and key numbers."},
+                {"role": "user", "content": transcript},
+            ],
         )
-        print(completion)
-        assistant_message = completion.choices[0].message
+        return completion.choices[0].message.content
+
+    async def stream_completion(self, messages):
+        """
+        Stream a completion as ("token", text), ("tool_call", tool_call) and finally ("message", message) events.
+
+        Tool call fragments are assembled per index; a call is emitted as soon as the
+        stream moves on to the next call (or ends), so it can start executing early.
+        """
+        stream = await get_client().chat.completions.create(
+            model=model,
+            messages=messages,
+            tools=self.tools,
+            stream=True
+        )
+        content = []
+        calls = {}
+        current = None
+        usage = None
+        async for chunk in stream:
+            # Groq reports token usage in an x_groq extension of the final chunk
+            usage = getattr(getattr(chunk, "x_groq", None), "usage", None) or usage
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta
+            if delta.content:
+                content.append(delta.content)
+                yield "token", delta.content
+            for fragment in delta.tool_calls or []:
+                if current is not None and fragment.index != current:
+                    yield "tool_call", _tool_call(calls[current])
+                call = calls.setdefault(fragment.index, {"id": None, "name": "", "arguments": ""})
+                current = fragment.index
+                if fragment.id:
+                    call["id"] = fragment.id
+                if fragment.function:
+                    call["name"] += fragment.function.name or ""
+                    call["arguments"] += fragment.function.arguments or ""
+        if current is not None:
+            yield "tool_call", _tool_call(calls[current])
+
+        tool_calls = [_tool_call(calls[index]) for index in sorted(calls)]
+        message = SimpleNamespace(role="assistant", content="".join(content) or None, tool_calls=tool_calls or None)
+        if usage is not None:
+            record_tokens(usage.prompt_tokens, usage.completion_tokens)
+        else:
+            record_tokens(*estimate_tokens(messages, message_to_dict(message)), source="estimated")
+        yield "message", message
+
+    async def execute_streaming(self, messages, on_token=None):
+        start = time.perf_counter()
+        first_token_at = None
+        assistant_message = None
+        async for kind, value in self.stream_completion(messages):
+            if first_token_at is None:
+                first_token_at = time.perf_counter()
+                self.ttft_s.append(first_token_at - start)
+                annotate(ttft_s=first_token_at - start)
+                logging.info(f"Time to first token: {first_token_at - start:.3f}s")
+            if kind == "token":
+                if on_token is not None:
+                    await on_token(value)
+            elif kind == "tool_call":
+                # Start the tool while the rest of the response is still streaming
+                self._tool_tasks[value.id] = asyncio.ensure_future(self.call_function(value))
+            else:
+                assistant_message = value
 
         return assistant_message
 
+    def _cancel_tool_tasks(self):
+        for task in self._tool_tasks.values():
+            task.cancel()
+        self._tool_tasks.clear()
+
+    def cancel(self):
+        """Abort the current turn: cancel every queued or running tool call."""
+        self._cancel_tool_tasks()
+        self.tool_session.cancel_all()
+
     async def call_function(self, tool_call):
         function_name = tool_call.function.name
         function_to_call = self.tool_functions[function_name]
         function_args = json.loads(tool_call.function.arguments)
-        logging.info(f"Calling {function_name} with {function_args}")
-        function_response = await function_to_call(**function_args)
+        with span(f"tool.{function_name}", tool_call_id=tool_call.id):
+            logging.info(f"Calling {function_name} with {function_args}")
+            try:
+                function_response = await self.tool_session.run(function_name, function_to_call, function_args)
+            except ToolTimeoutError as error:
+                # Let the model reflect on the timeout like on any other tool error
+                function_response = f"Error while executing the tool: {error}"
+        if function_name == "query_db":
+            self._speculate(function_args.get("sql_query"), function_response)
 
         return {
             "tool_call_id": tool_call.id,
@@ -63,21 +286,40 @@ class ChatBot:
             "content": function_response,
         }
 
-    async def call_functions(self, tool_calls):
+    def _speculate(self, sql_query, response):
+        # Warm the result cache with likely follow-ups while the model reads this result
+        speculator = get_speculator()
+        if speculator is None or not sql_query or not isinstance(response, str) or response.startswith("Error"):
+            return
+        speculator.after_query(self.last_sql, sql_query)
+        self.last_sql = sql_query
 
-        # Use asyncio.gather to make function calls in parallel
-        function_responses = await asyncio.gather(
-            *(self.call_function(tool_call) for tool_call in tool_calls)
-            )
+    async def call_functions(self, tool_calls, on_token=None):
+
+        # Use asyncio.gather to make function calls in parallel, reusing calls started during streaming
+        tasks = [
+            self._tool_tasks.pop(tool_call.id, None) or asyncio.ensure_future(self.call_function(tool_call))
+            for tool_call in tool_calls
+        ]
+        try:
+            function_responses = await asyncio.gather(*tasks)
+        except BaseException:
+            # One call failed or the turn was aborted: do not leave siblings running
+            for task in tasks:
+                task.cancel()
+            raise
 
-        # Extend conversation with all function responses
-        responses_in_str = [{**item, "content": str(item["content"])} for item in function_responses]
+        # Extend conversation with all function responses, compactly encoded for the model
+        responses_in_str = encode_tool_results(function_responses)
 
-        # Log each tool call object separately
+        # Log each tool call by name, id and size: the repr of a result (a whole Plotly figure for charts)
+        # would be built on the event loop even when the record is only queued
         for res in function_responses:
-            logging.info(f"Tool Call: {res}")
+            content = res["content"]
+            logging.info("Tool Call: %s %s -> %s", res["name"], res["tool_call_id"],
+                         f"{len(content)} chars" if isinstance(content, str) else type(content).__name__)
 
         self.messages.extend(responses_in_str)
 
-        response_message = await self.execute()
+        response_message = await self.execute(on_token)
         return response_message, function_responses
@@ -0,0 +1,139 @@
+import asyncio
+import logging
+import threading
+
+from config import env_int, sqlite_db_path
+from db_pool import get_sqlite_pool
+from query_cache import SQLiteVersion
+from utils import format_sample_data, generate_sample_data_query
+
+
+def quote_identifier(name):
+    return '"' + name.replace('"', '""') + '"'
+
+
+class TableInfo:
+    def __init__(self, name, ddl, columns, row_count, column_stats, sample_data):
+        self.name = name
+        self.ddl = ddl
+        self.columns = columns            # [(column_name, declared_type)]
+        self.row_count = row_count
+        self.column_stats = column_stats  # {column_name: {"min", "max", "distinct"}}
+        self.sample_data = sample_data    # formatted by utils.format_sample_data
+
+
+class SchemaCatalog:
+    """
+    Schema and column statistics of the SQLite database, loaded once per process.
+
+    Holds each table's DDL, column types, row count, min/max/distinct counts and
+    a few sample values, and renders them as the table description used in the
+    system prompt. It is reloaded only when the database file or schema changes,
+    so starting a chat session normally costs no database round trip.
+
+    Parameters:
+    db_path (str): Path to the SQLite database file.
+    sample_rows (int): Rows sampled to pick example values per column.
+    """
+
+    def __init__(self, db_path, sample_rows=20):
+        self.db_path = db_path
+        self.sample_rows = sample_rows
+        self.tables = {}
+        self.version = None
+        self.identifiers = frozenset()  # lowercased table and column names
+        self._table_info = ""
+        self._version = SQLiteVersion(db_path)
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+
+    def _query(self, sql_query):
+        return get_sqlite_pool().execute(sql_query)
+
+    def _load_table(self, name, ddl):
+        table = quote_identifier(name)
+        pragma_rows, _ = self._query(f"PRAGMA table_info({table})")
+        columns = [(row[1], row[2]) for row in pragma_rows]
+
+        # Row count and per-column statistics in a single scan
+        aggregates = ["COUNT(*)"]
+        for column_name, _ in columns:
+            column = quote_identifier(column_name)
+            aggregates += [f"MIN({column})", f"MAX({column})", f"COUNT(DISTINCT {column})"]
+        stats_rows, _ = self._query(f"SELECT {', '.join(aggregates)} FROM {table}")
+        stats = stats_rows[0]
+        column_stats = {}
+        for i, (column_name, _) in enumerate(columns):
+            column_stats[column_name] = {
+                "min": stats[1 + 3 * i],
+                "max": stats[2 + 3 * i],
+                "distinct": stats[3 + 3 * i],
+            }
+
+        sample_records, sample_columns = self._query(generate_sample_data_query("main", name, self.sample_rows))
+        sample_data = format_sample_data(sample_columns, sample_records)
+
+        return TableInfo(name, ddl, columns, stats[0], column_stats, sample_data)
+
+    def load(self):
+        """Read schema and statistics from the database. Blocking."""
+        version = self._version()
+        table_rows, _ = self._query("SELECT name, sql FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%'")
+        tables = {}
+        for name, ddl in table_rows:
+            tables[name] = self._load_table(name, ddl)
+
+        with self._lock:
+            self.tables = tables
+            self.identifiers = frozenset(
+                [name.lower() for name in tables] + [column.lower() for t in tables.values() for column, _ in t.columns])
+            self.version = version
+            self._table_info = self.format_table_info()
+        logging.info(f"Schema catalog loaded: {', '.join(f'{t.name}({t.row_count} rows)' for t in tables.values())}")
+        return self
+
+    def is_stale(self):
+        return self.version is None or self._version() != self.version
+
+    async def refresh(self):
+        """Reload on a worker thread if the database changed since the last load."""
+        if self.is_stale():
+            await asyncio.get_running_loop().run_in_executor(None, self._refresh_sync)
+        return self
+
+    def _refresh_sync(self):
+        with self._load_lock:
+            # Another session may have reloaded while this one waited for the lock
+            if self.is_stale():
+                self.load()
+
+    def format_table_info(self):
+        """Render DDL, column statistics and sample values for the system prompt."""
+        sections = []
+        for table in self.tables.values():
+            lines = [table.ddl, f"-- {table.name}: {table.row_count} rows", "-- Column statistics (min, max, distinct values):"]
+            for column_name, declared_type in table.columns:
+                stats = table.column_stats[column_name]
+                lines.append(f'--   "{column_name}" {declared_type}: min={stats["min"]}, max={stats["max"]}, distinct={stats["distinct"]}')
+            if table.sample_data:
+                lines.append("-- Sample values:")
+                lines += [f"--   {line}" for line in table.sample_data.strip().split('\n')]
+            sections.append('\n'.join(lines))
+        return '\n\n'.join(sections)
+
+    @property
+    def table_info(self):
+        return self._table_info
+
+
+_catalog = None
+_catalog_lock = threading.Lock()
+
+
+def get_schema_catalog():
+    """Return the process-wide catalog; call load() or refresh() before first use."""
+    global _catalog
+    with _catalog_lock:
+        if _catalog is None:
+            _catalog = SchemaCatalog(sqlite_db_path(), sample_rows=env_int('CATALOG_SAMPLE_ROWS', 20))
+    return _catalog
@@ -0,0 +1,283 @@
+"""
+Charting helpers for plot_chart: decimation of large series, a cache of built
+figures and optional static PNG rendering.
+
+The model often passes thousands of points to plot_chart, all of which end up
+in the figure JSON sent to the browser. Line series above CHART_MAX_POINTS are
+downsampled with LTTB (Largest-Triangle-Three-Buckets), which keeps the visual
+shape, and scatter series are aggregated onto a grid with one marker per
+occupied cell. Bar charts are left alone: their x values are categories.
+"""
+import hashlib
+import json
+import logging
+import math
+import os
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from config import env_bool, env_int
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value)
+
+
+def numeric(values):
+    """True when every value is a finite int or float (no NULLs, strings or bools)."""
+    return all(_is_number(value) for value in values)
+
+
+def lttb(xs, ys, threshold):
+    """
+    Indices of the points kept by Largest-Triangle-Three-Buckets downsampling.
+
+    The first and last points are always kept; the points in between are split
+    into threshold - 2 buckets and from each bucket the point forming the
+    largest triangle with the previously kept point and the average of the next
+    bucket is selected.
+
+    Parameters:
+    xs (sequence): Numeric x values in drawing order (non-decreasing for a true time series).
+    ys (sequence): Numeric y values.
+    threshold (int): Number of points to keep.
+
+    Returns:
+    list: Increasing indices into xs/ys.
+    """
+    n = len(ys)
+    if threshold >= n or threshold < 3:
+        return list(range(n))
+
+    every = (n - 2) / (threshold - 2)
+    kept = [0]
+    a = 0
+    for i in range(threshold - 2):
+        # Average of the next bucket (the last point for the final bucket)
+        avg_start = int((i + 1) * every) + 1
+        avg_end = min(int((i + 2) * every) + 1, n)
+        if avg_start >= avg_end:
+            avg_start, avg_end = n - 1, n
+        count = avg_end - avg_start
+        avg_x = sum(xs[avg_start:avg_end]) / count
+        avg_y = sum(ys[avg_start:avg_end]) / count
+
+        ax, ay = xs[a], ys[a]
+        best, best_area = None, -1.0
+        for j in range(int(i * every) + 1, int((i + 1) * every) + 1):
+            area = abs((ax - avg_x) * (ys[j] - ay) - (ax - xs[j]) * (avg_y - ay))
+            if area > best_area:
+                best, best_area = j, area
+        kept.append(best)
+        a = best
+    kept.append(n - 1)
+    return kept
+
+
+def bin_scatter(xs, ys, max_points):
+    """
+    Aggregate a scatter series onto a grid of at most max_points cells.
+
+    Parameters:
+    xs (sequence): Numeric x values.
+    ys (sequence): Numeric y values.
+    max_points (int): Upper bound on the number of cells (the grid is sqrt(max_points) square).
+
+    Returns:
+    tuple: (x means, y means, point counts), one entry per occupied cell.
+    """
+    bins = max(1, math.isqrt(max_points))
+    x_min, x_max = min(xs), max(xs)
+    y_min, y_max = min(ys), max(ys)
+    x_scale = bins / (x_max - x_min) if x_max > x_min else 0.0
+    y_scale = bins / (y_max - y_min) if y_max > y_min else 0.0
+
+    cells = {}
+    for x, y in zip(xs, ys):
+        cell = (min(int((x - x_min) * x_scale), bins - 1), min(int((y - y_min) * y_scale), bins - 1))
+        totals = cells.get(cell)
+        if totals is None:
+            cells[cell] = [x, y, 1]
+        else:
+            totals[0] += x
+            totals[1] += y
+            totals[2] += 1
+
+    x_means, y_means, counts = [], [], []
+    for cell in sorted(cells):
+        sum_x, sum_y, count = cells[cell]
+        x_means.append(sum_x / count)
+        y_means.append(sum_y / count)
+        counts.append(count)
+    return x_means, y_means, counts
+
+
+def decimate(plot_type, x_values, y_values, max_points):
+    """
+    Reduce a series to at most max_points points for drawing.
+
+    Lines use LTTB (over the x values when they are numeric and sorted, over the
+    point positions otherwise, so categorical or unordered x keep their order).
+    Scatter plots with numeric x and y are binned; the third return value then
+    holds the number of points behind each marker. Anything else, including
+    bar charts and series with NULLs or text values, is returned unchanged.
+
+    Returns:
+    tuple: (x_values, y_values, counts or None)
+    """
+    n = len(y_values)
+    if not max_points or n <= max_points or not numeric(y_values):
+        return x_values, y_values, None
+
+    if plot_type == 'line':
+        xs = x_values
+        if not numeric(x_values) or any(x_values[i] > x_values[i + 1] for i in range(n - 1)):
+            xs = range(n)
+        kept = lttb(xs, y_values, max_points)
+        return [x_values[i] for i in kept], [y_values[i] for i in kept], None
+    if plot_type == 'scatter' and numeric(x_values):
+        return bin_scatter(x_values, y_values, max_points)
+    return x_values, y_values, None
+
+
+def _hash_values(digest, values):
+    # Numeric series are hashed as packed doubles, about 10x faster than through repr or json
+    try:
+        packed = array('d', values).tobytes()
+    except (TypeError, OverflowError):
+        packed = repr(list(values)).encode("utf-8")
+    digest.update(len(packed).to_bytes(8, "little"))
+    digest.update(packed)
+
+
+def chart_key(x_values, y_values, *options):
+    """Hash of the plot_chart arguments; identical charts share a key."""
+    digest = hashlib.sha1()
+    _hash_values(digest, x_values)
+    _hash_values(digest, y_values)
+    digest.update(json.dumps(options, default=str).encode("utf-8"))
+    return digest.hexdigest()
+
+
+class FigureCache:
+    """
+    LRU cache of built figures keyed on chart_key.
+
+    Each entry is charged the size of the figure's serialized JSON, which is
+    also what the browser receives, so max_bytes bounds the cached payload.
+
+    Parameters:
+    max_entries (int): Maximum number of cached figures.
+    max_bytes (int): Cap on the total serialized size of cached figures.
+    """
+
+    def __init__(self, max_entries=64, max_bytes=16 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # key -> (figure, size)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, figure):
+        """Store a figure; returns the size of its serialized JSON in bytes."""
+        size = len(figure.to_json())
+        if size > self.max_bytes:
+            return size
+        with self._lock:
+            if key in self._entries:
+                self._bytes -= self._entries.pop(key)[1]
+            self._entries[key] = (figure, size)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._bytes -= evicted
+                self.evictions += 1
+        return size
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+        }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_figure_cache():
+    """Process-wide figure cache, or None when CHART_CACHE_ENABLED is off."""
+    global _cache
+    if not env_bool('CHART_CACHE_ENABLED', True):
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = FigureCache(
+                max_entries=env_int('CHART_CACHE_MAX_ENTRIES', 64),
+                max_bytes=env_int('CHART_CACHE_MAX_BYTES', 16 * 1024 * 1024),
+            )
+        return _cache
+
+
+# PNG export starts a headless browser through kaleido; one renderer thread is plenty
+_renderer = None
+_rendered = {}  # save_path -> chart key last written there
+_renderer_lock = threading.Lock()
+
+
+def _write_png(figure, save_path, key):
+    start = time.perf_counter()
+    try:
+        directory = os.path.dirname(save_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        figure.write_image(save_path)
+    except Exception as error:
+        # kaleido is optional: a missing renderer must not break the chat
+        logging.warning(f"Could not render chart to {save_path}: {error}")
+        with _renderer_lock:
+            _rendered.pop(save_path, None)
+        return
+    logging.info(f"Rendered chart to {save_path} in {time.perf_counter() - start:.2f}s")
+
+
+def render_png_in_background(figure, save_path, key):
+    """
+    Write figure as a PNG to save_path on the renderer thread; returns the future, or None when already written.
+
+    Rendering needs the optional kaleido package; failures are logged.
+    """
+    global _renderer
+    with _renderer_lock:
+        if _rendered.get(save_path) == key and os.path.exists(save_path):
+            return None
+        _rendered[save_path] = key
+        if _renderer is None:
+            _renderer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="chart-png")
+    return _renderer.submit(_write_png, figure, save_path, key)
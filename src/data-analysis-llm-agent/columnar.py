@@ -0,0 +1,1037 @@
+import asyncio
+import bisect
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from decimal import Decimal, ROUND_HALF_UP
+from urllib.parse import quote
+
+from config import env_bool, sqlite_db_path
+from query_cache import SQLiteVersion, TOKEN_RE, normalize_identifier
+
+try:
+    import numpy as np
+except ImportError:  # the columnar backend is optional
+    np = None
+
+AGGREGATES = {"count", "sum", "avg", "min", "max"}
+CLAUSES = ("select", "from", "where", "group", "having", "order", "limit")
+COMPARISONS = {"=", "==", "!=", "<>", "<", ">", "<=", ">="}
+INTEGER_TYPES = {"integer", "int"}
+REAL_TYPES = {"real", "float", "double", "numeric"}
+# ROUND() is evaluated per value in Python; beyond this many values leave it to SQLite
+MAX_PYTHON_VALUES = 100000
+LOAD_BATCH_ROWS = 65536
+# Integer GROUP BY keys spanning fewer values than this are grouped by counting instead of sorting
+DENSE_KEY_RANGE = 1 << 22
+
+
+class NotSupported(Exception):
+    """The query is outside the subset the column store evaluates; run it on SQLite instead."""
+
+
+class Column:
+    """One column as a NumPy array; text columns are stored as codes into sorted categories."""
+
+    def __init__(self, name, values, categories=None):
+        self.name = name
+        self.values = values
+        self.categories = categories
+
+
+class Vector:
+    """An evaluated expression: int64/float64 values, or text codes with their categories."""
+
+    def __init__(self, values, categories=None):
+        self.values = values
+        self.categories = categories
+
+    @property
+    def is_text(self):
+        return self.categories is not None
+
+    def take(self, index):
+        return Vector(self.values[index], self.categories)
+
+    def tolist(self):
+        values = self.values.tolist()
+        if self.categories is not None:
+            return [self.categories[code] for code in values]
+        return values
+
+
+def _tokens(sql_query):
+    tokens = []
+    for match in TOKEN_RE.finditer(sql_query):
+        kind = match.lastgroup
+        if kind in ("ws", "comment"):
+            continue
+        text = match.group()
+        if kind == "word":
+            norm = text.lower()
+        elif kind == "qident":
+            norm = normalize_identifier(text).strip('"')
+        else:
+            norm = text
+        tokens.append((kind, norm, match.start(), match.end()))
+    return tokens
+
+
+def _split(tokens, separator=","):
+    """Split tokens at top-level separators."""
+    parts, current, depth = [], [], 0
+    for token in tokens:
+        if token[1] == "(":
+            depth += 1
+        elif token[1] == ")":
+            depth -= 1
+        if depth == 0 and token[1] == separator and token[0] == "op":
+            parts.append(current)
+            current = []
+        else:
+            current.append(token)
+    parts.append(current)
+    return parts
+
+
+def sqlite_round(value, digits=0):
+    """ROUND() as SQLite computes it: half away from zero on the 15-digit decimal form."""
+    exponent = Decimal(1).scaleb(-digits)
+    return float(Decimal("%.15g" % value).quantize(exponent, rounding=ROUND_HALF_UP))
+
+
+class ExpressionParser:
+    """
+    Recursive-descent parser for the expressions the column store evaluates.
+
+    Nodes are tuples: ('col', Column), ('lit', value), ('agg', name, arg),
+    ('neg', e), ('arith', op, a, b), ('cmp', op, a, b), ('and'|'or', a, b),
+    ('not', e), ('in', e, values, negated), ('between', e, low, high, negated),
+    ('isnull', e, negated), ('round', e, digits), ('abs', e), ('cast', e, type).
+    """
+
+    def __init__(self, tokens, columns, qualifiers, aliases=None, allow_aggregates=False):
+        self.tokens = tokens
+        self.i = 0
+        self.columns = columns
+        self.qualifiers = qualifiers
+        self.aliases = aliases or {}
+        self.allow_aggregates = allow_aggregates
+
+    def parse(self):
+        node = self.expr()
+        if self.i != len(self.tokens):
+            raise NotSupported(f"unexpected {self.tokens[self.i][1]!r}")
+        return node
+
+    def peek(self, offset=0):
+        i = self.i + offset
+        return self.tokens[i][1] if i < len(self.tokens) else None
+
+    def next(self):
+        if self.i >= len(self.tokens):
+            raise NotSupported("unexpected end of expression")
+        token = self.tokens[self.i]
+        self.i += 1
+        return token
+
+    def expect(self, text):
+        if self.next()[1] != text:
+            raise NotSupported(f"expected {text!r}")
+
+    def expr(self):
+        node = self.conjunction()
+        while self.peek() == "or":
+            self.next()
+            node = ("or", node, self.conjunction())
+        return node
+
+    def conjunction(self):
+        node = self.negation()
+        while self.peek() == "and":
+            self.next()
+            node = ("and", node, self.negation())
+        return node
+
+    def negation(self):
+        if self.peek() == "not":
+            self.next()
+            return ("not", self.negation())
+        return self.comparison()
+
+    def comparison(self):
+        node = self.additive()
+        negated = False
+        if self.peek() == "not" and self.peek(1) in ("in", "between"):
+            self.next()
+            negated = True
+        op = self.peek()
+        if op in COMPARISONS:
+            self.next()
+            return ("cmp", op, node, self.additive())
+        if op == "in":
+            self.next()
+            self.expect("(")
+            values = [self.literal()]
+            while self.peek() == ",":
+                self.next()
+                values.append(self.literal())
+            self.expect(")")
+            return ("in", node, tuple(values), negated)
+        if op == "between":
+            self.next()
+            low = self.additive()
+            self.expect("and")
+            return ("between", node, low, self.additive(), negated)
+        if op == "is":
+            self.next()
+            negated = self.peek() == "not"
+            if negated:
+                self.next()
+            self.expect("null")
+            return ("isnull", node, negated)
+        return node
+
+    def additive(self):
+        node = self.multiplicative()
+        while self.peek() in ("+", "-"):
+            node = ("arith", self.next()[1], node, self.multiplicative())
+        return node
+
+    def multiplicative(self):
+        node = self.unary()
+        while self.peek() in ("*", "/", "%"):
+            node = ("arith", self.next()[1], node, self.unary())
+        return node
+
+    def unary(self):
+        if self.peek() == "-":
+            self.next()
+            node = self.unary()
+            if node[0] == "lit" and not isinstance(node[1], str):
+                return ("lit", -node[1])
+            return ("neg", node)
+        if self.peek() == "+":
+            self.next()
+        return self.primary()
+
+    def literal(self):
+        node = self.unary()
+        if node[0] != "lit":
+            raise NotSupported("IN lists must hold literals")
+        return node[1]
+
+    def primary(self):
+        kind, norm, _, _ = self.next()
+        if kind == "number":
+            return ("lit", float(norm) if any(c in norm for c in ".eE") else int(norm))
+        if kind == "string":
+            return ("lit", norm[1:-1].replace("''", "'"))
+        if norm == "(":
+            node = self.expr()
+            self.expect(")")
+            return node
+        if kind == "word" and self.peek() == "(":
+            return self.function(norm)
+        if kind in ("word", "qident"):
+            if self.peek() == "." and norm in self.qualifiers:
+                self.next()
+                kind, norm, _, _ = self.next()
+            elif norm in self.aliases:
+                return self.aliases[norm]
+            if norm in self.columns:
+                return ("col", self.columns[norm])
+        raise NotSupported(f"unsupported term {norm!r}")
+
+    def function(self, name):
+        self.expect("(")
+        if name in AGGREGATES:
+            if not self.allow_aggregates:
+                raise NotSupported("aggregate outside SELECT/HAVING/ORDER BY")
+            if self.peek() == "distinct":
+                raise NotSupported("aggregate DISTINCT")
+            if name == "count" and self.peek() == "*":
+                self.next()
+                self.expect(")")
+                return ("agg", "count", None)
+            self.allow_aggregates = False
+            arg = self.expr()
+            self.allow_aggregates = True
+            self.expect(")")
+            return ("agg", name, arg)
+        if name == "round":
+            node = self.expr()
+            digits = 0
+            if self.peek() == ",":
+                self.next()
+                digits = self.literal()
+                if not isinstance(digits, int):
+                    raise NotSupported("ROUND digits must be an integer literal")
+            self.expect(")")
+            return ("round", node, digits)
+        if name == "abs":
+            node = self.expr()
+            self.expect(")")
+            return ("abs", node)
+        if name == "cast":
+            node = self.expr()
+            self.expect("as")
+            type_name = self.next()[1]
+            self.expect(")")
+            if type_name not in INTEGER_TYPES | REAL_TYPES:
+                raise NotSupported(f"CAST to {type_name}")
+            return ("cast", node, "integer" if type_name in INTEGER_TYPES else "real")
+        raise NotSupported(f"function {name}")
+
+
+def _has_aggregate(node):
+    if not isinstance(node, tuple):
+        return False
+    if node[0] == "agg":
+        return True
+    return any(_has_aggregate(part) for part in node[1:] if isinstance(part, tuple))
+
+
+class RowContext:
+    """Evaluates expressions over the table rows selected by index (None for all rows)."""
+
+    def __init__(self, index=None):
+        self.index = index
+        self._cache = {}
+
+    def column(self, column):
+        if column.name not in self._cache:
+            values = column.values if self.index is None else column.values[self.index]
+            self._cache[column.name] = Vector(values, column.categories)
+        return self._cache[column.name]
+
+    def resolve(self, node):
+        return None
+
+    def aggregate(self, node):
+        raise NotSupported("aggregate in a row expression")
+
+
+class GroupContext:
+    """Evaluates expressions per group: grouped expressions map to their keys, aggregates are reduced."""
+
+    def __init__(self, rows, keys, key_vectors, groups, counts):
+        self.rows = rows              # RowContext of the filtered rows
+        self.keys = keys              # GROUP BY expression nodes
+        self.key_vectors = key_vectors
+        self.groups = groups          # group id per row, None for a single group
+        self.counts = counts
+        self.size = len(counts)
+        self._cache = {}
+
+    def column(self, column):
+        raise NotSupported(f"{column.name} is neither grouped nor aggregated")
+
+    def resolve(self, node):
+        for key, vector in zip(self.keys, self.key_vectors):
+            if node == key:
+                return vector
+        return None
+
+    def aggregate(self, node):
+        if node in self._cache:
+            return self._cache[node]
+        _, name, arg = node
+        if name == "count":
+            result = Vector(self.counts.astype(np.int64))
+        else:
+            vector = evaluate(arg, self.rows)
+            if vector.is_text and name not in ("min", "max"):
+                raise NotSupported(f"{name.upper()} over text")
+            result = Vector(self._reduce(name, vector.values), vector.categories)
+        self._cache[node] = result
+        return result
+
+    def _reduce(self, name, values):
+        if self.groups is None:
+            if name == "sum":
+                # int64 sums wrap silently where SQLite raises "integer overflow"
+                if _is_int(values) and _magnitude_bound(values) >= 2 ** 63:
+                    raise NotSupported("integer sum may overflow")
+                return np.array([values.sum()])
+            if name == "avg":
+                return np.array([values.sum(dtype=np.float64) / self.counts[0]])
+            return np.array([values.min() if name == "min" else values.max()])
+        if name in ("sum", "avg"):
+            # bincount sums in float64; integer sums are exact below 2**53
+            sums = np.bincount(self.groups, weights=values, minlength=self.size)
+            if name == "avg":
+                return sums / self.counts
+            if _is_int(values):
+                if _magnitude_bound(values) >= 2 ** 53:
+                    raise NotSupported("integer sum beyond float precision")
+                return np.rint(sums).astype(np.int64)
+            return sums
+        # Every group has at least one row, so the identity start value is always replaced
+        if name == "min":
+            start = np.iinfo(values.dtype).max if _is_int(values) else np.inf
+        else:
+            start = np.iinfo(values.dtype).min if _is_int(values) else -np.inf
+        result = np.full(self.size, start, dtype=values.dtype)
+        (np.minimum if name == "min" else np.maximum).at(result, self.groups, values)
+        return result
+
+
+def _numeric(vector):
+    if vector.is_text:
+        raise NotSupported("arithmetic on text")
+    return vector.values
+
+
+def _is_int(values):
+    return values.dtype.kind in "ib"
+
+
+def _magnitude_bound(values):
+    """Upper bound of |sum(values)| for integer values, as a Python int so it cannot wrap."""
+    if not len(values):
+        return 0
+    return max(abs(int(values.max())), abs(int(values.min()))) * len(values)
+
+
+def _compare(op, left, right):
+    if op in ("=", "=="):
+        return left == right
+    if op in ("!=", "<>"):
+        return left != right
+    if op == "<":
+        return left < right
+    if op == ">":
+        return left > right
+    if op == "<=":
+        return left <= right
+    return left >= right
+
+
+def _compare_text(op, vector, text, swapped=False):
+    # Categories are sorted, so comparing codes against the literal's position orders like SQLite's BINARY collation
+    categories = vector.categories
+    codes = vector.values
+    if swapped:
+        op = {"<": ">", ">": "<", "<=": ">=", ">=": "<="}.get(op, op)
+    low = bisect.bisect_left(categories, text)
+    present = low < len(categories) and categories[low] == text
+    if op in ("=", "=="):
+        return codes == low if present else np.zeros(len(codes), dtype=bool)
+    if op in ("!=", "<>"):
+        return codes != low if present else np.ones(len(codes), dtype=bool)
+    high = low + 1 if present else low
+    if op == "<":
+        return codes < low
+    if op == "<=":
+        return codes < high
+    if op == ">":
+        return codes >= high
+    return codes >= low
+
+
+def _literal_vector(value, length):
+    if isinstance(value, str):
+        raise NotSupported("text literal outside a comparison")
+    return np.full(length, value, dtype=np.int64 if isinstance(value, int) else np.float64)
+
+
+def _length(context):
+    if isinstance(context, GroupContext):
+        return context.size
+    if context.index is not None:
+        return len(context.index)
+    raise NotSupported("literal without a row count")
+
+
+def evaluate(node, context):
+    """Evaluate an expression node to a Vector in a row or group context."""
+    resolved = context.resolve(node)
+    if resolved is not None:
+        return resolved
+    kind = node[0]
+    if kind == "col":
+        return context.column(node[1])
+    if kind == "agg":
+        return context.aggregate(node)
+    if kind == "lit":
+        return Vector(_literal_vector(node[1], _length(context)))
+    if kind == "neg":
+        return Vector(-_numeric(evaluate(node[1], context)))
+    if kind == "abs":
+        return Vector(np.abs(_numeric(evaluate(node[1], context))))
+    if kind == "arith":
+        return Vector(_arith(node[1], *(_operand(part, context) for part in node[2:])))
+    if kind == "cast":
+        values = _numeric(evaluate(node[1], context))
+        if node[2] == "integer":
+            return Vector(np.trunc(values).astype(np.int64))
+        return Vector(values.astype(np.float64))
+    if kind == "round":
+        values = _numeric(evaluate(node[1], context))
+        if len(values) > MAX_PYTHON_VALUES:
+            raise NotSupported("ROUND over too many rows")
+        return Vector(np.array([sqlite_round(v, node[2]) for v in values.tolist()], dtype=np.float64))
+    return Vector(_condition(node, context).astype(np.int64))
+
+
+def _operand(node, context):
+    if node[0] == "lit" and not isinstance(node[1], str):
+        return np.int64(node[1]) if isinstance(node[1], int) else np.float64(node[1])
+    return _numeric(evaluate(node, context))
+
+
+_ARITH = {"+": np.add, "-": np.subtract, "*": np.multiply}
+
+
+def _arith(op, left, right):
+    both_int = _is_int(np.asarray(left)) and _is_int(np.asarray(right))
+    if op in ("+", "-", "*"):
+        if both_int:
+            # SQLite turns an overflowing integer result into a REAL; int64 would wrap
+            approx = _ARITH[op](np.asarray(left, dtype=np.float64), np.asarray(right, dtype=np.float64))
+            if np.any(np.abs(approx) >= 2 ** 63):
+                raise NotSupported("integer overflow")
+        return _ARITH[op](left, right)
+    # Division by zero is NULL in SQLite; leave those queries to it
+    if np.any(np.asarray(right) == 0):
+        raise NotSupported("division by zero")
+    if op == "/":
+        if both_int:
+            # Integer division truncates toward zero
+            quotient = np.abs(left) // np.abs(right)
+            return np.where((left < 0) != (right < 0), -quotient, quotient)
+        return np.true_divide(left, right)
+    if not both_int:
+        raise NotSupported("% on real values")
+    return np.fmod(left, right)
+
+
+def _condition(node, context):
+    """Evaluate a boolean expression to a bool array."""
+    kind = node[0]
+    if kind == "and":
+        return _condition(node[1], context) & _condition(node[2], context)
+    if kind == "or":
+        return _condition(node[1], context) | _condition(node[2], context)
+    if kind == "not":
+        return ~_condition(node[1], context)
+    if kind == "cmp":
+        _, op, left, right = node
+        if left[0] == "lit" and isinstance(left[1], str) or right[0] == "lit" and isinstance(right[1], str):
+            swapped = left[0] == "lit"
+            vector = evaluate(right if swapped else left, context)
+            text = left[1] if swapped else right[1]
+            if not vector.is_text or (right if swapped else left)[0] == "lit":
+                raise NotSupported("text compared with a number")
+            return _compare_text(op, vector, text, swapped)
+        if left[0] == "lit" and right[0] == "lit":
+            raise NotSupported("constant condition")
+        a = evaluate(left, context) if left[0] != "lit" else None
+        b = evaluate(right, context) if right[0] != "lit" else None
+        if (a is not None and a.is_text) or (b is not None and b.is_text):
+            raise NotSupported("text compared with a column")
+        return _compare(op, a.values if a is not None else left[1], b.values if b is not None else right[1])
+    if kind == "in":
+        _, operand, values, negated = node
+        vector = evaluate(operand, context)
+        if vector.is_text != all(isinstance(v, str) for v in values) or (
+                not vector.is_text and any(isinstance(v, str) for v in values)):
+            raise NotSupported("IN list type mismatch")
+        if vector.is_text:
+            result = np.zeros(len(vector.values), dtype=bool)
+            for value in values:
+                result |= _compare_text("=", vector, value)
+        else:
+            result = np.isin(vector.values, values)
+        return ~result if negated else result
+    if kind == "between":
+        _, operand, low, high, negated = node
+        result = _condition(("cmp", ">=", operand, low), context) & _condition(("cmp", "<=", operand, high), context)
+        return ~result if negated else result
+    if kind == "isnull":
+        # Columns with NULLs are never loaded, so nothing here is NULL
+        length = len(evaluate(node[1], context).values)
+        return np.full(length, node[2], dtype=bool)
+    return _numeric(evaluate(node, context)) != 0
+
+
+class LazyBatch:
+    """A batch of output rows, converted to Python values only when iterated."""
+
+    def __init__(self, vectors_fn, index):
+        self.vectors_fn = vectors_fn
+        self.index = index
+
+    def __len__(self):
+        return len(self.index)
+
+    def __iter__(self):
+        columns = [vector.tolist() for vector in self.vectors_fn(self.index)]
+        return iter(zip(*columns))
+
+
+class ColumnarQuery:
+    """
+    One SELECT evaluated over the column store.
+
+    Supported: a single table, WHERE with comparisons, IN, BETWEEN, AND/OR/NOT,
+    arithmetic, CAST, ROUND and ABS; COUNT/SUM/AVG/MIN/MAX with GROUP BY on
+    expressions, ordinals or aliases and HAVING; plain projections; ORDER BY on
+    any of those and LIMIT/OFFSET. Anything else raises NotSupported. Rows tied
+    on the ORDER BY keys may come out in a different order than from SQLite.
+    """
+
+    def __init__(self, store, columns, sql_query):
+        self.store = store
+        self.columns = columns
+        self.sql_query = sql_query
+        self.tokens = _tokens(sql_query)
+
+    def _clauses(self):
+        tokens = list(self.tokens)
+        while tokens and tokens[-1][1] == ";":
+            tokens.pop()
+        if not tokens or tokens[0][1] != "select" or any(t[1] == ";" for t in tokens):
+            raise NotSupported("not a single SELECT")
+        clauses, current, depth = {}, None, 0
+        i = 0
+        while i < len(tokens):
+            token = tokens[i]
+            if token[1] == "(":
+                depth += 1
+            elif token[1] == ")":
+                depth -= 1
+            if depth == 0 and token[0] == "word" and token[1] in CLAUSES:
+                current = token[1]
+                if current in clauses:
+                    raise NotSupported(f"repeated {current}")
+                clauses[current] = []
+                if current in ("group", "order"):
+                    if i + 1 >= len(tokens) or tokens[i + 1][1] != "by":
+                        raise NotSupported("expected BY")
+                    i += 1
+            elif depth == 0 and token[0] == "word" and token[1] in ("union", "intersect", "except", "join", "window"):
+                raise NotSupported(token[1])
+            elif token[0] == "word" and token[1] == "select" and i > 0:
+                raise NotSupported("subquery")
+            else:
+                clauses[current].append(token)
+            i += 1
+        return clauses
+
+    def _qualifiers(self, source):
+        # FROM <table> [[AS] alias]
+        names = [t for t in source if t[1] != "as"]
+        if not names or names[0][1] != self.store.table.lower() or len(names) > 2 or any(
+                t[0] not in ("word", "qident") for t in names):
+            raise NotSupported("FROM must name the table")
+        return {t[1] for t in names}
+
+    def _label(self, item, node):
+        if len(item) >= 2 and item[-2][1] == "as":
+            alias = item[-1]
+            return self.sql_query[alias[2]:alias[3]].strip('"`[]'), item[:-2]
+        if node is not None and node[0] == "col":
+            return node[1].name, item
+        return self.sql_query[item[0][2]:item[-1][3]], item
+
+    def plan(self):
+        clauses = self._clauses()
+        if clauses["select"] and clauses["select"][0][1] in ("distinct", "all"):
+            raise NotSupported("SELECT DISTINCT")
+        qualifiers = self._qualifiers(clauses.get("from", []))
+
+        def parse(tokens, aliases=None, allow_aggregates=False):
+            return ExpressionParser(tokens, self.columns, qualifiers, aliases, allow_aggregates).parse()
+
+        # SELECT list
+        items, labels = [], []
+        for item in _split(clauses["select"]):
+            if [t[1] for t in item] == ["*"]:
+                for column in self.columns.values():
+                    items.append(("col", column))
+                    labels.append(column.name)
+                continue
+            body = item[:-2] if len(item) >= 2 and item[-2][1] == "as" else item
+            node = parse(body, allow_aggregates=True)
+            label, _ = self._label(item, node)
+            items.append(node)
+            labels.append(label)
+        aliases = {label.lower(): node for label, node in zip(labels, items)}
+
+        def resolve_item(tokens, allow_aggregates):
+            # Ordinals and output aliases refer to SELECT items
+            if len(tokens) == 1 and tokens[0][0] == "number":
+                position = int(tokens[0][1])
+                if not 1 <= position <= len(items):
+                    raise NotSupported("ordinal out of range")
+                return items[position - 1]
+            if len(tokens) == 1 and tokens[0][0] in ("word", "qident") and tokens[0][1] in aliases \
+                    and tokens[0][1] not in self.columns:
+                return aliases[tokens[0][1]]
+            return parse(tokens, aliases if allow_aggregates else None, allow_aggregates)
+
+        where = parse(clauses["where"]) if clauses.get("where") else None
+        keys = [resolve_item(tokens, False) for tokens in _split(clauses["group"])] if "group" in clauses else []
+        if any(_has_aggregate(key) for key in keys):
+            raise NotSupported("aggregate in GROUP BY")
+        having = parse(clauses["having"], aliases, True) if clauses.get("having") else None
+
+        order = []
+        for tokens in _split(clauses.get("order", [])) if "order" in clauses else []:
+            descending = False
+            if tokens and tokens[-1][1] in ("asc", "desc"):
+                descending = tokens[-1][1] == "desc"
+                tokens = tokens[:-1]
+            if not tokens or tokens[-1][1] in ("first", "last") or any(t[1] == "collate" for t in tokens):
+                raise NotSupported("ORDER BY modifier")
+            order.append((resolve_item(tokens, True), descending))
+
+        limit = offset = None
+        if "limit" in clauses:
+            parts = clauses["limit"]
+            values = [t for t in parts if t[0] == "number"]
+            words = [t[1] for t in parts if t[0] != "number"]
+            if len(values) == 1 and not words:
+                limit = int(values[0][1])
+            elif len(values) == 2 and words == ["offset"]:
+                limit, offset = int(values[0][1]), int(values[1][1])
+            elif len(values) == 2 and words == [","]:
+                offset, limit = int(values[0][1]), int(values[1][1])
+            else:
+                raise NotSupported("LIMIT form")
+
+        aggregated = bool(keys) or having is not None or any(_has_aggregate(node) for node in items)
+        return items, labels, where, keys, having, order, limit, offset, aggregated
+
+    def execute(self):
+        """Return (column_names, row count, batch function) for the query."""
+        items, labels, where, keys, having, order, limit, offset, aggregated = self.plan()
+
+        if where is not None:
+            index = np.flatnonzero(_condition(where, RowContext()))
+            rows = RowContext(index)
+        else:
+            index = None
+            rows = RowContext()
+        row_count = len(index) if index is not None else self.store.row_count
+
+        if aggregated:
+            context = self._group(rows, row_count, keys)
+            if context is None:
+                raise NotSupported("aggregate over no rows")
+            selected = np.arange(context.size)
+            if having is not None:
+                selected = np.flatnonzero(_condition(having, context))
+        else:
+            context = rows
+            selected = np.arange(row_count)
+
+        selected = self._sort(context, selected, order, limit, offset)
+        if offset:
+            selected = selected[offset:]
+        if limit is not None and limit >= 0:
+            selected = selected[:limit]
+
+        if aggregated:
+            vectors = [evaluate(node, context) for node in items]
+
+            def batch_vectors(batch):
+                return [vector.take(batch) for vector in vectors]
+        else:
+            def batch_vectors(batch):
+                # Projections are evaluated only for the rows actually written out
+                batch_rows = RowContext(batch if index is None else index[batch])
+                return [evaluate(node, batch_rows) for node in items]
+        return labels, selected, batch_vectors
+
+    def _group(self, rows, row_count, keys):
+        if row_count == 0:
+            return None
+        if not keys:
+            return GroupContext(rows, [], [], None, np.array([row_count]))
+
+        # Each key becomes a dense code: value - min for small-range integers and
+        # text codes (no sort needed), np.unique positions otherwise
+        key_vectors = [evaluate(key, rows) for key in keys]
+        decoders = []
+        combined = None
+        cardinality = 1
+        for vector in key_vectors:
+            values = vector.values
+            low, high = (int(values.min()), int(values.max())) if _is_int(values) else (0, -1)
+            if _is_int(values) and high - low < DENSE_KEY_RANGE:
+                codes, size, uniques = values - low, high - low + 1, None
+            else:
+                uniques, codes = np.unique(values, return_inverse=True)
+                size = len(uniques)
+            decoders.append((low, size, uniques, vector.categories))
+            cardinality *= size
+            if cardinality >= 2 ** 62:
+                raise NotSupported("too many groups")
+            combined = codes.astype(np.int64) if combined is None else combined * size + codes
+
+        # Groups come out in key order, as from SQLite's GROUP BY sorter
+        if cardinality <= DENSE_KEY_RANGE:
+            counts = np.bincount(combined, minlength=cardinality)
+            present = np.flatnonzero(counts)
+            dense = np.full(cardinality, -1, dtype=np.int64)
+            dense[present] = np.arange(len(present))
+            groups = dense[combined]
+            counts = counts[present]
+        else:
+            present, groups = np.unique(combined, return_inverse=True)
+            counts = np.bincount(groups)
+
+        group_key_vectors = []
+        stride = cardinality
+        for low, size, uniques, categories in decoders:
+            stride //= size
+            codes = (present // stride) % size
+            values = uniques[codes] if uniques is not None else codes + low
+            group_key_vectors.append(Vector(values, categories))
+        return GroupContext(rows, keys, group_key_vectors, groups, counts)
+
+    def _sort(self, context, selected, order, limit, offset):
+        if not order:
+            return selected
+        sort_keys = []
+        for node, descending in order:
+            vector = evaluate(node, context)
+            values = vector.values[selected]
+            if values.dtype.kind == "b":
+                values = values.astype(np.int64)
+            sort_keys.append(-values if descending else values)
+
+        wanted = (limit or 0) + (offset or 0)
+        if len(sort_keys) == 1 and limit is not None and 0 < wanted < len(selected) // 4:
+            # Top-k: partition first, then sort only the candidates
+            candidates = np.argpartition(sort_keys[0], wanted - 1)[:wanted]
+            ranked = candidates[np.lexsort((candidates, sort_keys[0][candidates]))]
+            return selected[ranked]
+        return selected[np.lexsort(tuple(reversed(sort_keys)))]
+
+
+class ColumnStore:
+    """
+    Machinelogs held column by column in NumPy arrays, as an alternative query_db backend.
+
+    The table is read once from SQLite, written to a sidecar directory of .npy
+    files (one per column) and memory-mapped from there on later starts. Queries
+    in the supported subset (see ColumnarQuery) are evaluated vectorized; others
+    raise NotSupported so the caller runs them on SQLite. Columns containing NULLs
+    are not loaded, which sends every query touching them to SQLite. The store is
+    reloaded in the background when the database changes.
+
+    Parameters:
+    db_path (str): Source SQLite database.
+    table (str): Table to load.
+    cache_dir (str, optional): Column file directory; defaults to <db_path>.columns.
+    use_files (bool): Write and memory-map the column files; otherwise keep arrays in memory only.
+    """
+
+    def __init__(self, db_path, table="Machinelogs", cache_dir=None, use_files=True):
+        if np is None:
+            raise RuntimeError("the columnar backend needs numpy (pip install numpy)")
+        self.db_path = os.path.abspath(db_path)
+        self.table = table
+        self.cache_dir = cache_dir or self.db_path + ".columns"
+        self.use_files = use_files
+        self.columns = None    # lower-cased name -> Column
+        self.row_count = 0
+        self._version = SQLiteVersion(self.db_path)
+        self._source_version = None
+        self._loading = False
+        self._lock = threading.Lock()
+        self.answered = 0
+        self.fallbacks = 0
+
+    @staticmethod
+    def _version_key(version):
+        return repr(version)
+
+    def _read_source(self):
+        connection = sqlite3.connect(f"file:{quote(self.db_path)}?mode=ro", uri=True)
+        try:
+            table = '"' + self.table.replace('"', '""') + '"'
+            declared = connection.execute(f"PRAGMA table_info({table})").fetchall()
+            names = [row[1] for row in declared]
+            types = [row[2].lower() for row in declared]
+            chunks = [[] for _ in names]
+            cursor = connection.execute(f"SELECT {', '.join(chr(34) + n.replace(chr(34), chr(34) * 2) + chr(34) for n in names)} "
+                                        f"FROM {table} ORDER BY rowid")
+            while True:
+                batch = cursor.fetchmany(LOAD_BATCH_ROWS)
+                if not batch:
+                    break
+                for chunk, values in zip(chunks, zip(*batch)):
+                    chunk.append(values)
+        finally:
+            connection.close()
+
+        columns = {}
+        row_count = sum(len(part) for part in chunks[0]) if chunks else 0
+        for name, declared_type, chunk in zip(names, types, chunks):
+            values = [value for part in chunk for value in part]
+            if any(value is None for value in values):
+                logging.info(f"Column store: {name} has NULLs and is left to SQLite")
+                continue
+            if "text" in declared_type or "char" in declared_type:
+                if not all(isinstance(value, str) for value in values):
+                    logging.info(f"Column store: {name} has non-text values and is left to SQLite")
+                    continue
+                # Sorted categories keep code order equal to text order
+                categories = sorted(set(values))
+                codes = {category: i for i, category in enumerate(categories)}
+                columns[name.lower()] = Column(name, np.fromiter((codes[v] for v in values), np.int32, len(values)), categories)
+                continue
+            array = np.array(values)
+            if array.dtype.kind == "i":
+                columns[name.lower()] = Column(name, array.astype(np.int64))
+            elif array.dtype.kind == "f":
+                columns[name.lower()] = Column(name, array.astype(np.float64))
+            else:
+                logging.info(f"Column store: {name} has mixed types and is left to SQLite")
+        return columns, row_count
+
+    def _read_meta(self):
+        try:
+            with open(os.path.join(self.cache_dir, "meta.json"), encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write_files(self, columns, row_count, version):
+        tmp_dir = self.cache_dir + ".tmp"
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+        meta = {"source_version": self._version_key(version), "rows": row_count, "columns": []}
+        for i, column in enumerate(columns.values()):
+            file_name = f"{i}.npy"
+            np.save(os.path.join(tmp_dir, file_name), column.values)
+            meta["columns"].append({"name": column.name, "file": file_name, "categories": column.categories})
+        with open(os.path.join(tmp_dir, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        old_dir = self.cache_dir + ".old"
+        shutil.rmtree(old_dir, ignore_errors=True)
+        if os.path.exists(self.cache_dir):
+            os.replace(self.cache_dir, old_dir)
+        os.replace(tmp_dir, self.cache_dir)
+        shutil.rmtree(old_dir, ignore_errors=True)
+
+    def _map_files(self, meta):
+        columns = {}
+        for entry in meta["columns"]:
+            values = np.load(os.path.join(self.cache_dir, entry["file"]), mmap_mode="r")
+            columns[entry["name"].lower()] = Column(entry["name"], values, entry["categories"])
+        return columns
+
+    def load(self):
+        """Load the table, from the column files when they match the database. Blocking."""
+        version = self._version()
+        start = time.perf_counter()
+        meta = self._read_meta() if self.use_files else None
+        if meta is not None and meta.get("source_version") == self._version_key(version):
+            columns, row_count, source = self._map_files(meta), meta["rows"], "column files"
+        else:
+            columns, row_count = self._read_source()
+            source = "SQLite"
+            if self.use_files:
+                self._write_files(columns, row_count, version)
+                # Serve from the memory-mapped files so the arrays can be paged out
+                columns = self._map_files(self._read_meta())
+        with self._lock:
+            self.columns = columns
+            self.row_count = row_count
+            self._source_version = version
+        logging.info(f"Column store loaded {row_count} rows from {source} in {time.perf_counter() - start:.2f}s")
+
+    def _load_in_background(self):
+        try:
+            self.load()
+        except Exception as e:
+            logging.error(f"Loading the column store failed: {e}")
+        finally:
+            self._loading = False
+
+    def ensure_fresh(self):
+        """Return True when the store matches the database; otherwise start a reload and return False."""
+        if self._source_version is not None and self._version() == self._source_version:
+            return True
+        with self._lock:
+            if not self._loading:
+                self._loading = True
+                threading.Thread(target=self._load_in_background, name="column-store-load", daemon=True).start()
+        return False
+
+    def query(self, sql_query):
+        """Plan and evaluate a query: (column_names, selected, batch function). Raises NotSupported."""
+        with self._lock:
+            columns = self.columns
+        if columns is None:
+            raise NotSupported("column store not loaded")
+        return ColumnarQuery(self, columns, sql_query).execute()
+
+    def _fallback(self, error, sql_query):
+        self.fallbacks += 1
+        logging.info(f"Column store fallback ({error}): {sql_query}")
+
+    def execute(self, sql_query):
+        """(rows, column_names), or None when SQLite should answer. Blocking."""
+        try:
+            labels, selected, batch_vectors = self.query(sql_query)
+            # Projections are evaluated here, lazily, and can still turn out unsupported
+            rows = list(LazyBatch(batch_vectors, selected))
+        except NotSupported as e:
+            self._fallback(e, sql_query)
+            return None
+        self.answered += 1
+        return rows, labels
+
+    def execute_formatted(self, sql_query, formatter):
+        """Text produced by formatter, or None when SQLite should answer. Blocking."""
+        try:
+            labels, selected, batch_vectors = self.query(sql_query)
+            batches = (LazyBatch(batch_vectors, selected[start:start + formatter.batch_size])
+                       for start in range(0, len(selected), formatter.batch_size))
+            # Projections are evaluated batch by batch while formatting, e.g. a division
+            # by zero is only found there; the partial text is dropped
+            text = formatter.write(labels, batches)
+        except NotSupported as e:
+            self._fallback(e, sql_query)
+            return None
+        self.answered += 1
+        return text
+
+    async def run(self, sql_query):
+        if not self.ensure_fresh():
+            return None
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self.execute, sql_query)
+
+    async def run_formatted(self, sql_query, formatter):
+        if not self.ensure_fresh():
+            return None
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self.execute_formatted, sql_query, formatter)
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_column_store():
+    """Process-wide column store configured from COLUMNAR_USE_FILES, or None without numpy."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            if np is None:
+                logging.warning("DB_BACKEND=columnar needs numpy; falling back to SQLite")
+                return None
+            _store = ColumnStore(sqlite_db_path(), use_files=env_bool('COLUMNAR_USE_FILES', True))
+    return _store
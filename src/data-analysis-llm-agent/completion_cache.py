@@ -0,0 +1,306 @@
+"""
+Cache of model completions for ChatBot.execute.
+
+Onboarding questions ("how many machines failed", "failure by type") repeat
+across users; with LLM_CACHE_ENABLED the assistant message for a given request
+(model, prompt, tools) is reused instead of calling Groq again. Entries live in
+an in-memory LRU with a TTL and, with LLM_CACHE_PATH, in a SQLite file shared
+by restarts and workers. Identical requests arriving while the first one is
+still running wait for it instead of making their own upstream call.
+
+Only the model's message is cached: tool calls in a cached message still run,
+and the follow-up completion is keyed on their fresh results.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from config import env_bool, env_float, env_int, env_str
+
+
+def normalize_text(text, question=False):
+    text = re.sub(r"\s+", " ", str(text or "")).strip()
+    # "How many machines failed?" and "How many machines failed" ask the same thing. Case is kept:
+    # values in a question (Product ID M14860, Type L) end up as SQL literals in the tool calls
+    return text.rstrip("?.! ") if question else text
+
+
+def normalize_messages(messages):
+    """
+    Request messages reduced to what determines the model's answer.
+
+    Whitespace is collapsed, user text loses its trailing punctuation (case is
+    kept) and tool call ids (random per call) are dropped; tool arguments
+    are re-serialized with sorted keys.
+    """
+    normalized = []
+    for message in messages:
+        role = message.get("role")
+        item = {"role": role, "content": normalize_text(message.get("content"), question=role == "user")}
+        if message.get("tool_calls"):
+            calls = []
+            for tool_call in message["tool_calls"]:
+                arguments = tool_call["function"]["arguments"]
+                try:
+                    arguments = json.dumps(json.loads(arguments), sort_keys=True)
+                except (TypeError, ValueError):
+                    pass
+                calls.append([tool_call["function"]["name"], arguments])
+            item["tool_calls"] = calls
+        if role == "tool":
+            item["name"] = message.get("name")
+        normalized.append(item)
+    return normalized
+
+
+def recent_messages(messages, turns):
+    """System messages plus the messages of the last `turns` user turns (all messages when turns is 0)."""
+    if not turns:
+        return messages
+    starts = [i for i, message in enumerate(messages) if message.get("role") == "user"]
+    if len(starts) <= turns:
+        return messages
+    first = starts[-turns]
+    return [message for message in messages[:first] if message.get("role") == "system"] + messages[first:]
+
+
+def completion_key(model, messages, tools=None, context_turns=0):
+    """
+    Hash of (model, normalized recent messages including the system prompt, tools schema).
+
+    With context_turns > 0 only the last context_turns user turns are part of the
+    key, so a question gets the same answer whatever was asked before it; that is
+    wrong for follow-ups that refer back ("same by type"), hence 0 (the whole
+    prompt) by default.
+    """
+    messages = recent_messages(messages, context_turns)
+    payload = json.dumps([model, normalize_messages(messages), tools], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class CompletionStore:
+    """
+    SQLite table of cached completions, shared across processes and restarts.
+
+    Parameters:
+    path (str): SQLite file; created if missing.
+    max_entries (int): Rows kept; the least recently used are pruned on write.
+    """
+
+    def __init__(self, path, max_entries=10000):
+        self.path = path
+        self.max_entries = max_entries
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode = WAL")
+        self._connection.execute("PRAGMA synchronous = NORMAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS completions ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, created_at REAL NOT NULL, "
+            "used_at REAL NOT NULL, cost_s REAL NOT NULL)"
+        )
+        self._connection.execute("CREATE INDEX IF NOT EXISTS completions_used_at ON completions (used_at)")
+        self._lock = threading.Lock()
+
+    def get(self, key, ttl_s=None):
+        """Return (value, cost_s) or None; expired rows are deleted."""
+        now = time.time()
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT value, created_at, cost_s FROM completions WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if ttl_s is not None and now - row[1] > ttl_s:
+                self._connection.execute("DELETE FROM completions WHERE key = ?", (key,))
+                return None
+            self._connection.execute("UPDATE completions SET used_at = ? WHERE key = ?", (now, key))
+        return json.loads(row[0]), row[2]
+
+    def put(self, key, value, cost_s=0.0):
+        now = time.time()
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO completions (key, value, created_at, used_at, cost_s) VALUES (?, ?, ?, ?, ?)",
+                (key, json.dumps(value), now, now, cost_s),
+            )
+            self._connection.execute(
+                "DELETE FROM completions WHERE key IN "
+                "(SELECT key FROM completions ORDER BY used_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+
+class CompletionCache:
+    """
+    LRU/TTL cache of completions with in-flight request coalescing.
+
+    Values are JSON-serializable (the assistant message as a dict). Lookups go
+    to memory first, then to the optional store; hits found in the store are
+    promoted to memory.
+
+    Parameters:
+    max_entries (int): Completions kept in memory.
+    ttl_s (float): Seconds a completion stays valid; None disables expiry.
+    store (CompletionStore, optional): Persistent second tier.
+    """
+
+    def __init__(self, max_entries=512, ttl_s=3600.0, store=None):
+        self.max_entries = max_entries
+        self.ttl_s = ttl_s
+        self.store = store
+        self._entries = OrderedDict()  # key -> (value, created_at, cost_s)
+        self._inflight = {}  # key -> future of the upstream call
+        self.hits = 0
+        self.store_hits = 0
+        self.coalesced = 0
+        self.misses = 0
+        self.evictions = 0
+        self.saved_s = 0.0
+
+    def _get_memory(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if self.ttl_s is not None and time.monotonic() - entry[1] > self.ttl_s:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def _put_memory(self, key, value, cost_s):
+        self._entries[key] = (value, time.monotonic(), cost_s)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    async def get(self, key):
+        """Return (value, cost_s, 'memory' or 'store'), or None."""
+        entry = self._get_memory(key)
+        if entry is not None:
+            self.hits += 1
+            return entry[0], entry[2], "memory"
+        if self.store is not None:
+            loop = asyncio.get_running_loop()
+            found = await loop.run_in_executor(None, self.store.get, key, self.ttl_s)
+            if found is not None:
+                self.store_hits += 1
+                # The remaining TTL is not tracked across tiers: a promoted entry gets a fresh one
+                self._put_memory(key, found[0], found[1])
+                return found[0], found[1], "store"
+        return None
+
+    async def put(self, key, value, cost_s=0.0):
+        self._put_memory(key, value, cost_s)
+        if self.store is not None:
+            loop = asyncio.get_running_loop()
+            try:
+                await loop.run_in_executor(None, self.store.put, key, value, cost_s)
+            except sqlite3.Error as error:
+                logging.warning(f"Completion cache store write failed: {error}")
+
+    async def get_or_create(self, key, create):
+        """
+        Return (value, source) for key, calling create() on a miss.
+
+        source is 'memory' or 'store' for cached values, 'coalesced' when the value
+        came from an identical request that was already running, and 'miss' when
+        create() was called. If the request being waited on is cancelled, the
+        waiter makes its own call; its errors are raised to every waiter.
+        """
+        found = await self.get(key)
+        if found is not None:
+            value, cost_s, source = found
+            self._record_hit(source, cost_s)
+            return value, source
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            try:
+                value, cost_s = await asyncio.shield(inflight)
+            except asyncio.CancelledError:
+                if not inflight.cancelled():
+                    raise
+            else:
+                self.coalesced += 1
+                self._record_hit("coalesced", cost_s)
+                return value, "coalesced"
+
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        start = time.perf_counter()
+        try:
+            value = await create()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as error:
+            future.set_exception(error)
+            future.exception()  # retrieved here; waiters re-raise it
+            raise
+        finally:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+        cost_s = time.perf_counter() - start
+        future.set_result((value, cost_s))
+        await self.put(key, value, cost_s)
+        self._log_stats()
+        return value, "miss"
+
+    def _record_hit(self, source, cost_s):
+        self.saved_s += cost_s
+        logging.info(f"Completion cache hit ({source}): saved {cost_s:.2f}s")
+        self._log_stats()
+
+    def _log_stats(self):
+        if self.lookups() % 20 == 0:
+            logging.info(f"Completion cache stats: {self.stats()}")
+
+    def lookups(self):
+        return self.hits + self.store_hits + self.coalesced + self.misses
+
+    def stats(self):
+        lookups = self.lookups()
+        return {
+            "hits": self.hits,
+            "store_hits": self.store_hits,
+            "coalesced": self.coalesced,
+            "misses": self.misses,
+            "hit_rate": (lookups - self.misses) / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "entries": len(self._entries),
+            "saved_s": self.saved_s,
+        }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_completion_cache():
+    """Process-wide completion cache, or None unless LLM_CACHE_ENABLED is set."""
+    global _cache
+    if not env_bool('LLM_CACHE_ENABLED', False):
+        return None
+    with _cache_lock:
+        if _cache is None:
+            path = env_str('LLM_CACHE_PATH')
+            store = CompletionStore(path, max_entries=env_int('LLM_CACHE_STORE_MAX_ENTRIES', 10000)) if path else None
+            ttl_s = env_float('LLM_CACHE_TTL_S', 3600.0)
+            _cache = CompletionCache(
+                max_entries=env_int('LLM_CACHE_MAX_ENTRIES', 512),
+                ttl_s=ttl_s if ttl_s > 0 else None,
+                store=store,
+            )
+        return _cache
@@ -0,0 +1,39 @@
+import os
+
+# Settings are read from the environment at call time (not import time) so that
+# values loaded later by load_dotenv("../.env") in app.py are still picked up.
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_DB_PATH = os.path.join(BASE_DIR, '../data/ai4i2020.db')
+
+
+def env_str(name, default=None):
+    value = os.getenv(name)
+    if value is None or value == '':
+        return default
+    return value
+
+
+def env_int(name, default):
+    value = os.getenv(name)
+    if value is None or value == '':
+        return default
+    return int(value)
+
+
+def env_float(name, default):
+    value = os.getenv(name)
+    if value is None or value == '':
+        return default
+    return float(value)
+
+
+def env_bool(name, default=False):
+    value = os.getenv(name)
+    if value is None or value == '':
+        return default
+    return value.strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+def sqlite_db_path():
+    return env_str('SQLITE_DB_PATH', DEFAULT_DB_PATH)
@@ -0,0 +1,189 @@
+import asyncio
+import contextvars
+import os
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from urllib.parse import quote
+
+from config import env_bool, env_int, sqlite_db_path
+
+# time.monotonic() deadline for queries issued from the current task, set by the tool executor
+query_deadline = contextvars.ContextVar('query_deadline', default=None)
+
+# SQLite virtual machine instructions between progress handler checks
+PROGRESS_HANDLER_STEPS = 10000
+
+
+class SQLitePool:
+    """
+    Fixed-size pool of read-only SQLite connections shared by all chat sessions.
+
+    Queries run on a dedicated worker thread pool so a slow aggregate in one
+    session does not block the Chainlit event loop for the others.
+
+    Parameters:
+    db_path (str): Path to the SQLite database file.
+    size (int): Maximum number of open connections (and worker threads).
+    immutable (bool): Open with immutable=1. Only safe when nothing writes to the file.
+    mmap_size (int): Bytes of the database file SQLite may memory-map.
+    cache_size_kb (int): Page cache size per connection in KiB.
+    """
+
+    def __init__(self, db_path, size=4, immutable=False, mmap_size=256 * 1024 * 1024, cache_size_kb=64 * 1024):
+        self.db_path = os.path.abspath(db_path)
+        self.size = size
+        self.immutable = immutable
+        self.mmap_size = mmap_size
+        self.cache_size_kb = cache_size_kb
+        self._idle = queue.LifoQueue()
+        self._opened = 0
+        self._lock = threading.Lock()
+        self._closed = False
+        self._executor = ThreadPoolExecutor(max_workers=size, thread_name_prefix="sqlite-pool")
+
+    def _uri(self):
+        uri = f"file:{quote(self.db_path)}?mode=ro"
+        if self.immutable:
+            uri += "&immutable=1"
+        return uri
+
+    def _connect(self):
+        connection = sqlite3.connect(self._uri(), uri=True, check_same_thread=False)
+        connection.execute("PRAGMA query_only = ON")
+        connection.execute(f"PRAGMA mmap_size = {int(self.mmap_size)}")
+        # Negative cache_size is interpreted by SQLite as KiB rather than pages
+        connection.execute(f"PRAGMA cache_size = {-int(self.cache_size_kb)}")
+        connection.execute("PRAGMA temp_store = MEMORY")
+        return connection
+
+    @contextmanager
+    def connection(self):
+        """Borrow a connection, opening a new one if the pool is not yet full."""
+        if self._closed:
+            raise sqlite3.ProgrammingError("SQLite pool is closed")
+
+        connection = None
+        try:
+            connection = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                if self._opened < self.size:
+                    self._opened += 1
+                    try:
+                        connection = self._connect()
+                    except Exception:
+                        self._opened -= 1
+                        raise
+            if connection is None:
+                connection = self._idle.get()
+
+        try:
+            yield connection
+        finally:
+            if self._closed:
+                connection.close()
+            else:
+                self._idle.put(connection)
+
+    @contextmanager
+    def _interruptible(self, connection, deadline, cancelled):
+        if deadline is None and cancelled is None:
+            yield
+            return
+
+        def should_interrupt():
+            # A non-zero return aborts the statement with "interrupted"
+            return (cancelled is not None and cancelled.is_set()) or (deadline is not None and time.monotonic() > deadline)
+
+        connection.set_progress_handler(should_interrupt, PROGRESS_HANDLER_STEPS)
+        try:
+            yield
+        finally:
+            connection.set_progress_handler(None, 0)
+
+    def execute(self, sql_query, params=(), deadline=None, cancelled=None):
+        """
+        Run a query on a pooled connection and return (rows, column_names). Blocking.
+
+        The query is interrupted once time.monotonic() passes deadline or the
+        cancelled event is set.
+        """
+        with self.connection() as connection, self._interruptible(connection, deadline, cancelled):
+            cursor = connection.cursor()
+            try:
+                cursor.execute(sql_query, params)
+                column_names = [desc[0] for desc in cursor.description] if cursor.description else []
+                result = cursor.fetchall()
+            finally:
+                cursor.close()
+        return result, column_names
+
+    def execute_formatted(self, sql_query, formatter, params=(), deadline=None, cancelled=None):
+        """Run a query and stream its rows straight into formatter (see formatting.ResultFormatter). Blocking."""
+        with self.connection() as connection, self._interruptible(connection, deadline, cancelled):
+            cursor = connection.cursor()
+            try:
+                cursor.execute(sql_query, params)
+                return formatter.write_cursor(cursor)
+            finally:
+                cursor.close()
+
+    async def _run_in_worker(self, function, *args):
+        # If the awaiting task is cancelled (timeout, aborted turn) the worker thread
+        # keeps going, so signal it to interrupt the statement.
+        cancelled = threading.Event()
+        loop = asyncio.get_running_loop()
+        try:
+            return await loop.run_in_executor(self._executor, function, *args, query_deadline.get(), cancelled)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    async def run(self, sql_query, params=()):
+        """Run a query on the worker thread pool without blocking the event loop."""
+        return await self._run_in_worker(self.execute, sql_query, params)
+
+    async def run_formatted(self, sql_query, formatter, params=()):
+        """Like run(), but returns the text produced by formatter."""
+        return await self._run_in_worker(self.execute_formatted, sql_query, formatter, params)
+
+    def close(self):
+        self._closed = True
+        self._executor.shutdown(wait=True)
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_sqlite_pool():
+    """Return the process-wide pool, configured from SQLITE_* environment variables."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = SQLitePool(
+                    sqlite_db_path(),
+                    size=env_int('SQLITE_POOL_SIZE', 4),
+                    immutable=env_bool('SQLITE_IMMUTABLE', False),
+                    mmap_size=env_int('SQLITE_MMAP_SIZE', 256 * 1024 * 1024),
+                    cache_size_kb=env_int('SQLITE_CACHE_SIZE_KB', 64 * 1024),
+                )
+    return _pool
+
+
+def close_sqlite_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None
@@ -0,0 +1,145 @@
+import asyncio
+import logging
+import threading
+import time
+from collections import defaultdict
+
+from config import env_float, env_int
+from db_pool import query_deadline
+from metrics import TOOL_QUEUE_SECONDS
+from tracing import annotate
+
+
+# Extra time after a tool's timeout before a still-running SQLite query is interrupted
+DEADLINE_GRACE_S = 1.0
+
+
+class ToolTimeoutError(Exception):
+    pass
+
+
+class ToolExecutor:
+    """
+    Runs tool calls with per-tool timeouts and global/per-session concurrency caps.
+
+    The timeout deadline is published through db_pool.query_deadline so a SQLite
+    query still running on a worker thread is interrupted by its progress handler
+    instead of running on after the caller gave up. Queue time (waiting for a
+    concurrency slot) and run time are recorded per tool.
+
+    Parameters:
+    max_concurrency (int): Tool calls running at once across all sessions.
+    per_session (int): Tool calls running at once within one session.
+    timeouts (dict): Seconds allowed per tool name.
+    default_timeout (float): Seconds allowed for tools not listed in timeouts.
+    """
+
+    def __init__(self, max_concurrency=16, per_session=4, timeouts=None, default_timeout=30.0):
+        self.max_concurrency = max_concurrency
+        self.per_session = per_session
+        self.timeouts = timeouts or {}
+        self.default_timeout = default_timeout
+        self._semaphore = None
+        self.active = 0  # tool calls holding a concurrency slot
+        self._stats = defaultdict(lambda: {"calls": 0, "queue_s": 0.0, "run_s": 0.0, "max_run_s": 0.0, "outcomes": defaultdict(int)})
+        self._stats_lock = threading.Lock()
+
+    def _global_semaphore(self):
+        # Created lazily so it binds to the running event loop
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+
+    def session(self):
+        return ToolSession(self)
+
+    def timeout_for(self, name):
+        return self.timeouts.get(name, self.default_timeout)
+
+    def record(self, name, queue_s, run_s, outcome):
+        with self._stats_lock:
+            stats = self._stats[name]
+            stats["calls"] += 1
+            stats["queue_s"] += queue_s
+            stats["run_s"] += run_s
+            stats["max_run_s"] = max(stats["max_run_s"], run_s)
+            stats["outcomes"][outcome] += 1
+        TOOL_QUEUE_SECONDS.observe(queue_s, tool=name)
+        logging.info(f"Tool {name}: queued {queue_s:.3f}s, ran {run_s:.3f}s ({outcome})")
+
+    def stats(self):
+        with self._stats_lock:
+            return {
+                name: {**stats, "outcomes": dict(stats["outcomes"])}
+                for name, stats in self._stats.items()
+            }
+
+
+class ToolSession:
+    """Per-chat-session view of a ToolExecutor that can cancel its in-flight calls."""
+
+    def __init__(self, executor):
+        self.executor = executor
+        self._semaphore = None
+        self._tasks = set()
+
+    async def run(self, name, function, kwargs):
+        """Run function(**kwargs) under the caps; raises ToolTimeoutError past the tool's timeout."""
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.executor.per_session)
+        task = asyncio.current_task()
+        self._tasks.add(task)
+        enqueued = time.perf_counter()
+        started = None
+        outcome = "error"
+        try:
+            async with self._semaphore, self.executor._global_semaphore():
+                started = time.perf_counter()
+                timeout = self.executor.timeout_for(name)
+                # Cancellation on timeout interrupts the query; the deadline is a backstop
+                token = query_deadline.set(time.monotonic() + timeout + DEADLINE_GRACE_S)
+                self.executor.active += 1
+                try:
+                    result = await asyncio.wait_for(function(**kwargs), timeout=timeout)
+                except asyncio.TimeoutError:
+                    outcome = "timeout"
+                    raise ToolTimeoutError(f"{name} timed out after {timeout:g}s")
+                finally:
+                    self.executor.active -= 1
+                    query_deadline.reset(token)
+                outcome = "ok"
+                return result
+        except asyncio.CancelledError:
+            outcome = "cancelled"
+            raise
+        finally:
+            self._tasks.discard(task)
+            now = time.perf_counter()
+            queue_s = (started or now) - enqueued
+            run_s = now - started if started else 0.0
+            annotate(queue_s=queue_s, outcome=outcome)
+            self.executor.record(name, queue_s, run_s, outcome)
+
+    def cancel_all(self):
+        """Cancel every tool call of this session that is still queued or running."""
+        for task in list(self._tasks):
+            task.cancel()
+
+
+_executor = None
+
+
+def get_tool_executor():
+    """Process-wide executor configured from the TOOL_* environment variables."""
+    global _executor
+    if _executor is None:
+        _executor = ToolExecutor(
+            max_concurrency=env_int('TOOL_MAX_CONCURRENCY', 16),
+            per_session=env_int('TOOL_MAX_CONCURRENCY_PER_SESSION', 4),
+            timeouts={
+                "query_db": env_float('TOOL_TIMEOUT_QUERY_DB_S', 30.0),
+                "plot_chart": env_float('TOOL_TIMEOUT_PLOT_CHART_S', 15.0),
+            },
+            default_timeout=env_float('TOOL_TIMEOUT_S', 30.0),
+        )
+    return _executor
@@ -0,0 +1,177 @@
+import csv
+import io
+import json
+import re
+
+from config import env_int, env_str
+
+FORMATS = ("markdown", "csv", "json")
+
+
+def iter_cursor(cursor, batch_size=500):
+    """Yield batches of rows from a DB-API cursor with fetchmany."""
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            break
+        yield rows
+
+
+def iter_batches(rows, batch_size=500):
+    """Yield batches from an in-memory list of rows."""
+    for start in range(0, len(rows), batch_size):
+        yield rows[start:start + batch_size]
+
+
+def _markdown_cell(value):
+    return str(value).replace('|', '\\|').replace('\n', ' ')
+
+
+def _markdown_cells(line):
+    cells = re.split(r"(?<!\\)\|", line.strip()[1:-1])
+    return [cell.strip().replace('\\|', '|') for cell in cells]
+
+
+class ResultFormatter:
+    """
+    Streams a query result into markdown, CSV or JSON text.
+
+    Rows are pulled batch by batch and written straight into one output buffer,
+    so formatting is linear in the output size and memory stays flat however
+    large the result is. Output stops at max_rows rows or max_bytes characters,
+    whichever comes first, and a "truncated: N more rows" footer is appended.
+
+    Parameters:
+    fmt (str): 'markdown', 'csv' or 'json'.
+    max_rows (int, optional): Maximum rows written; None for no limit.
+    max_bytes (int, optional): Approximate cap on output size; None for no limit.
+    count_remaining (bool): Keep reading past the limit to report how many rows were cut.
+    batch_size (int): Rows per fetchmany call.
+    """
+
+    def __init__(self, fmt="markdown", max_rows=100, max_bytes=16000, count_remaining=True, batch_size=500):
+        if fmt not in FORMATS:
+            raise ValueError(f"Unknown result format {fmt!r}, expected one of {', '.join(FORMATS)}.")
+        self.fmt = fmt
+        self.max_rows = max_rows
+        self.max_bytes = max_bytes
+        self.count_remaining = count_remaining
+        self.batch_size = batch_size
+
+    def signature(self):
+        """Identifies the output shape, e.g. as part of a cache key."""
+        return f"{self.fmt}:{self.max_rows}:{self.max_bytes}"
+
+    def write_cursor(self, cursor):
+        column_names = [desc[0] for desc in cursor.description] if cursor.description else []
+        return self.write(column_names, iter_cursor(cursor, self.batch_size))
+
+    def write_rows(self, column_names, rows):
+        return self.write(column_names, iter_batches(rows, self.batch_size))
+
+    def write(self, column_names, batches):
+        out = io.StringIO()
+        row_writer = self._begin(out, column_names)
+        written = 0
+        remaining = 0
+        batches = iter(batches)
+        for batch in batches:
+            for i, row in enumerate(batch):
+                if self.max_rows is not None and written >= self.max_rows:
+                    remaining = len(batch) - i
+                    break
+                position = out.tell()
+                row_writer(row, written)
+                if self.max_bytes is not None and out.tell() > self.max_bytes and written > 0:
+                    # Drop the row that crossed the limit
+                    out.seek(position)
+                    out.truncate()
+                    remaining = len(batch) - i
+                    break
+                written += 1
+            if remaining:
+                break
+
+        if remaining and self.count_remaining:
+            remaining += sum(len(batch) for batch in batches)
+        elif remaining:
+            remaining = None  # known to be truncated, count not computed
+        self._end(out, written, remaining)
+        return out.getvalue()
+
+    def _begin(self, out, column_names):
+        if self.fmt == "markdown":
+            out.write("| " + " | ".join(_markdown_cell(c) for c in column_names) + " |\n")
+            out.write("| " + " | ".join(["---"] * len(column_names)) + " |\n")
+            return lambda row, i: out.write("| " + " | ".join(_markdown_cell(v) for v in row) + " |\n")
+        if self.fmt == "csv":
+            writer = csv.writer(out, lineterminator="\n")
+            writer.writerow(column_names)
+            return lambda row, i: writer.writerow(row)
+
+        out.write('{"columns": ' + json.dumps(column_names, default=str) + ', "data": [')
+
+        def write_json_row(row, i):
+            out.write((", " if i else "") + json.dumps(list(row), default=str))
+        return write_json_row
+
+    def _end(self, out, written, remaining):
+        if self.fmt == "json":
+            out.write("]")
+            if remaining is None or remaining:
+                out.write(', "truncated": ' + json.dumps(remaining if remaining is not None else True))
+            out.write("}")
+            return
+        if remaining is None:
+            out.write(f"\ntruncated: more rows not shown ({written} shown)\n")
+        elif remaining:
+            out.write(f"\ntruncated: {remaining} more rows ({written} shown)\n")
+
+
+def parse_result(text, fmt="markdown"):
+    """
+    Read back text written by ResultFormatter in fmt.
+
+    Returns:
+    tuple: (column_names, rows, remaining) with cell values as strings
+    (markdown, csv) or JSON values, and remaining the number of rows cut by
+    the truncation footer (0 when complete, None when the count is unknown);
+    None when text is not a formatted result (e.g. an error message).
+    """
+    if fmt == "json":
+        try:
+            data = json.loads(text)
+        except ValueError:
+            return None
+        if not isinstance(data, dict) or "columns" not in data:
+            return None
+        remaining = data.get("truncated", 0)
+        return data["columns"], data.get("data", []), None if remaining is True else remaining
+
+    body, _, footer = text.partition("\ntruncated: ")
+    remaining = 0
+    if footer:
+        count = footer.split(" ", 1)[0]
+        remaining = int(count) if count.isdigit() else None
+    if fmt == "markdown":
+        lines = [line for line in body.split("\n") if line.startswith("|")]
+        if len(lines) < 2 or not set(lines[1].replace("|", "").split()) <= {"---"}:
+            return None
+        return _markdown_cells(lines[0]), [_markdown_cells(line) for line in lines[2:]], remaining
+    if fmt == "csv":
+        rows = [row for row in csv.reader(io.StringIO(body)) if row]
+        if not rows:
+            return None
+        return rows[0], rows[1:], remaining
+    return None
+
+
+def formatter_from_env():
+    """ResultFormatter configured from the RESULT_* environment variables."""
+    max_rows = env_int('RESULT_MAX_ROWS', 100)
+    max_bytes = env_int('RESULT_MAX_BYTES', 16000)
+    return ResultFormatter(
+        fmt=env_str('RESULT_FORMAT', 'markdown'),
+        max_rows=max_rows if max_rows > 0 else None,
+        max_bytes=max_bytes if max_bytes > 0 else None,
+    )
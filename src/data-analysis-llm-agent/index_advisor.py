@@ -0,0 +1,587 @@
+"""
+Index advisor for the SQLite backend.
+
+Every statement query_db runs against the source table is logged with its
+timing and EXPLAIN QUERY PLAN. From that workload the advisor suggests covering
+or partial indexes for queries that scan the whole table and, in admin mode,
+creates them and reports before/after latency of the queries they serve.
+
+    python index_advisor.py --log query_log.jsonl            # print suggestions
+    python index_advisor.py --log query_log.jsonl --apply    # create them (admin)
+"""
+import argparse
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote
+
+from config import env_bool, env_int, env_str, sqlite_db_path
+from query_cache import canonicalize_sql, normalize_identifier, tokenize_sql
+
+# Columns per index; wider covering indexes cost more to maintain than they save
+MAX_INDEX_COLUMNS = 6
+# An equality predicate becomes a partial index WHERE when it matches at most this fraction of rows
+PARTIAL_MAX_FRACTION = 0.1
+
+EQUALITY_OPS = {"=", "=="}
+RANGE_OPS = {"<", ">", "<=", ">="}
+CLAUSE_KEYWORDS = {"from", "where", "group", "order", "having", "limit"}
+
+
+def quote_identifier(name):
+    return '"' + name.replace('"', '""') + '"'
+
+
+class Predicate:
+    def __init__(self, column, kind, literal=None):
+        self.column = column    # column name as declared in the table
+        self.kind = kind        # 'eq' or 'range'
+        self.literal = literal  # literal text of `column = literal` terms, None otherwise
+
+    def sql(self):
+        return f"{quote_identifier(self.column)} = {self.literal}"
+
+
+class QueryShape:
+    """Columns a single-table query filters, groups, orders on and references."""
+
+    def __init__(self, predicates, group_by, order_by, referenced):
+        self.predicates = predicates
+        self.group_by = group_by
+        self.order_by = order_by
+        self.referenced = referenced
+
+
+def _tokens(sql_query):
+    tokens = []
+    for kind, text in tokenize_sql(sql_query):
+        if kind == "word":
+            tokens.append((kind, text.lower(), text))
+        elif kind == "qident":
+            tokens.append((kind, normalize_identifier(text).strip('"'), text))
+        else:
+            tokens.append((kind, text, text))
+    return tokens
+
+
+def _split(tokens, separator):
+    parts, current, depth = [], [], 0
+    for token in tokens:
+        if token[1] == "(":
+            depth += 1
+        elif token[1] == ")":
+            depth -= 1
+        if depth == 0 and token[1] == separator and token[0] != "string":
+            parts.append(current)
+            current = []
+        else:
+            current.append(token)
+    parts.append(current)
+    return parts
+
+
+def _top_level(tokens):
+    depth = 0
+    for token in tokens:
+        if token[1] == "(":
+            depth += 1
+        elif token[1] == ")":
+            depth -= 1
+        elif depth == 0:
+            yield token
+
+
+def _is_literal(tokens):
+    if len(tokens) == 1:
+        return tokens[0][0] in ("number", "string")
+    return len(tokens) == 2 and tokens[0][1] == "-" and tokens[1][0] == "number"
+
+
+def parse_query(sql_query, table, columns):
+    """
+    Describe a single-table SELECT on `table`, or return None for anything else
+    (joins, subqueries, other tables).
+
+    columns maps lower-cased column names to their declared names.
+    """
+    tokens = _tokens(sql_query)
+    while tokens and tokens[-1][1] == ";":
+        tokens.pop()
+    if not tokens or tokens[0][1] != "select":
+        return None
+    if any(t[0] == "word" and t[1] in ("join", "union", "intersect", "except") for t in tokens):
+        return None
+    if sum(t[0] == "word" and t[1] == "select" for t in tokens) > 1:
+        return None
+
+    # Drop alias qualifiers (t.col -> col)
+    unqualified = []
+    i = 0
+    while i < len(tokens):
+        if i + 2 < len(tokens) and tokens[i + 1][1] == "." and tokens[i][0] in ("word", "qident"):
+            i += 2
+            continue
+        unqualified.append(tokens[i])
+        i += 1
+    tokens = unqualified
+
+    # Top-level clause boundaries
+    clauses, current, depth = {}, "select", 0
+    for i, token in enumerate(tokens):
+        if token[1] == "(":
+            depth += 1
+        elif token[1] == ")":
+            depth -= 1
+        if depth == 0 and token[0] == "word" and token[1] in CLAUSE_KEYWORDS:
+            current = token[1]
+            clauses.setdefault(current, [])
+            continue
+        if token[0] == "word" and token[1] == "by" and current in ("group", "order") and not clauses[current]:
+            continue
+        clauses.setdefault(current, []).append(token)
+
+    source = clauses.get("from", [])
+    if not source or source[0][1] != table or len(source) > 3:
+        return None
+
+    def column(token):
+        if token[0] in ("word", "qident"):
+            return columns.get(token[1])
+        return None
+
+    predicates = []
+    where = clauses.get("where", [])
+    if where and not any(t[0] == "word" and t[1] == "or" for t in _top_level(where)):
+        # Split on top-level AND, keeping BETWEEN x AND y together
+        terms, term, depth = [], [], 0
+        for token in where:
+            if token[1] == "(":
+                depth += 1
+            elif token[1] == ")":
+                depth -= 1
+            if depth == 0 and token[0] == "word" and token[1] == "and" and not (
+                    any(t[1] == "between" for t in term) and sum(t[1] == "and" for t in term) == 0):
+                terms.append(term)
+                term = []
+            else:
+                term.append(token)
+        terms.append(term)
+        for term in terms:
+            if not term:
+                continue
+            name = column(term[0])
+            if name is not None and len(term) >= 3 and term[1][1] in EQUALITY_OPS and _is_literal(term[2:]):
+                predicates.append(Predicate(name, "eq", " ".join(t[2] for t in term[2:]).replace("- ", "-")))
+            elif name is not None and len(term) >= 3 and term[1][1] in RANGE_OPS and _is_literal(term[2:]):
+                predicates.append(Predicate(name, "range"))
+            elif name is not None and len(term) >= 3 and term[1][1] == "in" and term[2][1] == "(":
+                predicates.append(Predicate(name, "eq"))
+            elif name is not None and len(term) >= 5 and term[1][1] == "between":
+                predicates.append(Predicate(name, "range"))
+            elif name is not None and [t[1] for t in term[1:]] == ["is", "null"]:
+                predicates.append(Predicate(name, "eq"))
+            elif len(term) >= 3 and column(term[-1]) is not None and term[-2][1] in EQUALITY_OPS | RANGE_OPS and _is_literal(term[:-2]):
+                kind = "eq" if term[-2][1] in EQUALITY_OPS else "range"
+                predicates.append(Predicate(column(term[-1]), kind))
+
+    def bare_columns(clause):
+        names = []
+        for item in _split(clause, ","):
+            if item and item[-1][1] in ("asc", "desc"):
+                item = item[:-1]
+            if len(item) != 1 or column(item[0]) is None:
+                return []
+            names.append(column(item[0]))
+        return names
+
+    referenced = []
+    for token in tokens:
+        name = column(token)
+        if name is not None and name not in referenced:
+            referenced.append(name)
+    if any(t[1] == "*" and i > 0 and tokens[i - 1][1] in ("select", ",") for i, t in enumerate(tokens)):
+        referenced = list(columns.values())
+
+    return QueryShape(predicates, bare_columns(clauses.get("group", [])), bare_columns(clauses.get("order", [])), referenced)
+
+
+class QueryStats:
+    def __init__(self, sql_query):
+        self.sql_query = sql_query  # first statement seen with this canonical form
+        self.count = 0
+        self.total_s = 0.0
+        self.max_s = 0.0
+        self.plan = None
+
+
+class IndexSuggestion:
+    def __init__(self, table, columns, where, covering):
+        self.table = table
+        self.columns = columns
+        self.where = where        # partial index predicates (SQL text), [] for a full index
+        self.covering = covering
+        self.queries = []         # QueryStats served by the index
+
+    @property
+    def name(self):
+        digest = hashlib.sha1(repr((self.table, self.columns, self.where)).encode()).hexdigest()[:10]
+        return f"idx_advisor_{digest}"
+
+    @property
+    def total_s(self):
+        return sum(stats.total_s for stats in self.queries)
+
+    def ddl(self):
+        sql_query = (f"CREATE INDEX IF NOT EXISTS {self.name} ON {quote_identifier(self.table)}"
+                     f"({', '.join(quote_identifier(c) for c in self.columns)})")
+        if self.where:
+            sql_query += " WHERE " + " AND ".join(self.where)
+        return sql_query
+
+    def describe(self):
+        kind = "covering " if self.covering else ""
+        kind += "partial index" if self.where else "index"
+        return (f"{kind} {self.name} on ({', '.join(self.columns)})"
+                + (f" where {' and '.join(self.where)}" if self.where else "")
+                + f": {len(self.queries)} queries, {self.total_s * 1000:.1f}ms observed")
+
+
+class IndexAdvisor:
+    """
+    Collects the query_db workload and turns it into index suggestions.
+
+    Recording, planning and index creation run on a single background thread so
+    query_db never waits on them. Every `interval` recorded statements the
+    current suggestions are logged, and created when auto_create is on.
+
+    Parameters:
+    db_path (str): SQLite database the queries run against.
+    table (str): Table to index.
+    log_path (str, optional): JSON lines file receiving every statement, its timing and plan.
+    log_max_bytes (int): The log is rotated to <log_path>.1, .2, ... once it grows past this; 0 never rotates.
+    log_backup_count (int): Rotated logs kept; older ones are deleted.
+    interval (int): Statements between suggestion rounds; 0 disables them.
+    auto_create (bool): Create suggested indexes (admin mode). Needs a writable database.
+    max_indexes (int): Suggestions per round.
+    max_queries (int): Distinct statements tracked; the oldest are forgotten first.
+    """
+
+    def __init__(self, db_path, table="Machinelogs", log_path=None, interval=50, auto_create=False,
+                 max_indexes=3, max_queries=500, log_max_bytes=10 * 1024 * 1024, log_backup_count=1):
+        self.db_path = os.path.abspath(db_path)
+        self.table = table
+        self.log_path = log_path
+        self.log_max_bytes = log_max_bytes
+        self.log_backup_count = log_backup_count
+        self.interval = interval
+        self.auto_create = auto_create
+        self.max_indexes = max_indexes
+        self.max_queries = max_queries
+        self.workload = OrderedDict()  # canonical SQL -> QueryStats
+        self.recorded = 0
+        self._columns = None
+        self._row_count = None
+        self._fractions = {}
+        self._connection = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="index-advisor")
+        self._lock = threading.Lock()
+
+    def _read_connection(self):
+        if self._connection is None:
+            self._connection = sqlite3.connect(f"file:{quote(self.db_path)}?mode=ro", uri=True, check_same_thread=False)
+        return self._connection
+
+    def columns(self):
+        """Lower-cased column name -> declared name of the advised table."""
+        if self._columns is None:
+            rows = self._read_connection().execute(f"PRAGMA table_info({quote_identifier(self.table)})").fetchall()
+            self._columns = {row[1].lower(): row[1] for row in rows}
+        return self._columns
+
+    def plan(self, sql_query):
+        """EXPLAIN QUERY PLAN details of a statement, or None if it cannot be planned."""
+        try:
+            rows = self._read_connection().execute("EXPLAIN QUERY PLAN " + sql_query).fetchall()
+        except sqlite3.Error:
+            return None
+        return [row[-1] for row in rows]
+
+    def record(self, sql_query, elapsed_s):
+        """Add one executed statement to the workload. Blocking; see record_in_background."""
+        canonical = canonicalize_sql(sql_query)
+        if canonical is None:
+            return
+        with self._lock:
+            stats = self.workload.get(canonical)
+            if stats is None:
+                stats = self.workload[canonical] = QueryStats(sql_query)
+                if len(self.workload) > self.max_queries:
+                    self.workload.popitem(last=False)
+            else:
+                self.workload.move_to_end(canonical)
+            stats.count += 1
+            stats.total_s += elapsed_s
+            stats.max_s = max(stats.max_s, elapsed_s)
+            self.recorded += 1
+            due = self.interval > 0 and self.recorded % self.interval == 0
+        if stats.plan is None:
+            stats.plan = self.plan(sql_query)
+
+        if self.log_path:
+            entry = {"ts": time.time(), "sql": sql_query, "elapsed_ms": round(elapsed_s * 1000, 3), "plan": stats.plan}
+            self._rotate_log()
+            with open(self.log_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry) + "\n")
+
+        if due:
+            self.advise()
+
+    def _rotate_log(self):
+        # Same scheme as logging.handlers.RotatingFileHandler; only the advisor thread writes the log
+        if not self.log_max_bytes:
+            return
+        try:
+            if os.path.getsize(self.log_path) < self.log_max_bytes:
+                return
+        except OSError:
+            return
+        if self.log_backup_count <= 0:
+            os.remove(self.log_path)
+            return
+        for i in range(self.log_backup_count - 1, 0, -1):
+            if os.path.exists(f"{self.log_path}.{i}"):
+                os.replace(f"{self.log_path}.{i}", f"{self.log_path}.{i + 1}")
+        os.replace(self.log_path, f"{self.log_path}.1")
+
+    def record_in_background(self, sql_query, elapsed_s):
+        """Queue a statement for record() on the advisor thread and return immediately."""
+        self._executor.submit(self._record_logged, sql_query, elapsed_s)
+
+    def _record_logged(self, sql_query, elapsed_s):
+        try:
+            self.record(sql_query, elapsed_s)
+        except Exception as e:
+            logging.error(f"Index advisor failed to record a query: {e}")
+
+    def load_log(self, log_path):
+        """Replay a query log written by record() into the workload."""
+        with open(log_path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    self.record(entry["sql"], entry["elapsed_ms"] / 1000)
+
+    def _fraction(self, predicate):
+        # Share of rows matching `column = literal`, cached per predicate
+        key = predicate.sql()
+        if key not in self._fractions:
+            connection = self._read_connection()
+            if self._row_count is None:
+                self._row_count = connection.execute(f"SELECT COUNT(*) FROM {quote_identifier(self.table)}").fetchone()[0]
+            matching = connection.execute(f"SELECT COUNT(*) FROM {quote_identifier(self.table)} WHERE {key}").fetchone()[0]
+            self._fractions[key] = matching / max(self._row_count, 1)
+        return self._fractions[key]
+
+    def _scans_table(self, plan):
+        # Full scans only; queries already searching an index are left alone
+        return (plan is not None and any(detail.startswith("SCAN") for detail in plan)
+                and not any("INDEX" in detail for detail in plan))
+
+    def candidate(self, stats):
+        """The index that would best serve one statement, or None."""
+        shape = parse_query(stats.sql_query, self.table.lower(), self.columns())
+        if shape is None or not self._scans_table(stats.plan):
+            return None
+
+        partial = []
+        for predicate in shape.predicates:
+            if predicate.kind == "eq" and predicate.literal is not None and self._fraction(predicate) <= PARTIAL_MAX_FRACTION:
+                partial.append(predicate)
+        partial_columns = [p.column for p in partial]
+
+        # Equality columns first, then one range column, else the grouping/ordering columns
+        key = []
+        for predicate in shape.predicates:
+            if predicate.kind == "eq" and predicate.column not in partial_columns and predicate.column not in key:
+                key.append(predicate.column)
+        ranges = [p.column for p in shape.predicates if p.kind == "range" and p.column not in key]
+        filtered = bool(key or ranges or partial)
+        if ranges:
+            key.append(ranges[0])
+        else:
+            key += [c for c in (shape.group_by or shape.order_by) if c not in key]
+
+        covering = key + [c for c in shape.referenced if c not in key]
+        if len(covering) <= MAX_INDEX_COLUMNS:
+            return IndexSuggestion(self.table, covering, [p.sql() for p in partial], True)
+        if not filtered:
+            # Walking a non-covering index in group order is slower than scanning the table
+            return None
+        return IndexSuggestion(self.table, key or partial_columns, [p.sql() for p in partial], False)
+
+    def suggest(self):
+        """Rank index suggestions by the observed time of the statements they serve."""
+        with self._lock:
+            workload = list(self.workload.values())
+        candidates = {}
+        for stats in workload:
+            suggestion = self.candidate(stats)
+            if suggestion is None:
+                continue
+            key = (tuple(suggestion.columns), tuple(suggestion.where))
+            candidates.setdefault(key, suggestion).queries.append(stats)
+
+        # Fold an index into a wider one with the same WHERE that starts with its columns
+        merged = []
+        for suggestion in sorted(candidates.values(), key=lambda s: -len(s.columns)):
+            for wider in merged:
+                if wider.where == suggestion.where and wider.columns[:len(suggestion.columns)] == suggestion.columns:
+                    wider.queries += suggestion.queries
+                    break
+            else:
+                merged.append(suggestion)
+        merged.sort(key=lambda s: -s.total_s)
+        return merged[:self.max_indexes]
+
+    def advise(self):
+        suggestions = self.suggest()
+        for suggestion in suggestions:
+            logging.info(f"Index advisor suggests {suggestion.describe()}: {suggestion.ddl()}")
+        if suggestions and self.auto_create:
+            for line in format_report(self.apply(suggestions)):
+                logging.info(f"Index advisor: {line}")
+        return suggestions
+
+    def _time(self, sql_query, repeat):
+        # Fresh connection so the timing reflects the current schema and a warm OS cache
+        connection = sqlite3.connect(f"file:{quote(self.db_path)}?mode=ro", uri=True)
+        try:
+            connection.execute(sql_query).fetchall()
+            best = None
+            for _ in range(repeat):
+                start = time.perf_counter()
+                connection.execute(sql_query).fetchall()
+                elapsed = time.perf_counter() - start
+                best = elapsed if best is None else min(best, elapsed)
+            return best
+        finally:
+            connection.close()
+
+    def apply(self, suggestions, repeat=3):
+        """
+        Create the suggested indexes and measure the statements they serve.
+
+        Indexes no statement ends up using are dropped again. Returns one dict per
+        (index, statement) with before_s, after_s and the new plan. Blocking.
+        """
+        report = []
+        writer = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            for suggestion in suggestions:
+                before = {stats.sql_query: self._time(stats.sql_query, repeat) for stats in suggestion.queries}
+                start = time.perf_counter()
+                writer.execute(suggestion.ddl())
+                writer.execute(f"ANALYZE {suggestion.name}")
+                writer.commit()
+                build_s = time.perf_counter() - start
+                self._reset_connection()
+
+                results = []
+                for stats in suggestion.queries:
+                    plan = self.plan(stats.sql_query)
+                    stats.plan = plan
+                    results.append({
+                        "index": suggestion.name,
+                        "ddl": suggestion.ddl(),
+                        "build_s": build_s,
+                        "sql": stats.sql_query,
+                        "before_s": before[stats.sql_query],
+                        "after_s": self._time(stats.sql_query, repeat),
+                        "plan": plan,
+                        "used": any(suggestion.name in detail for detail in plan or []),
+                    })
+                if not any(result["used"] for result in results):
+                    writer.execute(f"DROP INDEX IF EXISTS {suggestion.name}")
+                    writer.commit()
+                    self._reset_connection()
+                    for result in results:
+                        result["dropped"] = True
+                report += results
+        finally:
+            writer.close()
+        return report
+
+    def _reset_connection(self):
+        # Cached EXPLAIN statements are not re-prepared after a schema change
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        self._reset_connection()
+
+
+def format_report(report):
+    lines = []
+    for result in report:
+        status = "dropped, unused" if result.get("dropped") else ("used" if result["used"] else "not used")
+        lines.append(f"{result['index']} ({status}): {result['before_s'] * 1000:.2f}ms -> {result['after_s'] * 1000:.2f}ms "
+                     f"({result['before_s'] / max(result['after_s'], 1e-9):.1f}x)  {result['sql']}")
+    return lines
+
+
+_advisor = None
+_advisor_lock = threading.Lock()
+
+
+def get_index_advisor():
+    """Process-wide advisor configured from INDEX_ADVISOR_* and QUERY_LOG_*, or None when disabled (the default)."""
+    global _advisor
+    if not env_bool('INDEX_ADVISOR_ENABLED', False):
+        return None
+    with _advisor_lock:
+        if _advisor is None:
+            auto_create = env_bool('INDEX_ADVISOR_AUTO_CREATE', False)
+            if auto_create and env_bool('SQLITE_IMMUTABLE', False):
+                logging.warning("INDEX_ADVISOR_AUTO_CREATE ignored: the database is opened with SQLITE_IMMUTABLE")
+                auto_create = False
+            _advisor = IndexAdvisor(
+                sqlite_db_path(),
+                log_path=env_str('QUERY_LOG_PATH', 'query_log.jsonl'),
+                interval=env_int('INDEX_ADVISOR_INTERVAL', 50),
+                auto_create=auto_create,
+                log_max_bytes=env_int('QUERY_LOG_MAX_BYTES', 10 * 1024 * 1024),
+                log_backup_count=env_int('QUERY_LOG_BACKUP_COUNT', 1),
+            )
+    return _advisor
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--log", default="query_log.jsonl", help="query log written by the app")
+    parser.add_argument("--db", default=None, help="SQLite database (default: SQLITE_DB_PATH)")
+    parser.add_argument("--table", default="Machinelogs")
+    parser.add_argument("--max-indexes", type=int, default=3)
+    parser.add_argument("--apply", action="store_true", help="create the suggested indexes and report before/after latency")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    advisor = IndexAdvisor(args.db or sqlite_db_path(), table=args.table, interval=0, max_indexes=args.max_indexes)
+    advisor.load_log(args.log)
+    suggestions = advisor.suggest()
+    if not suggestions:
+        print("No index suggestions for this workload.")
+    for suggestion in suggestions:
+        print(suggestion.describe())
+        print("  " + suggestion.ddl())
+    if args.apply and suggestions:
+        for line in format_report(advisor.apply(suggestions)):
+            print(line)
+    advisor.close()
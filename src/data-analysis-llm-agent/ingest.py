@@ -0,0 +1,234 @@
+"""
+Load sensor CSV batches into the SQLite database.
+
+Replaces the pandas-based Convert_csv_to_Database notebook: the CSV is streamed
+in chunks and bulk-inserted with executemany in large transactions, and new
+batches are appended incrementally by UDI instead of rewriting the database.
+
+    python ingest.py ../data/ai4i2020.csv                  # append rows with a new UDI
+    python ingest.py ../data/ai4i2020.csv --replace        # reload the table, swapped in when complete
+"""
+import argparse
+import csv
+import logging
+import os
+import sqlite3
+import time
+
+from config import sqlite_db_path
+
+
+def quote_identifier(name):
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _value_type(value):
+    try:
+        int(value)
+        return "INTEGER"
+    except ValueError:
+        pass
+    try:
+        float(value)
+        return "REAL"
+    except ValueError:
+        return "TEXT"
+
+
+def infer_types(header, rows):
+    """
+    Declared type per column from sample rows: INTEGER, REAL or TEXT, as pandas' to_sql would pick.
+
+    Empty values are ignored; a column with no values at all is TEXT.
+    """
+    rank = {"INTEGER": 0, "REAL": 1, "TEXT": 2}
+    types = [None] * len(header)
+    for row in rows:
+        for i, value in enumerate(row):
+            if value == "":
+                continue
+            value_type = _value_type(value)
+            if types[i] is None or rank[value_type] > rank[types[i]]:
+                types[i] = value_type
+    return [column_type or "TEXT" for column_type in types]
+
+
+def read_chunks(reader, width, chunk_rows):
+    """Yield lists of up to chunk_rows rows; empty fields become NULL."""
+    chunk = []
+    for row in reader:
+        if not row:
+            continue
+        if len(row) != width:
+            raise ValueError(f"line {getattr(reader, 'line_num', '?')}: expected {width} fields, got {len(row)}")
+        if "" in row:
+            row = [value if value != "" else None for value in row]
+        chunk.append(row)
+        if len(chunk) >= chunk_rows:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _secondary_indexes(connection, table):
+    return connection.execute(
+        "SELECT name, sql FROM sqlite_master WHERE type = 'index' AND tbl_name = ? AND sql IS NOT NULL",
+        (table,),
+    ).fetchall()
+
+
+def ingest_csv(csv_path, db_path, table="Machinelogs", key="UDI", replace=False, chunk_rows=50000,
+               transaction_rows=500000, infer_rows=1000, index_columns=(), rebuild_indexes=False):
+    """
+    Stream a CSV file into a SQLite table.
+
+    Values are inserted as text and converted by the column affinity of the
+    declared types (as the sqlite3 shell's .import does), so no per-value Python
+    parsing is needed. In append mode (the default) only rows whose key is
+    greater than the largest key already loaded are inserted. The load runs with
+    journal_mode=WAL and synchronous=OFF; indexes are built after the rows are in.
+
+    Parameters:
+    csv_path (str): CSV file with a header row.
+    db_path (str): SQLite database; created if missing.
+    table (str): Target table; created with inferred column types if missing.
+    key (str): Increasing integer column used for incremental appends; None appends every row.
+    replace (bool): Load a new copy of the table and swap it for the old one in a single transaction instead of appending.
+    chunk_rows (int): Rows per executemany call.
+    transaction_rows (int): Rows per committed transaction.
+    infer_rows (int): Rows sampled to infer column types of a new table.
+    index_columns (iterable): Extra columns to index after the load.
+    rebuild_indexes (bool): Drop existing indexes before appending and recreate them afterwards.
+
+    Returns:
+    dict: rows read/inserted/skipped, load and index seconds and rows per second.
+    """
+    start = time.perf_counter()
+    connection = sqlite3.connect(db_path, isolation_level=None)
+    try:
+        connection.execute("PRAGMA journal_mode = WAL")
+        # Durability is traded for speed only while loading; a failed load leaves at most the last transaction out
+        connection.execute("PRAGMA synchronous = OFF")
+        connection.execute("PRAGMA cache_size = -262144")
+        connection.execute("PRAGMA temp_store = MEMORY")
+
+        # utf-8-sig drops the byte order mark Excel puts in front of the first header
+        with open(csv_path, newline="", encoding="utf-8-sig") as f:
+            reader = csv.reader(f)
+            header = next(reader)
+            sample = []
+            for row in reader:
+                if row:
+                    sample.append(row)
+                if len(sample) >= infer_rows:
+                    break
+
+            # A replace loads into a staging table that is swapped in at the end, in one
+            # transaction, so readers see the old rows until the new ones are complete
+            target = f"{table}__ingest" if replace else table
+            if replace:
+                connection.execute(f"DROP TABLE IF EXISTS {quote_identifier(target)}")
+            existing = [row[1] for row in connection.execute(f"PRAGMA table_info({quote_identifier(target)})")]
+            created = not existing
+            if created:
+                types = infer_types(header, sample)
+                columns_sql = ", ".join(f"{quote_identifier(name)} {column_type}" for name, column_type in zip(header, types))
+                connection.execute(f"CREATE TABLE {quote_identifier(target)} ({columns_sql})")
+                existing = list(header)
+            else:
+                unknown = [name for name in header if name not in existing]
+                if unknown:
+                    raise ValueError(f"CSV columns not in {table}: {', '.join(unknown)}")
+
+            dropped = []
+            if rebuild_indexes and not created:
+                dropped = _secondary_indexes(connection, table)
+                for name, _ in dropped:
+                    connection.execute(f"DROP INDEX {quote_identifier(name)}")
+
+            key_index = header.index(key) if key is not None and key in header else None
+            last_key = None
+            if key_index is not None and not created:
+                last_key = connection.execute(f"SELECT MAX({quote_identifier(key)}) FROM {quote_identifier(target)}").fetchone()[0]
+
+            insert_sql = (f"INSERT INTO {quote_identifier(target)} ({', '.join(quote_identifier(name) for name in header)}) "
+                          f"VALUES ({', '.join('?' * len(header))})")
+            rows_read = rows_inserted = 0
+            in_transaction = 0
+
+            def chunks():
+                yield from read_chunks(iter(sample), len(header), chunk_rows)
+                yield from read_chunks(reader, len(header), chunk_rows)
+
+            connection.execute("BEGIN")
+            for chunk in chunks():
+                rows_read += len(chunk)
+                if last_key is not None:
+                    chunk = [row for row in chunk if row[key_index] is not None and int(row[key_index]) > last_key]
+                if chunk:
+                    connection.executemany(insert_sql, chunk)
+                    rows_inserted += len(chunk)
+                    in_transaction += len(chunk)
+                if in_transaction >= transaction_rows:
+                    connection.execute("COMMIT")
+                    connection.execute("BEGIN")
+                    in_transaction = 0
+            connection.execute("COMMIT")
+        load_s = time.perf_counter() - start
+
+        # Indexes are cheaper to build once over the loaded rows than to maintain row by row
+        index_start = time.perf_counter()
+        if replace:
+            connection.execute("BEGIN")
+            connection.execute(f"DROP TABLE IF EXISTS {quote_identifier(table)}")
+            connection.execute(f"ALTER TABLE {quote_identifier(target)} RENAME TO {quote_identifier(table)}")
+        for _, sql in dropped:
+            connection.execute(sql)
+        if key_index is not None:
+            connection.execute(f"CREATE INDEX IF NOT EXISTS {quote_identifier(f'idx_{table.lower()}_{key.lower()}')} "
+                               f"ON {quote_identifier(table)} ({quote_identifier(key)})")
+        for column in index_columns:
+            name = "idx_" + "".join(c if c.isalnum() else "_" for c in f"{table}_{column}".lower())
+            connection.execute(f"CREATE INDEX IF NOT EXISTS {quote_identifier(name)} ON {quote_identifier(table)} ({quote_identifier(column)})")
+        if replace:
+            connection.execute("COMMIT")
+        connection.execute("PRAGMA synchronous = NORMAL")
+        connection.execute("PRAGMA optimize")
+        connection.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        index_s = time.perf_counter() - index_start
+    finally:
+        connection.close()
+
+    stats = {
+        "rows_read": rows_read,
+        "rows_inserted": rows_inserted,
+        "rows_skipped": rows_read - rows_inserted,
+        "load_s": load_s,
+        "index_s": index_s,
+        "rows_per_s": rows_inserted / load_s if load_s > 0 else 0.0,
+    }
+    logging.info(f"Ingested {rows_inserted} of {rows_read} rows from {csv_path} in {load_s:.2f}s "
+                 f"({stats['rows_per_s']:.0f} rows/s), indexes {index_s:.2f}s")
+    return stats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("csv_path")
+    parser.add_argument("--db", default=None, help="SQLite database (default: SQLITE_DB_PATH)")
+    parser.add_argument("--table", default="Machinelogs")
+    parser.add_argument("--key", default="UDI", help="increasing key for incremental appends; '' to append every row")
+    parser.add_argument("--replace", action="store_true", help="reload the table; readers see the old rows until the new ones are in")
+    parser.add_argument("--chunk-rows", type=int, default=50000)
+    parser.add_argument("--transaction-rows", type=int, default=500000)
+    parser.add_argument("--index", action="append", default=[], help="column to index after the load (repeatable)")
+    parser.add_argument("--rebuild-indexes", action="store_true", help="drop existing indexes during an append and rebuild them after")
+    args = parser.parse_args()
+
+    db_path = args.db or sqlite_db_path()
+    stats = ingest_csv(args.csv_path, db_path, table=args.table, key=args.key or None, replace=args.replace,
+                       chunk_rows=args.chunk_rows, transaction_rows=args.transaction_rows,
+                       index_columns=args.index, rebuild_indexes=args.rebuild_indexes)
+    print(f"{stats['rows_inserted']} rows inserted, {stats['rows_skipped']} skipped into {os.path.abspath(db_path)}: "
+          f"{stats['load_s']:.2f}s load ({stats['rows_per_s']:.0f} rows/s), {stats['index_s']:.2f}s indexes")
@@ -0,0 +1,209 @@
+import logging
+import re
+
+from config import env_bool, env_int
+
+# Rough tokens-per-message framing overhead of chat templates
+MESSAGE_OVERHEAD_TOKENS = 4
+# Tool outputs shorter than this are cheaper to keep verbatim than to digest
+MIN_COMPACT_TOKENS = 64
+
+
+def count_tokens(text):
+    """
+    Estimate the token count of a string.
+
+    Llama tokenizers average close to 4 characters per token on English text and
+    SQL; words and punctuation runs are counted as well so short, symbol-heavy
+    strings (markdown tables) are not underestimated.
+    """
+    if not text:
+        return 0
+    return max(len(text) // 4, len(re.findall(r"\w+|[^\w\s]", text)) // 2, 1)
+
+
+def message_tokens(message):
+    tokens = MESSAGE_OVERHEAD_TOKENS + count_tokens(str(message.get("content") or ""))
+    for tool_call in message.get("tool_calls") or []:
+        tokens += count_tokens(tool_call["function"]["name"]) + count_tokens(tool_call["function"]["arguments"])
+    return tokens
+
+
+def digest_tool_output(name, content):
+    """Short description of a tool result that replaces it once the turn is over."""
+    lines = [line for line in content.strip().split('\n') if line.strip()]
+    if lines and lines[0].startswith('|') and len(lines) >= 2:
+        columns = [column.strip() for column in lines[0].strip('|').split('|')]
+        table = [line for line in lines[2:] if line.startswith('|')]
+        preview = table[0] if table else ""
+        # The "truncated: ..." footer of a capped result is not a row
+        truncated = next((f"; {line.strip()}" for line in lines[2:] if line.startswith("truncated:")), "")
+        return f"[{name} result: {len(table)} rows{truncated}; columns: {', '.join(columns)}; first row: {preview}]"
+    if lines and re.match(r"(over )?\d+ rows x \d+ columns", lines[0]) and len(lines) >= 2:
+        # Compact typed CSV from result_encoding.py; its first line already has the shape and any handle
+        preview = lines[2] if len(lines) > 2 and not lines[2].startswith("stats over") else ""
+        return f"[{name} result: {lines[0]}; columns: {lines[1]}; first row: {preview}]"
+    if content.startswith("[") and count_tokens(content) <= 120:
+        # Chart summaries and other short encoded results are kept as they are
+        return content
+    if content.startswith("Error"):
+        return content[:300]
+    return f"[{name} result omitted: {count_tokens(content)} tokens]"
+
+
+class ConversationMemory:
+    """
+    Bounds the prompt sent to the model for each completion.
+
+    The system prompt is always kept. Tool outputs from earlier turns are
+    compacted in place into short digests (row count, columns, first row). If the
+    conversation still exceeds the token budget, the oldest turns are dropped from
+    the request and replaced by a summary, produced by an optional async
+    summarizer or, without one, an extractive list of the earlier user requests.
+    The current turn is always sent in full.
+
+    Parameters:
+    token_budget (int): Maximum prompt tokens per request.
+    summarizer (coroutine function, optional): Takes a list of messages and returns summary text.
+    summary_tokens (int): Token cap of the summary message.
+    """
+
+    def __init__(self, token_budget=6000, summarizer=None, summary_tokens=300):
+        self.token_budget = token_budget
+        self.summarizer = summarizer
+        self.summary_tokens = summary_tokens
+        self._summary = None
+        self._summarized_upto = 0  # index into messages covered by the summary
+        self.compacted_tokens = 0  # tokens removed from the history by digests so far
+        self.full_tokens = 0
+        self.sent_tokens = 0
+        self.requests = 0
+
+    @staticmethod
+    def _turn_starts(messages):
+        return [i for i, message in enumerate(messages) if message.get("role") == "user"]
+
+    def compact(self, messages, finished=False):
+        """
+        Replace tool outputs of finished turns with digests. Mutates messages.
+
+        Parameters:
+        finished (bool): The last turn is over too (its outputs are digested as well).
+        """
+        turn_starts = self._turn_starts(messages)
+        if not turn_starts:
+            return
+        current_turn = len(messages) if finished else turn_starts[-1]
+        for i in range(current_turn):
+            message = messages[i]
+            if message.get("role") != "tool" or message.get("compacted"):
+                continue
+            content = str(message.get("content") or "")
+            if count_tokens(content) >= MIN_COMPACT_TOKENS:
+                digest = digest_tool_output(message.get("name", "tool"), content)
+                self.compacted_tokens += count_tokens(content) - count_tokens(digest)
+                messages[i] = {**message, "content": digest}
+            messages[i]["compacted"] = True
+
+    async def _summarize(self, messages, upto):
+        if upto <= self._summarized_upto and self._summary is not None:
+            return self._summary
+        dropped = [m for m in messages[self._summarized_upto:upto] if m.get("role") != "system"]
+        if self.summarizer is not None:
+            try:
+                previous = [{"role": "system", "content": self._summary}] if self._summary else []
+                summary = await self.summarizer(previous + dropped)
+            except Exception as e:
+                logging.error(f"Conversation summarization failed: {e}")
+                summary = None
+        else:
+            summary = None
+        if summary is None:
+            requests = [str(m.get("content")) for m in dropped if m.get("role") == "user"]
+            earlier = self._summary + " " if self._summary else "Earlier in this conversation the user asked: "
+            summary = earlier + "; ".join(requests)
+        # Keep the summary itself within its budget
+        max_chars = self.summary_tokens * 4
+        if len(summary) > max_chars:
+            summary = "..." + summary[-max_chars:]
+        self._summary = summary
+        self._summarized_upto = upto
+        return summary
+
+    async def build(self, messages):
+        """Return the list of messages to send for the next completion."""
+        self.compact(messages)
+        messages_out = [{k: v for k, v in m.items() if k != "compacted"} for m in messages]
+        # What the request would cost without any memory management
+        full = sum(message_tokens(m) for m in messages_out) + self.compacted_tokens
+
+        system = [m for m in messages_out[:1] if m.get("role") == "system"]
+        body_start = len(system)
+        turn_starts = [i for i in self._turn_starts(messages_out) if i >= body_start] or [len(messages_out)]
+
+        budget = self.token_budget - sum(message_tokens(m) for m in system)
+        # Walk back from the current turn, keeping whole turns while they fit. Turns
+        # already in the summary are not sent again, even when a shorter current
+        # turn would leave room for them: the model would see them twice.
+        keep_from = turn_starts[-1]
+        summarized = min(self._summarized_upto, keep_from)
+        used = sum(message_tokens(m) for m in messages_out[keep_from:])
+        for start in reversed(turn_starts[:-1]):
+            if start < summarized:
+                break
+            turn_tokens = sum(message_tokens(m) for m in messages_out[start:keep_from])
+            if used + turn_tokens + self.summary_tokens > budget:
+                break
+            used += turn_tokens
+            keep_from = start
+
+        request = list(system)
+        if keep_from > turn_starts[0]:
+            summary = await self._summarize(messages_out, keep_from)
+            request.append({"role": "system", "content": f"Summary of the earlier conversation: {summary}"})
+        request += messages_out[keep_from:] if keep_from > turn_starts[0] else messages_out[body_start:]
+
+        sent = sum(message_tokens(m) for m in request)
+        self.requests += 1
+        self.full_tokens += full
+        self.sent_tokens += sent
+        logging.info(f"Prompt tokens: {sent} sent, {full} in full history ({full - sent} saved)")
+        return request
+
+    def state(self):
+        """Summary and counters, JSON-serializable, for session stores."""
+        return {
+            "summary": self._summary,
+            "summarized_upto": self._summarized_upto,
+            "compacted_tokens": self.compacted_tokens,
+            "full_tokens": self.full_tokens,
+            "sent_tokens": self.sent_tokens,
+            "requests": self.requests,
+        }
+
+    def restore(self, state):
+        self._summary = state.get("summary")
+        self._summarized_upto = state.get("summarized_upto", 0)
+        self.compacted_tokens = state.get("compacted_tokens", 0)
+        self.full_tokens = state.get("full_tokens", 0)
+        self.sent_tokens = state.get("sent_tokens", 0)
+        self.requests = state.get("requests", 0)
+
+    def stats(self):
+        return {
+            "requests": self.requests,
+            "full_prompt_tokens": self.full_tokens,
+            "sent_prompt_tokens": self.sent_tokens,
+            "saved_prompt_tokens": self.full_tokens - self.sent_tokens,
+        }
+
+
+def memory_from_env(summarizer=None):
+    """ConversationMemory configured from MEMORY_* environment variables, or None when disabled."""
+    if not env_bool('MEMORY_ENABLED', True):
+        return None
+    return ConversationMemory(
+        token_budget=env_int('MEMORY_TOKEN_BUDGET', 6000),
+        summarizer=summarizer if env_bool('MEMORY_SUMMARIZE', False) else None,
+        summary_tokens=env_int('MEMORY_SUMMARY_TOKENS', 300),
+    )
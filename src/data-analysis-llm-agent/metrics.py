@@ -0,0 +1,264 @@
+"""
+Counters and histograms for the agent loop, in the Prometheus text format.
+
+Every finished tracing span is observed in stage_duration_seconds, labelled by
+stage (span name: turn, llm.completion, tool.query_db, db.sqlite,
+result.format, chart.build, ...) and outcome, so per-stage latency needs no
+extra timing code. Turn iterations, model tokens and completion cache results
+are recorded by the code that knows them. With METRICS_PORT the registry is
+served at http://<host>:<port>/metrics; with METRICS_DUMP_PATH it is written to
+that file every METRICS_DUMP_INTERVAL_S seconds.
+"""
+import bisect
+import json
+import logging
+import os
+import threading
+import time
+
+from config import env_float, env_int, env_str
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels_text(labelnames, values, extra=""):
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _number(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Monotonic count per label set."""
+
+    kind = "counter"
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, key, "", value) for key, value in sorted(self._values.items())]
+
+    def snapshot(self):
+        with self._lock:
+            return {",".join(key): value for key, value in self._values.items()}
+
+
+class Histogram:
+    """Cumulative-bucket histogram per label set, with sum and count."""
+
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._values = {}  # label values -> [bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._values.get(key)
+            if counts is None:
+                counts = self._values[key] = [0] * (len(self.buckets) + 2)
+            counts[index] += 1
+            counts[-1] += value
+
+    def samples(self):
+        samples = []
+        with self._lock:
+            items = sorted((key, list(counts)) for key, counts in self._values.items())
+        for key, counts in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                samples.append((self.name + "_bucket", key, f'le="{_number(bound)}"', cumulative))
+            samples.append((self.name + "_sum", key, "", counts[-1]))
+            samples.append((self.name + "_count", key, "", cumulative))
+        return samples
+
+    def snapshot(self):
+        """{labels: {count, sum, p50, p95, p99}} with percentiles interpolated from the buckets."""
+        with self._lock:
+            items = {key: list(counts) for key, counts in self._values.items()}
+        result = {}
+        for key, counts in items.items():
+            total = sum(counts[:-1])
+            summary = {"count": total, "sum": counts[-1]}
+            for pct in (50, 95, 99):
+                summary[f"p{pct}"] = self._quantile(counts, total, pct / 100)
+            result[",".join(key)] = summary
+        return result
+
+    def _quantile(self, counts, total, q):
+        if not total:
+            return 0.0
+        rank = q * total
+        cumulative = 0
+        lower = 0.0
+        for bound, count in zip(self.buckets, counts):
+            if cumulative + count >= rank:
+                return lower + (bound - lower) * ((rank - cumulative) / count if count else 0.0)
+            cumulative += count
+            lower = bound
+        return self.buckets[-1]
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name, help, labelnames=()):
+        return self._register(Counter(name, help, labelnames))
+
+    def histogram(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._register(Histogram(name, help, labelnames, buckets))
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            metrics = list(self._metrics.values())
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, key, extra, value in metric.samples():
+                lines.append(f"{name}{_labels_text(metric.labelnames, key, extra)} {_number(value)}")
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return {metric.name: metric.snapshot() for metric in metrics}
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    "agent_stage_duration_seconds", "Duration of each traced stage of a chat turn", ("stage", "outcome"))
+TOOL_QUEUE_SECONDS = REGISTRY.histogram(
+    "agent_tool_queue_seconds", "Time tool calls waited for a concurrency slot", ("tool",))
+TURN_ITERATIONS = REGISTRY.histogram(
+    "agent_turn_iterations", "Tool call rounds per chat turn (bounded by MAX_ITER)", (), buckets=(0, 1, 2, 3, 4, 5, 6))
+LLM_TOKENS = REGISTRY.counter(
+    "agent_llm_tokens_total", "Prompt and completion tokens, as reported by the API or estimated", ("kind", "source"))
+LLM_REQUESTS = REGISTRY.counter(
+    "agent_llm_requests_total", "Completions by origin: upstream call or completion cache", ("source",))
+SPECULATIVE_QUERIES = REGISTRY.counter(
+    "agent_speculative_queries_total",
+    "Speculative prefetches by outcome: prefetched, cached, failed, timeout, dropped, busy, budget", ("outcome",))
+SPECULATIVE_HITS = REGISTRY.counter(
+    "agent_speculative_hits_total",
+    "query_db calls served by a speculatively prefetched result, from the cache or by waiting for it", ("how",))
+TOOL_RESULT_CHARS = REGISTRY.counter(
+    "agent_tool_result_chars_total", "Characters of text tool results as returned (raw) and as sent to the model (encoded)",
+    ("form",))
+SESSION_LOADS = REGISTRY.counter(
+    "agent_session_loads_total", "Session lookups by origin: held by this worker, rehydrated from the store, or new",
+    ("source",))
+
+
+def observe_span(finished):
+    """Record a finished tracing span in agent_stage_duration_seconds."""
+    outcome = finished.attributes.get("outcome") or ("error" if finished.error else "ok")
+    STAGE_SECONDS.observe(finished.duration_s, stage=finished.name, outcome=outcome)
+
+
+def record_tokens(prompt_tokens, completion_tokens, source="reported"):
+    LLM_TOKENS.inc(prompt_tokens, kind="prompt", source=source)
+    LLM_TOKENS.inc(completion_tokens, kind="completion", source=source)
+
+
+def dump(path, registry=REGISTRY):
+    """Write the registry to path atomically: Prometheus text, or a JSON summary for *.json paths."""
+    if path.endswith(".json"):
+        text = json.dumps({"ts": time.time(), "metrics": registry.snapshot()}, indent=1)
+    else:
+        text = registry.render()
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+def serve(port, host="0.0.0.0", registry=REGISTRY):
+    """Serve /metrics from a daemon thread; returns the server."""
+    # Imported here: http.server is only needed when the endpoint is enabled
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] not in ("/metrics", "/"):
+                self.send_error(404)
+                return
+            body = registry.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    logging.info(f"Serving metrics on http://{host}:{server.server_port}/metrics")
+    return server
+
+
+_started = False
+_start_lock = threading.Lock()
+
+
+def start_metrics_exporters():
+    """Start the endpoint (METRICS_PORT) and periodic dump (METRICS_DUMP_PATH) if configured. Idempotent."""
+    global _started
+    with _start_lock:
+        if _started:
+            return
+        _started = True
+    port = env_int('METRICS_PORT', 0)
+    if port:
+        serve(port, env_str('METRICS_HOST', '0.0.0.0'))
+    path = env_str('METRICS_DUMP_PATH')
+    if path:
+        interval_s = env_float('METRICS_DUMP_INTERVAL_S', 60.0)
+
+        def dump_periodically():
+            while True:
+                time.sleep(interval_s)
+                try:
+                    dump(path)
+                except OSError as error:
+                    logging.warning(f"Could not write metrics to {path}: {error}")
+
+        threading.Thread(target=dump_periodically, name="metrics-dump", daemon=True).start()
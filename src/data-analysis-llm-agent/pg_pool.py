@@ -0,0 +1,219 @@
+import asyncio
+import time
+from contextlib import asynccontextmanager
+
+from config import env_float, env_int, env_str
+
+
+def postgres_settings():
+    """Connection settings for the Postgres backend, from the DB_* environment variables."""
+    return {
+        "database": env_str('DB_NAME'),
+        "user": env_str('DB_USER'),
+        "password": env_str('DB_PASSWORD'),
+        "host": env_str('DB_HOST'),
+        "port": env_int('DB_PORT', 5432),
+    }
+
+
+async def asyncpg_connect(statement_timeout_ms=30000, **settings):
+    # Imported lazily so the SQLite-only deployment does not need asyncpg installed
+    import asyncpg
+
+    return await asyncpg.connect(
+        server_settings={"statement_timeout": str(int(statement_timeout_ms))},
+        **settings,
+    )
+
+
+class PostgresPool:
+    """
+    Process-wide async pool of Postgres connections.
+
+    Connections are opened once and reused across tool calls instead of paying a
+    TCP + auth handshake per query. Idle connections are health-checked before
+    reuse and replaced when broken. Results are read through a server-side cursor
+    in chunks so large result sets are never pulled in a single round trip.
+
+    Parameters:
+    connect (coroutine function): Opens a new connection. Defaults to asyncpg with
+        the DB_* settings; tests and benchmarks can pass a protocol-compatible fake.
+    min_size (int): Connections opened eagerly by open().
+    max_size (int): Upper bound of open connections.
+    statement_timeout_ms (int): Server-side statement_timeout, also enforced client-side.
+    health_check_after_s (float): Idle time after which a connection is pinged before reuse.
+    fetch_size (int): Rows fetched per cursor round trip.
+    """
+
+    def __init__(self, connect=None, min_size=1, max_size=10, statement_timeout_ms=30000,
+                 health_check_after_s=30.0, fetch_size=500):
+        if min_size > max_size:
+            raise ValueError("min_size must not be larger than max_size.")
+        if connect is None:
+            settings = postgres_settings()
+            connect = lambda: asyncpg_connect(statement_timeout_ms=statement_timeout_ms, **settings)
+        self._connect = connect
+        self.min_size = min_size
+        self.max_size = max_size
+        self.statement_timeout_ms = statement_timeout_ms
+        self.health_check_after_s = health_check_after_s
+        self.fetch_size = fetch_size
+        self._idle = []  # (connection, released_at)
+        self._opened = 0
+        self._cond = None
+        self._closed = False
+
+    def _condition(self):
+        # Created lazily so the pool binds to the loop that first uses it
+        if self._cond is None:
+            self._cond = asyncio.Condition()
+        return self._cond
+
+    async def open(self):
+        async with self._condition():
+            while self._opened < self.min_size:
+                self._opened += 1
+                try:
+                    connection = await self._connect()
+                except Exception:
+                    self._opened -= 1
+                    raise
+                self._idle.append((connection, time.monotonic()))
+        return self
+
+    async def _is_healthy(self, connection, released_at):
+        if connection.is_closed():
+            return False
+        if time.monotonic() - released_at < self.health_check_after_s:
+            return True
+        try:
+            await asyncio.wait_for(connection.fetchval("SELECT 1"), timeout=5)
+            return True
+        except Exception:
+            return False
+
+    async def _discard(self, connection):
+        self._opened -= 1
+        try:
+            await connection.close()
+        except Exception:
+            pass
+
+    async def _acquire(self):
+        cond = self._condition()
+        while True:
+            async with cond:
+                while not self._idle and self._opened >= self.max_size and not self._closed:
+                    await cond.wait()
+                if self._closed:
+                    raise RuntimeError("Postgres pool is closed")
+                if self._idle:
+                    connection, released_at = self._idle.pop()
+                else:
+                    self._opened += 1
+                    connection = None
+
+            if connection is None:
+                break
+            # Health check outside the lock so a slow ping does not stall other sessions
+            if await self._is_healthy(connection, released_at):
+                return connection
+            await self._discard(connection)
+            async with cond:
+                cond.notify()
+
+        try:
+            return await self._connect()
+        except Exception:
+            async with cond:
+                self._opened -= 1
+                cond.notify()
+            raise
+
+    async def _release(self, connection, broken=False):
+        cond = self._condition()
+        async with cond:
+            if broken or self._closed or connection.is_closed():
+                await self._discard(connection)
+            else:
+                self._idle.append((connection, time.monotonic()))
+            cond.notify()
+
+    @asynccontextmanager
+    async def acquire(self):
+        connection = await self._acquire()
+        broken = False
+        try:
+            yield connection
+        except (asyncio.TimeoutError, asyncio.CancelledError, ConnectionError, OSError):
+            # The connection may be mid-statement; do not hand it to another session
+            broken = True
+            raise
+        finally:
+            await self._release(connection, broken=broken)
+
+    async def fetch(self, sql_query, *args, max_rows=None):
+        """
+        Run a query through a server-side cursor and return (rows, column_names).
+
+        max_rows caps how many rows are read from the cursor; None reads all of them.
+        """
+        async with self.acquire() as connection:
+            return await asyncio.wait_for(
+                self._fetch(connection, sql_query, args, max_rows),
+                # Client-side guard in case the server-side timeout is not honoured
+                timeout=self.statement_timeout_ms / 1000.0 + 1,
+            )
+
+    async def _fetch(self, connection, sql_query, args, max_rows):
+        async with connection.transaction():
+            statement = await connection.prepare(sql_query)
+            column_names = [attr.name for attr in statement.get_attributes()]
+            cursor = await statement.cursor(*args)
+            rows = []
+            while max_rows is None or len(rows) < max_rows:
+                size = self.fetch_size if max_rows is None else min(self.fetch_size, max_rows - len(rows))
+                chunk = await cursor.fetch(size)
+                rows.extend(tuple(record) for record in chunk)
+                if len(chunk) < size:
+                    break
+        return rows, column_names
+
+    async def close(self):
+        cond = self._condition()
+        async with cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            for connection, _ in idle:
+                await self._discard(connection)
+            cond.notify_all()
+
+
+_pool = None
+_pool_lock = None
+
+
+async def get_postgres_pool():
+    """Return the process-wide pool, configured from the DB_* and PG_POOL_* environment variables."""
+    global _pool, _pool_lock
+    if _pool_lock is None:
+        _pool_lock = asyncio.Lock()
+    async with _pool_lock:
+        if _pool is None:
+            pool = PostgresPool(
+                min_size=env_int('PG_POOL_MIN_SIZE', 1),
+                max_size=env_int('PG_POOL_MAX_SIZE', 10),
+                statement_timeout_ms=env_int('PG_STATEMENT_TIMEOUT_MS', 30000),
+                health_check_after_s=env_float('PG_HEALTH_CHECK_AFTER_S', 30.0),
+                fetch_size=env_int('PG_FETCH_SIZE', 500),
+            )
+            await pool.open()
+            _pool = pool
+    return _pool
+
+
+async def close_postgres_pool():
+    global _pool
+    if _pool is not None:
+        await _pool.close()
+        _pool = None
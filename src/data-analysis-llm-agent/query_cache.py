@@ -0,0 +1,361 @@
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from config import env_bool, env_float, env_int, sqlite_db_path
+
+TOKEN_RE = re.compile(r"""
+    (?P<ws>\s+)
+  | (?P<comment>--[^\n]*|/\*.*?\*/)
+  | (?P<string>'(?:[^']|'')*')
+  | (?P<qident>"(?:[^"]|"")*"|`[^`]*`|\[[^\]]*\])
+  | (?P<number>\d+\.?\d*(?:[eE][+-]?\d+)?|\.\d+(?:[eE][+-]?\d+)?)
+  | (?P<word>[A-Za-z_][A-Za-z0-9_$]*)
+  | (?P<op><>|!=|<=|>=|==|\|\||.)
+""", re.S | re.X)
+
+SIMPLE_IDENT_RE = re.compile(r"^[a-z_][a-z0-9_]*$")
+
+KEYWORDS = {
+    "select", "from", "where", "group", "by", "order", "having", "limit", "offset", "as", "on",
+    "join", "inner", "left", "right", "full", "outer", "cross", "natural", "using", "and", "or",
+    "not", "in", "is", "null", "like", "glob", "between", "case", "when", "then", "else", "end",
+    "distinct", "all", "union", "intersect", "except", "with", "asc", "desc", "cast", "exists",
+    "values", "table", "index", "create", "drop", "insert", "update", "delete", "into", "set",
+}
+
+READ_STATEMENTS = {"select", "with", "values"}
+
+# Results that change from one run to the next are never cached
+NONDETERMINISTIC = {
+    "random", "randomblob", "changes", "total_changes", "last_insert_rowid",
+    "current_timestamp", "current_date", "current_time", "localtimestamp",
+    "now", "clock_timestamp", "statement_timestamp", "timeofday", "gen_random_uuid",
+}
+
+
+def tokenize_sql(sql_query):
+    """Split SQL into (kind, text) tokens, dropping whitespace and comments."""
+    tokens = []
+    for match in TOKEN_RE.finditer(sql_query):
+        kind = match.lastgroup
+        if kind not in ("ws", "comment"):
+            tokens.append((kind, match.group()))
+    return tokens
+
+
+def normalize_identifier(text, dialect="sqlite"):
+    inner = text[1:-1]
+    if text[0] == '"':
+        inner = inner.replace('""', '"')
+    # SQLite compares ASCII identifiers case-insensitively, quoted or not;
+    # Postgres only folds unquoted identifiers.
+    folded = inner.lower() if dialect == "sqlite" else inner
+    if SIMPLE_IDENT_RE.match(folded) and folded not in KEYWORDS:
+        return folded
+    return '"' + folded.replace('"', '""') + '"'
+
+
+def canonicalize_sql(sql_query, dialect="sqlite", identifiers=None):
+    """
+    Canonical form of a read-only query, used as the result cache key.
+
+    The query is tokenized, comments and whitespace are dropped, keywords and
+    identifiers are case-folded, redundant identifier quoting is removed and
+    table aliases are renamed to t1, t2, ... in order of appearance (or dropped
+    for single-table queries), so cosmetically different copies of the same
+    query map to the same key. Cached column labels are those of whichever
+    copy filled the entry; they can differ only in case and spacing.
+
+    SQLite reads a double-quoted token that names no column as a string
+    literal ("L" in WHERE Type = "L"), so with dialect 'sqlite' such tokens are
+    only folded when their lowercased name is in identifiers (known table and
+    column names) and kept verbatim otherwise.
+
+    Returns None for statements that are not plain reads and for queries
+    calling non-deterministic functions (RANDOM(), datetime('now'), ...).
+    """
+    tokens = tokenize_sql(sql_query)
+    while tokens and tokens[-1] == ("op", ";"):
+        tokens.pop()
+    if not tokens or tokens[0][0] != "word" or tokens[0][1].lower() not in READ_STATEMENTS:
+        return None
+    if any(token == ("op", ";") for token in tokens):
+        return None
+
+    words = []
+    for kind, text in tokens:
+        if kind == "word":
+            if text.lower() in NONDETERMINISTIC:
+                return None
+            words.append(text.lower())
+        elif kind == "qident":
+            if (dialect == "sqlite" and text[0] == '"'
+                    and (identifiers is None or text[1:-1].replace('""', '"').lower() not in identifiers)):
+                words.append(text)
+            else:
+                words.append(normalize_identifier(text, dialect))
+        else:
+            if kind == "string" and text[1:-1].strip().lower() == "now":
+                return None
+            words.append(text)
+
+    # Table aliases: FROM/JOIN <table> [AS] <alias>
+    aliases = {}
+    declarations = set()
+    for i, word in enumerate(words):
+        if word in ("from", "join") and i + 2 < len(words) and tokens[i + 1][0] in ("word", "qident"):
+            j = i + 2
+            if words[j] == "as" and j + 1 < len(words):
+                j += 1
+            alias = words[j]
+            if tokens[j][0] in ("word", "qident") and alias not in KEYWORDS and alias not in aliases:
+                aliases[alias] = f"t{len(aliases) + 1}"
+                declarations.update(range(i + 2, j + 1))
+
+    if aliases:
+        # With a single table and no joins the alias is redundant and is dropped entirely
+        last = max(declarations)
+        single_table = (len(aliases) == 1 and sum(word in ("from", "join") for word in words) == 1
+                        and (last + 1 >= len(words) or words[last + 1] != ","))
+        canonical = []
+        i = 0
+        while i < len(words):
+            word = words[i]
+            if i in declarations:
+                if word in aliases and not single_table:
+                    canonical.append(aliases[word])
+                i += 1
+                continue
+            if word in aliases and i + 1 < len(words) and words[i + 1] == ".":
+                if single_table:
+                    i += 2
+                    continue
+                canonical.append(aliases[word])
+            else:
+                canonical.append(word)
+            i += 1
+        words = canonical
+
+    return " ".join(words)
+
+
+def estimate_size(rows, column_names):
+    """Rough in-memory footprint of a result set in bytes."""
+    size = 64 + sum(len(name) for name in column_names)
+    for row in rows:
+        size += 56 + 8 * len(row)
+        for value in row:
+            if isinstance(value, (str, bytes)):
+                size += len(value) + 49
+            else:
+                size += 24
+    return size
+
+
+class SQLiteVersion:
+    """
+    Change token for a SQLite file: (db stat, wal stat, schema_version).
+
+    The file stat is checked on every call; PRAGMA schema_version is re-read when
+    the stat changes and otherwise at most every schema_check_interval_s seconds.
+    """
+
+    def __init__(self, db_path, schema_check_interval_s=5.0):
+        self.db_path = os.path.abspath(db_path)
+        self.schema_check_interval_s = schema_check_interval_s
+        self._stat = None
+        self._schema_version = None
+        self._checked_at = 0.0
+
+    def _file_stat(self):
+        stat = []
+        for path in (self.db_path, self.db_path + "-wal"):
+            try:
+                st = os.stat(path)
+                stat.append((st.st_mtime_ns, st.st_size))
+            except FileNotFoundError:
+                stat.append(None)
+        return tuple(stat)
+
+    def _read_schema_version(self):
+        try:
+            connection = sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True)
+            try:
+                return connection.execute("PRAGMA schema_version").fetchone()[0]
+            finally:
+                connection.close()
+        except sqlite3.Error:
+            return None
+
+    def __call__(self):
+        stat = self._file_stat()
+        now = time.monotonic()
+        if stat != self._stat or now - self._checked_at >= self.schema_check_interval_s:
+            self._stat = stat
+            self._schema_version = self._read_schema_version()
+            self._checked_at = now
+        return self._stat, self._schema_version
+
+
+class ResultCache:
+    """
+    LRU/TTL cache of query results keyed on canonical SQL.
+
+    Parameters:
+    max_entries (int): Maximum number of cached results.
+    max_bytes (int): Cap on the estimated total size of cached results.
+    ttl_s (float): Seconds an entry stays valid; None disables expiry.
+    version (callable, optional): Returns a token that changes whenever the
+        underlying data or schema changes; a new token clears the cache.
+    dialect (str): 'sqlite' or 'postgres', controls identifier case folding.
+    identifiers (callable, optional): Returns the lowercased table and column
+        names; double-quoted SQLite tokens are folded only when listed there.
+    """
+
+    def __init__(self, max_entries=256, max_bytes=32 * 1024 * 1024, ttl_s=600.0, version=None, dialect="sqlite",
+                 identifiers=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_s = ttl_s
+        self.version = version
+        self.dialect = dialect
+        self.identifiers = identifiers
+        self._entries = OrderedDict()  # key -> (value, size, created_at, cost_s)
+        self._bytes = 0
+        self._version_token = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.saved_s = 0.0
+
+    def key(self, sql_query):
+        identifiers = self.identifiers() if self.identifiers is not None else None
+        return canonicalize_sql(sql_query, self.dialect, identifiers)
+
+    def _check_version(self):
+        if self.version is None:
+            return
+        token = self.version()
+        if token != self._version_token:
+            if self._version_token is not None and self._entries:
+                self.invalidations += 1
+                logging.info(f"Query cache invalidated: database changed ({len(self._entries)} entries dropped)")
+            self._entries.clear()
+            self._bytes = 0
+            self._version_token = token
+
+    def get(self, key):
+        """Return the cached value for a key, (rows, column_names) for results, or None on a miss."""
+        if key is None:
+            return None
+        with self._lock:
+            self._check_version()
+            if (self.hits + self.misses) % 100 == 99:
+                logging.info(f"Query cache stats: {self.stats()}")
+            entry = self._entries.get(key)
+            if entry is not None and self.ttl_s is not None and time.monotonic() - entry[2] > self.ttl_s:
+                self._remove(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            self.saved_s += entry[3]
+            return entry[0]
+
+    def peek(self, key):
+        """Like get, but without counting a lookup or refreshing the entry's LRU position."""
+        if key is None:
+            return None
+        with self._lock:
+            self._check_version()
+            entry = self._entries.get(key)
+            if entry is None or (self.ttl_s is not None and time.monotonic() - entry[2] > self.ttl_s):
+                return None
+            return entry[0]
+
+    def put(self, key, rows, column_names, cost_s=0.0):
+        """Store a result; cost_s is the execution time a future hit will save."""
+        self.put_value(key, (rows, column_names), estimate_size(rows, column_names), cost_s)
+
+    def put_value(self, key, value, size, cost_s=0.0):
+        """Store any value (e.g. formatted result text) with its estimated size in bytes."""
+        if key is None or size > self.max_bytes:
+            return
+        with self._lock:
+            self._check_version()
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, size, time.monotonic(), cost_s)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        self._bytes -= entry[1]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "saved_s": self.saved_s,
+        }
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def _catalog_identifiers():
+    # Imported here: catalog.py imports this module
+    from catalog import get_schema_catalog
+
+    return get_schema_catalog().identifiers
+
+
+def get_query_cache(backend="sqlite"):
+    """
+    Process-wide result cache for a backend, or None when QUERY_CACHE_ENABLED is off.
+
+    The SQLite cache is invalidated on file/schema changes; Postgres relies on the TTL.
+    """
+    if not env_bool('QUERY_CACHE_ENABLED', True):
+        return None
+    with _caches_lock:
+        if backend not in _caches:
+            version = SQLiteVersion(sqlite_db_path()) if backend == "sqlite" else None
+            _caches[backend] = ResultCache(
+                max_entries=env_int('QUERY_CACHE_MAX_ENTRIES', 256),
+                max_bytes=env_int('QUERY_CACHE_MAX_BYTES', 32 * 1024 * 1024),
+                ttl_s=env_float('QUERY_CACHE_TTL_S', 600.0),
+                version=version,
+                dialect=backend,
+                identifiers=_catalog_identifiers if backend == "sqlite" else None,
+            )
+        return _caches[backend]
+
+
+def query_cache_stats():
+    return {backend: cache.stats() for backend, cache in _caches.items()}
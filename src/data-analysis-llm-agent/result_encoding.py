@@ -0,0 +1,378 @@
+"""
+Compact encoding of tool results for the model.
+
+ChatBot.call_functions used to send str() of every tool result back to the
+model: the repr of the Plotly figure for plot_chart (the full layout and up to
+hundreds of trace values, none of which the model needs) and a markdown table
+for query_db. Each of those stays in the prompt of every completion of the
+turn.
+
+encode_tool_results turns one round of tool responses into model-facing text:
+
+- Figures become a one-line summary (chart type, title, axes, value ranges,
+  point count) with a handle; the figure itself is only shown to the user.
+- query_db tables become typed CSV: a shape line, a "name:type" header, rows
+  with floats rounded to TOOL_RESULT_DIGITS significant digits. Results over
+  TOOL_RESULT_MAX_ROWS rows send the first TOOL_RESULT_PREVIEW_ROWS rows plus
+  min/max/mean (or distinct counts) per column and a handle.
+- Identical results within one round are sent once.
+- Errors and anything unrecognised pass through unchanged.
+
+Full payloads are kept in a process-wide ResultStore, bounded by entries and
+bytes, so the model can page through them with the read_result tool and the
+app can look them up by handle. Handles are local to the worker: after a
+restart, or on another worker, read_result asks the model to run the query
+again.
+"""
+import csv
+import io
+import logging
+import math
+import re
+import threading
+import uuid
+from collections import OrderedDict
+
+from config import env_int, env_str
+from formatting import parse_result
+from metrics import TOOL_RESULT_CHARS
+
+NULLS = ("", "None", "NULL", "null")
+
+
+class ResultStore:
+    """
+    LRU of full tool results by handle.
+
+    Parameters:
+    max_entries (int): Maximum number of results kept.
+    max_bytes (int): Cap on the approximate total size of kept results.
+    """
+
+    def __init__(self, max_entries=256, max_bytes=32 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # handle -> (kind, payload, size)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def put(self, kind, payload, size):
+        """Keep payload and return its new handle, e.g. tbl_1f2e3d4c."""
+        handle = f"{kind}_{uuid.uuid4().hex[:8]}"
+        with self._lock:
+            self._entries[handle] = (kind, payload, size)
+            self._bytes += size
+            while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+                _, (_, _, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self.evictions += 1
+        return handle
+
+    def get(self, handle):
+        """(kind, payload) for handle, or None when unknown or evicted."""
+        with self._lock:
+            entry = self._entries.get(handle)
+            if entry is None:
+                return None
+            self._entries.move_to_end(handle)
+            return entry[0], entry[1]
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self._bytes, "evictions": self.evictions}
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_result_store():
+    """Process-wide ResultStore sized by TOOL_RESULT_STORE_MAX_ENTRIES / TOOL_RESULT_STORE_MAX_BYTES."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = ResultStore(
+                max_entries=env_int('TOOL_RESULT_STORE_MAX_ENTRIES', 256),
+                max_bytes=env_int('TOOL_RESULT_STORE_MAX_BYTES', 32 * 1024 * 1024),
+            )
+        return _store
+
+
+def _number(cell):
+    """cell as int or float, or None when it is not a finite number."""
+    if isinstance(cell, bool):
+        return None
+    if isinstance(cell, (int, float)):
+        return cell if math.isfinite(cell) else None
+    try:
+        return int(cell)
+    except (TypeError, ValueError):
+        pass
+    try:
+        value = float(cell)
+    except (TypeError, ValueError):
+        return None
+    return value if math.isfinite(value) else None
+
+
+def _is_null(cell):
+    return cell is None or (isinstance(cell, str) and cell in NULLS)
+
+
+def column_types(rows, width):
+    """'int', 'real' or 'text' per column; NULLs are ignored."""
+    types = []
+    for index in range(width):
+        kind = "int"
+        for row in rows:
+            cell = row[index] if index < len(row) else None
+            if _is_null(cell):
+                continue
+            value = _number(cell)
+            if value is None:
+                kind = "text"
+                break
+            if isinstance(value, float):
+                kind = "real"
+        types.append(kind)
+    return types
+
+
+def round_number(value, digits):
+    """value with digits significant digits and no trailing zeros; integer parts are never cut."""
+    if isinstance(value, int) or value.is_integer() and abs(value) < 1e15:
+        return str(int(value))
+    if abs(value) >= 10 ** digits:
+        return str(round(value))
+    return format(value, f".{digits}g")
+
+
+def _cell_text(cell, kind, digits):
+    if _is_null(cell):
+        return ""
+    if kind == "text":
+        return str(cell)
+    value = _number(cell)
+    return round_number(value, digits) if kind == "real" else str(int(value))
+
+
+def _column_stats(name, kind, values, digits):
+    present = [value for value in values if not _is_null(value)]
+    if not present:
+        return f"{name}: all null"
+    nulls = f", {len(values) - len(present)} null" if len(present) < len(values) else ""
+    if kind == "text":
+        return f"{name}: {len(set(map(str, present)))} distinct{nulls}"
+    numbers = [_number(value) for value in present]
+    mean = sum(numbers) / len(numbers)
+    return (f"{name}: min {round_number(min(numbers), digits)}, max {round_number(max(numbers), digits)}, "
+            f"mean {round_number(float(mean), digits)}{nulls}")
+
+
+def encode_table(column_names, rows, remaining=0, digits=6, max_rows=50, preview_rows=20, handle=None):
+    """
+    Typed CSV text of a table for the model.
+
+    Parameters:
+    column_names (list): Column names.
+    rows (list): Rows of cells (strings as parsed from formatted text, or values).
+    remaining (int or None): Rows of the result not in rows; None when unknown.
+    digits (int): Significant digits kept for floats.
+    max_rows (int): Tables with more rows than this are cut to preview_rows rows and get column stats.
+    preview_rows (int): Rows sent for tables over max_rows.
+    handle (str, optional): Where the full result is kept, named when rows are left out.
+    """
+    types = column_types(rows, len(column_names))
+    shown = rows if len(rows) <= max_rows else rows[:preview_rows]
+    total = f"{len(rows) + remaining}" if remaining is not None else f"over {len(rows)}"
+    shape = f"{total} rows x {len(column_names)} columns"
+    if len(shown) < len(rows):
+        shape += f"; first {len(shown)} shown"
+        if handle is not None:
+            shape += f'; read_result("{handle}", offset, limit) for more'
+    if remaining != 0:
+        shape += f"; only {len(rows)} rows were read, filter or aggregate to see the rest"
+
+    out = io.StringIO()
+    out.write(shape + "\n")
+    writer = csv.writer(out, lineterminator="\n")
+    writer.writerow([f"{name}:{kind}" for name, kind in zip(column_names, types)])
+    for row in shown:
+        writer.writerow([_cell_text(row[index] if index < len(row) else None, kind, digits)
+                         for index, kind in enumerate(types)])
+    if len(shown) < len(rows):
+        stats = [_column_stats(name, kind, [row[index] if index < len(row) else None for row in rows], digits)
+                 for index, (name, kind) in enumerate(zip(column_names, types))]
+        out.write(f"stats over {len(rows)} rows: " + "; ".join(stats) + "\n")
+    return out.getvalue()
+
+
+def _plain_title(title):
+    # Chart titles carry HTML for the decimation note: "Title<br><sup>5000 points downsampled to 2000</sup>"
+    return re.sub(r"<[^>]+>", " ", title.replace("<br>", " - ")).replace("  ", " ").strip()
+
+
+def _axis_title(axis):
+    title = getattr(axis, "title", None)
+    return getattr(title, "text", None) or ""
+
+
+def summarize_figure(figure, handle, digits=6):
+    """One line describing a plotly figure: type, title, axes and value ranges."""
+    traces = list(figure.data)
+    layout = figure.layout
+    title = _plain_title(getattr(layout.title, "text", None) or "")
+    parts = []
+    for trace in traces[:3]:
+        kind = trace.type
+        if kind == "scatter":
+            kind = "line" if "lines" in (trace.mode or "") else "scatter"
+        x_values = list(trace.x if trace.x is not None else [])
+        y_values = [value for value in (trace.y if trace.y is not None else []) if _number(value) is not None]
+        x_label = _axis_title(layout.xaxis) or "x"
+        y_label = _axis_title(layout.yaxis) or "y"
+        if x_values and all(_number(value) is not None for value in x_values):
+            x_text = f"{x_label} {round_number(_number(min(x_values)), digits)}..{round_number(_number(max(x_values)), digits)}"
+        else:
+            names = ", ".join(str(value) for value in x_values[:5])
+            x_text = f"{x_label} [{names}{', ...' if len(x_values) > 5 else ''}]"
+        text = f"{kind}, {len(x_values)} points, x: {x_text}"
+        if y_values:
+            numbers = [_number(value) for value in y_values]
+            text += (f", y: {y_label} min {round_number(min(numbers), digits)}, max {round_number(max(numbers), digits)}, "
+                     f"mean {round_number(float(sum(numbers) / len(numbers)), digits)}")
+        parts.append(text)
+    if len(traces) > 3:
+        parts.append(f"{len(traces) - 3} more traces")
+    return f'[chart {handle} shown to the user: "{title}"; ' + "; ".join(parts) + "]"
+
+
+def figure_table(figure):
+    """(column_names, rows) of a figure's first trace, for read_result."""
+    trace = figure.data[0]
+    column_names = [_axis_title(figure.layout.xaxis) or "x", _axis_title(figure.layout.yaxis) or "y"]
+    return column_names, [list(pair) for pair in zip(trace.x if trace.x is not None else [],
+                                                     trace.y if trace.y is not None else [])]
+
+
+def _is_figure(value):
+    # Duck-typed so encoding never imports plotly
+    return hasattr(value, "data") and hasattr(value, "layout") and hasattr(value, "to_plotly_json")
+
+
+class ResultEncoder:
+    """
+    Encodes tool results for the model; see the module docstring.
+
+    Parameters:
+    store (ResultStore): Where full results are kept by handle.
+    fmt (str): RESULT_FORMAT of query_db output ('markdown', 'csv' or 'json').
+    digits (int): Significant digits kept for floats.
+    max_rows (int): Tables with more rows are cut to preview_rows rows with column stats.
+    preview_rows (int): Rows sent for large tables.
+    """
+
+    def __init__(self, store, fmt="markdown", digits=6, max_rows=50, preview_rows=20):
+        self.store = store
+        self.fmt = fmt
+        self.digits = digits
+        self.max_rows = max_rows
+        self.preview_rows = preview_rows
+
+    def encode(self, name, content):
+        """Model-facing text of one tool result."""
+        if _is_figure(content):
+            points = sum(len(trace.x) for trace in content.data if trace.x is not None)
+            handle = self.store.put("fig", content, points * 16 + 1024)
+            try:
+                return summarize_figure(content, handle, self.digits)
+            except Exception as error:
+                logging.warning(f"Could not summarize {name} figure: {error}")
+                return f"[chart {handle} shown to the user]"
+        text = str(content)
+        if name != "query_db" or text.startswith("Error"):
+            return text
+        table = parse_result(text, self.fmt)
+        if table is None:
+            return text
+        column_names, rows, remaining = table
+        handle = None
+        if len(rows) > self.max_rows:
+            handle = self.store.put("tbl", (column_names, rows, remaining), len(text))
+        encoded = encode_table(column_names, rows, remaining, self.digits, self.max_rows, self.preview_rows, handle)
+        # Tiny results can come out longer with the shape line; send whichever is shorter
+        return encoded if len(encoded) < len(text) else text
+
+    def encode_all(self, function_responses):
+        """
+        Tool messages for one round of tool calls, with each content encoded.
+
+        Identical results (e.g. the same query asked twice) are encoded once and
+        later copies refer to the first tool call.
+        """
+        messages = []
+        seen = {}
+        for item in function_responses:
+            content = item["content"]
+            key = (item["name"], content) if isinstance(content, str) else None
+            if key is not None and key in seen:
+                encoded = f"[same result as tool call {seen[key]}]"
+            else:
+                encoded = self.encode(item["name"], content)
+                if key is not None:
+                    seen[key] = item["tool_call_id"]
+            if isinstance(content, str):
+                TOOL_RESULT_CHARS.inc(len(content), form="raw")
+                TOOL_RESULT_CHARS.inc(len(encoded), form="encoded")
+            messages.append({**item, "content": encoded})
+        return messages
+
+
+def encoder_from_env():
+    """ResultEncoder configured from TOOL_RESULT_*, or None for TOOL_RESULT_ENCODING=raw."""
+    if env_str('TOOL_RESULT_ENCODING', 'compact').lower() == 'raw':
+        return None
+    return ResultEncoder(
+        get_result_store(),
+        fmt=env_str('RESULT_FORMAT', 'markdown'),
+        digits=env_int('TOOL_RESULT_DIGITS', 6),
+        max_rows=env_int('TOOL_RESULT_MAX_ROWS', 50),
+        preview_rows=env_int('TOOL_RESULT_PREVIEW_ROWS', 20),
+    )
+
+
+def encode_tool_results(function_responses):
+    """Tool messages for the conversation: compactly encoded, or str() of each result with TOOL_RESULT_ENCODING=raw."""
+    encoder = encoder_from_env()
+    if encoder is None:
+        return [{**item, "content": str(item["content"])} for item in function_responses]
+    return encoder.encode_all(function_responses)
+
+
+def read_result(handle, offset=0, limit=50):
+    """
+    Rows offset..offset+limit of a result kept by handle, as typed CSV.
+
+    Parameters:
+    handle (str): Handle from an encoded tool result (tbl_... or fig_...).
+    offset (int): First row.
+    limit (int): Number of rows, at most TOOL_RESULT_READ_MAX_ROWS.
+    """
+    found = get_result_store().get(handle)
+    if found is None:
+        return f"Error: result {handle} is no longer available; run the query again."
+    kind, payload = found
+    if kind == "fig":
+        column_names, rows = figure_table(payload)
+        remaining = 0
+    else:
+        column_names, rows, remaining = payload
+    offset = max(int(offset), 0)
+    limit = max(min(int(limit), env_int('TOOL_RESULT_READ_MAX_ROWS', 200)), 1)
+    page = rows[offset:offset + limit]
+    if not page:
+        return f"Error: {handle} has {len(rows)} rows, offset {offset} is past the end."
+    text = encode_table(column_names, page, 0, env_int('TOOL_RESULT_DIGITS', 6), max_rows=len(page))
+    total = f"{len(rows) + remaining}" if remaining is not None else f"over {len(rows)}"
+    return f"rows {offset}..{offset + len(page) - 1} of {total} from {handle}\n" + text.split("\n", 1)[1]
@@ -0,0 +1,595 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from config import env_bool, sqlite_db_path
+from db_pool import SQLitePool
+from query_cache import KEYWORDS, SQLiteVersion, TOKEN_RE, normalize_identifier
+
+SOURCE_TABLE = "machinelogs"
+
+# Grouping dimensions stored as-is in every rollup: normalized name -> source column
+DIMENSIONS = {
+    "type": '"Type"',
+    "machine failure": '"Machine failure"',
+    "twf": '"TWF"',
+    "hdf": '"HDF"',
+    "pwf": '"PWF"',
+    "osf": '"OSF"',
+    "rnf": '"RNF"',
+}
+FLAGS = set(DIMENSIONS) - {"type"}
+
+# Sensor measures: normalized name -> (short name, source column, integer column, bin width)
+SENSORS = {
+    "air temperature [k]": ("air_temperature", '"Air temperature [K]"', False, 1),
+    "process temperature [k]": ("process_temperature", '"Process temperature [K]"', False, 1),
+    "rotational speed [rpm]": ("rotational_speed", '"Rotational speed [rpm]"', True, 100),
+    "torque [nm]": ("torque", '"Torque [Nm]"', False, 5),
+    "tool wear [min]": ("tool_wear", '"Tool wear [min]"', True, 10),
+}
+
+# Rollup tables, smallest first: name -> binned sensor (None for failures by Type only)
+ROLLUPS = {"rollup_failures": None}
+ROLLUPS.update({f"rollup_{short}": sensor for sensor, (short, _, _, _) in SENSORS.items()})
+
+AGGREGATES = {"count", "sum", "avg", "min", "max"}
+FUNCTIONS = {"round", "abs", "coalesce", "ifnull", "upper", "lower", "cast"}
+TYPE_NAMES = {"integer", "int", "real", "float", "numeric", "text"}
+UNSUPPORTED = {"distinct", "join", "union", "intersect", "except", "having", "over", "select", "with", "window", "case"}
+
+
+class NotRoutable(Exception):
+    """The query cannot be answered exactly from the rollups."""
+
+
+def rollup_sql(name, sensor):
+    """CREATE TABLE ... AS SELECT statement building one rollup from src.Machinelogs."""
+    dims = list(DIMENSIONS.values())
+    columns = list(dims)
+    if sensor is not None:
+        short, column, _, width = SENSORS[sensor]
+        bin_expr = f"CAST({column} / {width} AS INTEGER)"
+        columns.append(f"{bin_expr} AS {short}_bin")
+        dims.append(bin_expr)
+    columns.append("COUNT(*) AS n")
+    for short, column, _, _ in SENSORS.values():
+        columns += [f"SUM({column}) AS sum_{short}", f"MIN({column}) AS min_{short}", f"MAX({column}) AS max_{short}"]
+    return f"CREATE TABLE {name} AS SELECT {', '.join(columns)} FROM src.Machinelogs GROUP BY {', '.join(dims)}"
+
+
+def reaggregate_sql(name, source):
+    """CREATE TABLE ... AS SELECT statement rolling a binned rollup up to Type x failure flags."""
+    dims = list(DIMENSIONS.values())
+    columns = dims + ["SUM(n) AS n"]
+    for short, _, _, _ in SENSORS.values():
+        columns += [f"SUM(sum_{short}) AS sum_{short}", f"MIN(min_{short}) AS min_{short}", f"MAX(max_{short}) AS max_{short}"]
+    return f"CREATE TABLE {name} AS SELECT {', '.join(columns)} FROM {source} GROUP BY {', '.join(dims)}"
+
+
+def _tokens(sql_query):
+    tokens = []
+    for match in TOKEN_RE.finditer(sql_query):
+        kind = match.lastgroup
+        if kind in ("ws", "comment"):
+            continue
+        text = match.group()
+        if kind == "word":
+            norm = text.lower()
+        elif kind == "qident":
+            norm = normalize_identifier(text).strip('"')
+        else:
+            norm = text
+        tokens.append((kind, norm, match.start(), match.end()))
+    return tokens
+
+
+def _split(tokens, separator=","):
+    """Split tokens at top-level separators."""
+    parts, current, depth = [], [], 0
+    for token in tokens:
+        if token[1] == "(":
+            depth += 1
+        elif token[1] == ")":
+            depth -= 1
+        if depth == 0 and token[1] == separator and token[0] == "op":
+            parts.append(current)
+            current = []
+        else:
+            current.append(token)
+    parts.append(current)
+    return parts
+
+
+def _is_identifier(token):
+    return token[0] == "qident" or token[0] == "word" and token[1] not in KEYWORDS
+
+
+class QueryRewriter:
+    """
+    Rewrites a single-table aggregate query over Machinelogs to the smallest rollup that answers it exactly.
+
+    Supported: COUNT(*), SUM/AVG/MIN/MAX over the failure flags and sensor columns,
+    grouping/filtering on Type and the failure flags, and at most one sensor binned
+    as CAST(col / W AS INTEGER), CAST(col AS INTEGER) or, for integer columns,
+    col / W, with W a multiple of that rollup's bin width. Anything else raises
+    NotRoutable.
+    """
+
+    def __init__(self, sql_query):
+        self.sql_query = sql_query
+        self.tokens = _tokens(sql_query)
+        self.binned = set()
+        self.aliases = {}      # normalized alias -> output label
+        self.alias_refs = {}   # normalized alias -> bare columns of its expression
+        self.alias_exprs = {}  # normalized alias -> (translated expression, contains an aggregate)
+        self.bare = set()
+        self.aggregated = False
+        self.grouped = False
+
+    def _clauses(self):
+        tokens = list(self.tokens)
+        while tokens and tokens[-1][1] == ";":
+            tokens.pop()
+        if not tokens or tokens[0][1] != "select" or any(t[1] == ";" for t in tokens):
+            raise NotRoutable("not a single SELECT")
+        if any(t[0] == "word" and t[1] in UNSUPPORTED for t in tokens[1:]):
+            raise NotRoutable("unsupported construct")
+
+        clauses, name, depth = {}, None, 0
+        i = 0
+        while i < len(tokens):
+            kind, norm = tokens[i][0], tokens[i][1]
+            if norm == "(":
+                depth += 1
+            elif norm == ")":
+                depth -= 1
+            if depth == 0 and kind == "word" and norm in ("select", "from", "where", "group", "order", "limit"):
+                name = norm
+                if norm in ("group", "order"):
+                    if i + 1 >= len(tokens) or tokens[i + 1][1] != "by":
+                        raise NotRoutable("malformed GROUP/ORDER BY")
+                    i += 1
+                if name in clauses:
+                    raise NotRoutable("repeated clause")
+                clauses[name] = []
+            else:
+                clauses[name].append(tokens[i])
+            i += 1
+        return clauses
+
+    def _strip_alias_qualifier(self, clauses):
+        source = clauses.get("from") or []
+        if not source or source[0][1] != SOURCE_TABLE or source[0][0] not in ("word", "qident"):
+            raise NotRoutable("not a query over Machinelogs")
+        rest = source[1:]
+        if rest and rest[0][1] == "as":
+            rest = rest[1:]
+        if len(rest) > 1 or rest and not _is_identifier(rest[0]):
+            raise NotRoutable("unsupported FROM clause")
+        qualifiers = {SOURCE_TABLE} | ({rest[0][1]} if rest else set())
+        for name, tokens in clauses.items():
+            stripped, i = [], 0
+            while i < len(tokens):
+                if tokens[i][1] in qualifiers and i + 1 < len(tokens) and tokens[i + 1][1] == ".":
+                    i += 2
+                    continue
+                stripped.append(tokens[i])
+                i += 1
+            clauses[name] = stripped
+
+    def _column(self, token):
+        if token[0] not in ("word", "qident"):
+            return None
+        return token[1]
+
+    def _aggregate(self, function, inner):
+        inner_norm = [t[1] for t in inner]
+        if function == "count" and inner_norm in (["*"], ["1"]):
+            return "SUM(n)" if self.grouped else "COALESCE(SUM(n), 0)"
+        if len(inner) != 1:
+            raise NotRoutable("aggregate over an expression")
+        column = self._column(inner[0])
+        if column in DIMENSIONS and function == "count":
+            return "SUM(n)" if self.grouped else "COALESCE(SUM(n), 0)"
+        if column in FLAGS:
+            source = DIMENSIONS[column]
+            if function == "sum":
+                return f"SUM({source} * n)"
+            if function == "avg":
+                return f"(SUM({source} * n) * 1.0 / SUM(n))"
+            return f"{function.upper()}({source})"
+        if column in SENSORS:
+            short = SENSORS[column][0]
+            if function == "count":
+                return "SUM(n)" if self.grouped else "COALESCE(SUM(n), 0)"
+            if function == "avg":
+                return f"(SUM(sum_{short}) * 1.0 / SUM(n))"
+            return f"{function.upper()}({function}_{short})"
+        raise NotRoutable(f"aggregate over unsupported column {column!r}")
+
+    def _bin(self, sensor, width_token):
+        short, _, _, bin_width = SENSORS[sensor]
+        try:
+            width = float(width_token[1])
+        except ValueError:
+            raise NotRoutable("non-numeric bin width")
+        factor = width / bin_width
+        if width <= 0 or factor != int(factor):
+            raise NotRoutable("bin width is not a multiple of the rollup's")
+        self.binned.add(sensor)
+        factor = int(factor)
+        return f"{short}_bin" if factor == 1 else f"({short}_bin / {factor})"
+
+    def translate(self, tokens, allow_aggregates, allow_aliases=False):
+        """
+        Translate an expression to rollup columns, token by token.
+
+        Sets self.bare to the dimension/bin columns used outside aggregates and
+        self.aggregated when the expression contains an aggregate.
+        """
+        self.bare = set()
+        self.aggregated = False
+        out = []
+        i = 0
+        while i < len(tokens):
+            kind, norm = tokens[i][0], tokens[i][1]
+            following = [t[1] for t in tokens[i + 1:i + 8]]
+
+            if kind == "word" and norm in AGGREGATES and following[:1] == ["("]:
+                if not allow_aggregates:
+                    raise NotRoutable("aggregate outside SELECT/ORDER BY")
+                depth, j = 0, i + 1
+                while j < len(tokens):
+                    depth += {"(": 1, ")": -1}.get(tokens[j][1], 0)
+                    if depth == 0:
+                        break
+                    j += 1
+                out.append(self._aggregate(norm, tokens[i + 2:j]))
+                self.aggregated = True
+                i = j + 1
+                continue
+
+            # CAST(sensor AS INTEGER), a bin of width 1
+            if (norm == "cast" and following[:1] == ["("] and len(following) >= 5 and following[1] in SENSORS
+                    and following[2] == "as" and following[3] in ("integer", "int") and following[4] == ")"):
+                out.append(self._bin(following[1], ("number", "1")))
+                self.bare.add(out[-1])
+                i += 6
+                continue
+
+            # CAST(sensor / W AS INTEGER)
+            if (norm == "cast" and following[:1] == ["("] and len(following) >= 6
+                    and following[1] in SENSORS and following[2] == "/" and following[4] == "as"
+                    and following[5] in ("integer", "int") and following[6:7] == [")"]):
+                out.append(self._bin(following[1], tokens[i + 4]))
+                self.bare.add(out[-1])
+                i += 8
+                continue
+
+            if kind == "word" and (norm in FUNCTIONS or norm in TYPE_NAMES or norm in KEYWORDS):
+                out.append(self.sql_query[tokens[i][2]:tokens[i][3]])
+                i += 1
+                continue
+
+            column = self._column(tokens[i])
+            if column in SENSORS:
+                # Integer division of an integer sensor column is a bin as well, but only
+                # by an integer literal (a float divisor keeps the fraction) and only when
+                # the column is the division's left operand: in 2 * col / 10 or
+                # 1.0 * col / 10 the product is divided, not the column
+                if SENSORS[column][2] and following[:1] == ["/"] and len(following) > 1:
+                    divisor = tokens[i + 2]
+                    if divisor[0] != "number" or not divisor[1].isdigit():
+                        raise NotRoutable("sensor column divided by a non-integer")
+                    if i > 0 and tokens[i - 1][1] in ("*", "/", "%"):
+                        raise NotRoutable("sensor column is the right operand of * / %")
+                    # 'x' || col / 10 and -col / 10 apply || and the unary operator first
+                    previous = tokens[i - 1][1] if i > 0 else None
+                    before = tokens[i - 2] if i > 1 else ("op", "(")
+                    unary = previous in ("-", "+") and (before[0] == "op" and before[1] != ")"
+                                                        or before[0] == "word" and before[1] in KEYWORDS)
+                    if previous in ("||", "~") or unary:
+                        raise NotRoutable("sensor column bound to a tighter operator")
+                    if following[2:3] and following[2] in ("||", "collate"):
+                        raise NotRoutable("divisor bound to a tighter operator")
+                    out.append(self._bin(column, divisor))
+                    self.bare.add(out[-1])
+                    i += 3
+                    continue
+                raise NotRoutable(f"sensor column {column!r} outside an aggregate")
+            if column in DIMENSIONS:
+                out.append(DIMENSIONS[column])
+                self.bare.add(out[-1])
+            elif column is not None and allow_aliases and column in self.aliases:
+                out.append(self._alias_expression(column, allow_aggregates))
+            elif column is not None:
+                raise NotRoutable(f"unknown column or function {column!r}")
+            else:
+                out.append(self.sql_query[tokens[i][2]:tokens[i][3]])
+            i += 1
+        return " ".join(out)
+
+    def _alias_expression(self, alias, allow_aggregates):
+        # The alias itself would bind to a rollup column of the same name (n,
+        # tool_wear_bin, sum_torque, ...), so the SELECT expression is repeated
+        expression, aggregated = self.alias_exprs[alias]
+        if aggregated and not allow_aggregates:
+            raise NotRoutable("aggregate alias in GROUP BY")
+        self.aggregated = self.aggregated or aggregated
+        self.bare.update(self.alias_refs[alias])
+        return f"({expression})"
+
+    def rewrite(self):
+        """Return (rollup_table, rewritten_sql)."""
+        clauses = self._clauses()
+        self._strip_alias_qualifier(clauses)
+        self.grouped = "group" in clauses
+
+        items = []
+        for item in _split(clauses["select"]):
+            if not item:
+                raise NotRoutable("empty select item")
+            alias = None
+            if len(item) >= 3 and item[-2][1] == "as" and _is_identifier(item[-1]):
+                alias, item = item[-1], item[:-2]
+            elif (len(item) >= 2 and _is_identifier(item[-1]) and not (item[0][0] == "word" and item[0][1] in KEYWORDS)
+                    and (item[-2][1] == ")" or _is_identifier(item[-2]) or item[-2][0] == "number")):
+                # NOT TWF and CASE ... END are expressions, not an expression and an alias
+                alias, item = item[-1], item[:-1]
+            if alias is not None:
+                raw = self.sql_query[alias[2]:alias[3]]
+                label = raw[1:-1].replace('""', '"') if alias[0] == "qident" else raw
+                self.aliases[alias[1]] = label
+            elif len(item) == 1 and item[0][1] in DIMENSIONS:
+                label = None  # a bare column keeps its declared name
+            else:
+                label = self.sql_query[item[0][2]:item[-1][3]]
+            items.append((item, alias[1] if alias is not None else None, label))
+
+        select = []
+        item_refs = []
+        for item, alias, label in items:
+            expression = self.translate(item, allow_aggregates=True)
+            if not self.grouped and not self.aggregated:
+                raise NotRoutable("row-level select item")
+            item_refs.append(self.bare)
+            if alias is not None:
+                self.alias_refs[alias] = self.bare
+                self.alias_exprs[alias] = (expression, self.aggregated)
+            select.append(expression if label is None else f'{expression} AS "{label.replace(chr(34), chr(34) * 2)}"')
+        sql = f"SELECT {', '.join(select)}"
+
+        where = ""
+        if "where" in clauses:
+            where = f" WHERE {self.translate(clauses['where'], allow_aggregates=False)}"
+
+        group = ""
+        if self.grouped:
+            groups = []
+            group_refs = set()
+            for part in _split(clauses["group"]):
+                if len(part) == 1 and part[0][0] == "number":
+                    position = int(part[0][1])
+                    if not 1 <= position <= len(item_refs):
+                        raise NotRoutable("GROUP BY position out of range")
+                    groups.append(part[0][1])
+                    group_refs |= item_refs[position - 1]
+                else:
+                    groups.append(self.translate(part, allow_aggregates=False, allow_aliases=True))
+                    group_refs |= self.bare
+            # Columns outside aggregates must be grouped on, else SQLite picks an arbitrary row
+            if any(not refs <= group_refs for refs in item_refs):
+                raise NotRoutable("ungrouped column in SELECT")
+            group = f" GROUP BY {', '.join(groups)}"
+
+        order = ""
+        if "order" in clauses:
+            parts = []
+            for part in _split(clauses["order"]):
+                direction = ""
+                if part and part[-1][1] in ("asc", "desc"):
+                    direction, part = f" {part[-1][1].upper()}", part[:-1]
+                if len(part) == 1 and _is_identifier(part[0]) and part[0][1] in self.aliases:
+                    # A bare name in ORDER BY is a SELECT alias before it is a column
+                    expression = self._alias_expression(part[0][1], allow_aggregates=True)
+                else:
+                    expression = self.translate(part, allow_aggregates=True, allow_aliases=True)
+                parts.append(expression + direction)
+            order = f" ORDER BY {', '.join(parts)}"
+
+        limit = ""
+        if "limit" in clauses:
+            limit_tokens = clauses["limit"]
+            if any(t[0] not in ("number", "op") and t[1] != "offset" for t in limit_tokens):
+                raise NotRoutable("non-literal LIMIT")
+            limit = " LIMIT " + " ".join(t[1].upper() if t[1] == "offset" else t[1] for t in limit_tokens)
+
+        if len(self.binned) > 1:
+            raise NotRoutable("more than one binned sensor")
+        sensor = next(iter(self.binned), None)
+        table = next(name for name, binned in ROLLUPS.items() if binned == sensor)
+        return table, f"{sql} FROM {table}{where}{group}{order}{limit}"
+
+
+def rewrite_to_rollup(sql_query):
+    """Return (rollup_table, sql) for an equivalent rollup query, or None."""
+    try:
+        return QueryRewriter(sql_query).rewrite()
+    except NotRoutable as reason:
+        logging.debug(f"Not routed to rollups ({reason}): {sql_query}")
+        return None
+    except (IndexError, KeyError):
+        return None
+
+
+class RollupStore:
+    """
+    Precomputed failure rollups over Machinelogs, kept in a sidecar SQLite file.
+
+    Each rollup groups by Type and all failure flags (plus one binned sensor) and
+    stores row counts and per-sensor SUM/MIN/MAX, so failure counts and rates and
+    sensor averages by Type, failure mode or sensor range read a few hundred rows
+    instead of scanning the table. The rollups are rebuilt on a background thread
+    whenever the source database changes; while they are stale or being rebuilt,
+    queries are not routed and run against the source table as usual.
+
+    Parameters:
+    db_path (str): Source SQLite database.
+    rollup_path (str, optional): Sidecar file; defaults to <db_path>.rollups.
+    """
+
+    def __init__(self, db_path, rollup_path=None, pool_size=2):
+        self.db_path = os.path.abspath(db_path)
+        self.rollup_path = rollup_path or self.db_path + ".rollups"
+        self.pool_size = pool_size
+        self._version = SQLiteVersion(self.db_path)
+        self._source_version = None
+        self._pool = None
+        self._building = False
+        self._lock = threading.Lock()
+        self.routed = 0
+        self.fallbacks = 0
+
+    @staticmethod
+    def _version_key(version):
+        return repr(version)
+
+    def _read_meta(self):
+        if not os.path.exists(self.rollup_path):
+            return None
+        try:
+            connection = sqlite3.connect(f"file:{self.rollup_path}?mode=ro", uri=True)
+            try:
+                meta = dict(connection.execute("SELECT key, value FROM rollup_meta").fetchall())
+            finally:
+                connection.close()
+        except sqlite3.Error:
+            return None
+        return meta
+
+    def build(self):
+        """Build all rollups into a temporary file and swap it in. Blocking."""
+        version = self._version()
+        start = time.perf_counter()
+        tmp_path = self.rollup_path + ".tmp"
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        connection = sqlite3.connect(tmp_path)
+        try:
+            connection.execute("PRAGMA journal_mode = OFF")
+            connection.execute("PRAGMA synchronous = OFF")
+            connection.execute("ATTACH DATABASE ? AS src", (f"file:{self.db_path}?mode=ro",))
+            columns = list(DIMENSIONS.values()) + [column for _, column, _, _ in SENSORS.values()]
+            # AVG = SUM / n and COUNT(col) = COUNT(*) only hold without NULLs
+            null_counts = connection.execute(
+                f"SELECT COUNT(*), {', '.join(f'COUNT({c})' for c in columns)} FROM src.Machinelogs").fetchone()
+            if any(count != null_counts[0] for count in null_counts[1:]):
+                raise ValueError("source table has NULLs in rollup columns; rollups disabled")
+            binned = [(name, sensor) for name, sensor in ROLLUPS.items() if sensor is not None]
+            for name, sensor in binned:
+                connection.execute(rollup_sql(name, sensor))
+            # The unbinned rollup is derived from a binned one instead of rescanning the source
+            for name, sensor in ROLLUPS.items():
+                if sensor is None:
+                    connection.execute(reaggregate_sql(name, binned[0][0]))
+            connection.execute("CREATE TABLE rollup_meta (key TEXT PRIMARY KEY, value TEXT)")
+            connection.executemany("INSERT INTO rollup_meta VALUES (?, ?)", [
+                ("source_version", self._version_key(version)),
+                ("source_rows", str(null_counts[0])),
+                ("built_at", str(time.time())),
+            ])
+            connection.commit()
+        finally:
+            connection.close()
+        os.replace(tmp_path, self.rollup_path)
+        self._swap_pool(version)
+        logging.info(f"Rollups built from {null_counts[0]} rows in {time.perf_counter() - start:.2f}s")
+
+    def _swap_pool(self, version):
+        # Connections to the replaced file would keep reading the old rollups
+        with self._lock:
+            old, self._pool = self._pool, SQLitePool(self.rollup_path, size=self.pool_size)
+            self._source_version = version
+        if old is not None:
+            old.close()
+
+    def _build_in_background(self):
+        try:
+            self.build()
+        except Exception as e:
+            logging.error(f"Building rollups failed: {e}")
+        finally:
+            self._building = False
+
+    def ensure_fresh(self):
+        """Return True when the rollups match the source; otherwise start a rebuild and return False."""
+        version = self._version()
+        if self._source_version is not None and version == self._source_version:
+            return True
+        meta = self._read_meta()
+        if meta is not None and meta.get("source_version") == self._version_key(version):
+            self._swap_pool(version)
+            return True
+        with self._lock:
+            if not self._building:
+                self._building = True
+                threading.Thread(target=self._build_in_background, name="rollup-build", daemon=True).start()
+        return False
+
+    async def run(self, sql_query):
+        """
+        Answer a query from the rollups if possible.
+
+        Returns (rows, column_names), or None when the caller should query the source table.
+        """
+        rewritten = rewrite_to_rollup(sql_query)
+        if rewritten is None or not self.ensure_fresh():
+            if rewritten is not None:
+                self.fallbacks += 1
+            return None
+        table, rollup_query = rewritten
+        self.routed += 1
+        logging.info(f"Query routed to {table}: {rollup_query}")
+        try:
+            return await self._pool.run(rollup_query)
+        except sqlite3.Error as e:
+            return self._failed(e, rollup_query)
+
+    async def run_formatted(self, sql_query, formatter):
+        """Like run(), but returns text produced by formatter, or None."""
+        rewritten = rewrite_to_rollup(sql_query)
+        if rewritten is None or not self.ensure_fresh():
+            if rewritten is not None:
+                self.fallbacks += 1
+            return None
+        table, rollup_query = rewritten
+        self.routed += 1
+        logging.info(f"Query routed to {table}: {rollup_query}")
+        try:
+            return await self._pool.run_formatted(rollup_query, formatter)
+        except sqlite3.Error as e:
+            return self._failed(e, rollup_query)
+
+    def _failed(self, error, rollup_query):
+        # A rewrite the rollups reject is a rewriter bug, not the user's: the source table answers instead
+        self.fallbacks += 1
+        logging.warning(f"Rollup query failed ({error}), falling back to the source table: {rollup_query}")
+        return None
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_rollup_store():
+    """Process-wide rollup store, or None when ROLLUPS_ENABLED is off."""
+    global _store
+    if not env_bool('ROLLUPS_ENABLED', True):
+        return None
+    with _store_lock:
+        if _store is None:
+            _store = RollupStore(sqlite_db_path())
+    return _store
@@ -0,0 +1,355 @@
+"""
+Chat session state kept outside the app process.
+
+With SESSION_STORE set, each session's conversation (messages after the system
+prompt, with tool outputs of finished turns already reduced to their digests,
+and the memory bookkeeping) is saved after every turn, so any worker behind a
+load balancer can continue any session and a restarted worker loses nothing.
+
+State is stored as compact JSON, zlib-compressed above COMPRESS_MIN_BYTES,
+together with a random version token. Workers keep the sessions they served in
+a local LRU and only compare version tokens at the start of a turn: the state
+is decoded and a ChatBot rebuilt only when another worker (or a restart) has
+changed it since.
+
+Stores: SQLiteSessionStore (a file shared by workers on one host) and
+RedisSessionStore over any client with redis-py's get/set/delete, e.g. the
+redis package for redis:// URLs or LocalRedis, an in-process stand-in.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+import uuid
+import zlib
+from collections import OrderedDict
+
+from config import env_int, env_str
+from metrics import SESSION_LOADS
+from tracing import span
+
+FORMAT_VERSION = 1
+# Below this the zlib header and CPU cost outweigh the savings
+COMPRESS_MIN_BYTES = 1024
+
+
+def encode_state(state):
+    """State dict as bytes: b"j" + JSON, or b"z" + zlib-compressed JSON."""
+    data = json.dumps({"v": FORMAT_VERSION, **state}, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+    if len(data) >= COMPRESS_MIN_BYTES:
+        return b"z" + zlib.compress(data, 1)
+    return b"j" + data
+
+
+def decode_state(blob):
+    """Inverse of encode_state; raises ValueError for unknown formats."""
+    blob = bytes(blob)
+    if blob[:1] == b"z":
+        data = zlib.decompress(blob[1:])
+    elif blob[:1] == b"j":
+        data = blob[1:]
+    else:
+        raise ValueError("unknown session state encoding")
+    state = json.loads(data)
+    if state.pop("v", None) != FORMAT_VERSION:
+        raise ValueError("unknown session state version")
+    return state
+
+
+class SQLiteSessionStore:
+    """
+    Session states in a SQLite file (WAL), shared by the workers of one host and kept across restarts.
+
+    Parameters:
+    path (str): SQLite file; created if missing.
+    ttl_s (float, optional): Sessions not saved for this long are deleted.
+    """
+
+    def __init__(self, path, ttl_s=None):
+        self.path = path
+        self.ttl_s = ttl_s
+        self.saves = 0
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode = WAL")
+        self._connection.execute("PRAGMA synchronous = NORMAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            "session_id TEXT PRIMARY KEY, version TEXT NOT NULL, state BLOB NOT NULL, saved_at REAL NOT NULL)"
+        )
+        self._connection.execute("CREATE INDEX IF NOT EXISTS sessions_saved_at ON sessions (saved_at)")
+        self._lock = threading.Lock()
+
+    def _expired(self, saved_at):
+        return self.ttl_s is not None and time.time() - saved_at > self.ttl_s
+
+    def version(self, session_id):
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT version, saved_at FROM sessions WHERE session_id = ?", (session_id,)
+            ).fetchone()
+        if row is None or self._expired(row[1]):
+            return None
+        return row[0]
+
+    def load(self, session_id):
+        """Return (version, blob) or None."""
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT version, state, saved_at FROM sessions WHERE session_id = ?", (session_id,)
+            ).fetchone()
+        if row is None or self._expired(row[2]):
+            return None
+        return row[0], bytes(row[1])
+
+    def save(self, session_id, version, blob):
+        now = time.time()
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO sessions (session_id, version, state, saved_at) VALUES (?, ?, ?, ?)",
+                (session_id, version, blob, now),
+            )
+            self.saves += 1
+            if self.ttl_s is not None and self.saves % 100 == 0:
+                self._connection.execute("DELETE FROM sessions WHERE saved_at < ?", (now - self.ttl_s,))
+
+    def delete(self, session_id):
+        with self._lock:
+            self._connection.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+
+class LocalRedis:
+    """
+    In-process stand-in for the subset of redis-py used by RedisSessionStore (get, set with ex, delete).
+
+    For development, tests and benchmarks: state is shared only by the managers of one process.
+    """
+
+    def __init__(self):
+        self._data = {}  # key -> (value, expires_at or None)
+        self._lock = threading.Lock()
+
+    def get(self, name):
+        with self._lock:
+            entry = self._data.get(name)
+            if entry is None:
+                return None
+            if entry[1] is not None and time.monotonic() > entry[1]:
+                del self._data[name]
+                return None
+            return entry[0]
+
+    def set(self, name, value, ex=None):
+        if isinstance(value, str):
+            value = value.encode("utf-8")
+        with self._lock:
+            self._data[name] = (bytes(value), time.monotonic() + ex if ex else None)
+        return True
+
+    def delete(self, *names):
+        with self._lock:
+            return sum(self._data.pop(name, None) is not None for name in names)
+
+
+class RedisSessionStore:
+    """
+    Session states in Redis (or anything with redis-py's get/set/delete), shared by workers on any host.
+
+    Each session uses two keys: <prefix><id> holds the version token and the
+    state, <prefix><id>:v the version token alone, so the per-turn freshness
+    check reads a few bytes.
+
+    Parameters:
+    client: redis.Redis or LocalRedis (bytes values).
+    prefix (str): Key prefix.
+    ttl_s (int, optional): Expiry of both keys, refreshed on every save.
+    """
+
+    def __init__(self, client, prefix="session:", ttl_s=None):
+        self.client = client
+        self.prefix = prefix
+        self.ttl_s = int(ttl_s) if ttl_s else None
+
+    def version(self, session_id):
+        version = self.client.get(f"{self.prefix}{session_id}:v")
+        return version.decode("ascii") if version is not None else None
+
+    def load(self, session_id):
+        value = self.client.get(f"{self.prefix}{session_id}")
+        if value is None:
+            return None
+        version, _, blob = bytes(value).partition(b"\n")
+        return version.decode("ascii"), blob
+
+    def save(self, session_id, version, blob):
+        # State first: a reader that sees the new version token always finds the new state
+        self.client.set(f"{self.prefix}{session_id}", version.encode("ascii") + b"\n" + blob, ex=self.ttl_s)
+        self.client.set(f"{self.prefix}{session_id}:v", version.encode("ascii"), ex=self.ttl_s)
+
+    def delete(self, session_id):
+        self.client.delete(f"{self.prefix}{session_id}", f"{self.prefix}{session_id}:v")
+
+
+class SessionManager:
+    """
+    Resolves a session id to a ChatBot, rehydrating it from the store only when needed.
+
+    A ChatBot this worker already holds is reused while the stored version
+    token still matches the one it saved or loaded; otherwise the stored state
+    is decoded into a new ChatBot from create(). Store errors are logged and the
+    local ChatBot (or a new one) is used, so an unavailable store never breaks a
+    chat.
+
+    Parameters:
+    store: SQLiteSessionStore, RedisSessionStore or an object with the same
+        version/load/save/delete methods. Its methods block and run on the
+        default executor.
+    max_local (int): ChatBots kept in this worker's LRU.
+    """
+
+    def __init__(self, store, max_local=1000):
+        self.store = store
+        self.max_local = max_local
+        self._local = OrderedDict()  # session_id -> [chat_bot, version, sha1 of the saved state]
+        self.loads = {"local": 0, "store": 0, "new": 0}
+        self.saves = 0
+        self.skipped_saves = 0
+        self.saved_bytes = 0
+
+    async def _call(self, method, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, method, *args)
+
+    def _remember(self, session_id, chat_bot, version, digest):
+        self._local[session_id] = [chat_bot, version, digest]
+        self._local.move_to_end(session_id)
+        while len(self._local) > self.max_local:
+            self._local.popitem(last=False)
+
+    def _loaded(self, source):
+        self.loads[source] += 1
+        SESSION_LOADS.inc(source=source)
+
+    async def get(self, session_id, create):
+        """
+        ChatBot for session_id.
+
+        Parameters:
+        session_id (str): Stable id of the conversation.
+        create (coroutine function): Returns a new ChatBot (system prompt and tools of this worker).
+        """
+        with span("session.load") as load_span:
+            local = self._local.get(session_id)
+            try:
+                version = await self._call(self.store.version, session_id)
+            except Exception as error:
+                logging.warning(f"Session store unavailable, using local state: {error}")
+                version = local[1] if local is not None else None
+            if local is not None and local[1] == version:
+                self._local.move_to_end(session_id)
+                self._loaded("local")
+                load_span.set(source="local")
+                return local[0]
+
+            chat_bot = None
+            if version is not None:
+                try:
+                    found = await self._call(self.store.load, session_id)
+                    if found is not None:
+                        version, blob = found
+                        state = decode_state(blob)
+                        chat_bot = await create()
+                        chat_bot.restore(state)
+                        load_span.set(source="store", state_bytes=len(blob), messages=len(state["messages"]))
+                        self._loaded("store")
+                        self._remember(session_id, chat_bot, version, hashlib.sha1(blob).hexdigest())
+                except Exception as error:
+                    logging.warning(f"Could not restore session {session_id}: {error}")
+                    chat_bot = None
+            if chat_bot is None:
+                if local is not None:
+                    # The stored state is gone or unreadable: carry on with what this worker has
+                    chat_bot = local[0]
+                    local[1] = None
+                else:
+                    chat_bot = await create()
+                    self._remember(session_id, chat_bot, None, None)
+                load_span.set(source="new")
+                self._loaded("new")
+            return chat_bot
+
+    async def save(self, session_id, chat_bot):
+        """Store the session's state after a turn; unchanged states are not rewritten."""
+        with span("session.save") as save_span:
+            blob = encode_state(chat_bot.to_state())
+            digest = hashlib.sha1(blob).hexdigest()
+            local = self._local.get(session_id)
+            if local is not None and local[0] is chat_bot and local[2] == digest:
+                self.skipped_saves += 1
+                save_span.set(skipped=True)
+                return
+            version = uuid.uuid4().hex[:16]
+            try:
+                await self._call(self.store.save, session_id, version, blob)
+            except Exception as error:
+                logging.warning(f"Could not save session {session_id}: {error}")
+                version = None
+            self._remember(session_id, chat_bot, version, digest if version is not None else None)
+            self.saves += 1
+            self.saved_bytes += len(blob)
+            save_span.set(state_bytes=len(blob))
+
+    async def delete(self, session_id):
+        self._local.pop(session_id, None)
+        await self._call(self.store.delete, session_id)
+
+    def stats(self):
+        return {
+            "loads": dict(self.loads),
+            "saves": self.saves,
+            "skipped_saves": self.skipped_saves,
+            "mean_state_bytes": self.saved_bytes / self.saves if self.saves else 0.0,
+            "local_sessions": len(self._local),
+        }
+
+
+def session_store_from_url(url, ttl_s=None):
+    """
+    Store for SESSION_STORE: redis:// or rediss:// URL (needs the redis package),
+    local (LocalRedis, this process only), or a SQLite file path (sqlite:/// prefix optional).
+    """
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        # Imported here: only Redis deployments need the redis package
+        import redis
+
+        return RedisSessionStore(redis.Redis.from_url(url), ttl_s=ttl_s)
+    if url == "local":
+        return RedisSessionStore(LocalRedis(), ttl_s=ttl_s)
+    if url.startswith("sqlite:///"):
+        url = url[len("sqlite:///"):]
+    return SQLiteSessionStore(url, ttl_s=ttl_s)
+
+
+_manager = None
+_manager_lock = threading.Lock()
+
+
+def get_session_manager():
+    """Process-wide SessionManager for SESSION_STORE, or None when unset (sessions live in this process only)."""
+    global _manager
+    url = env_str('SESSION_STORE')
+    if not url:
+        return None
+    with _manager_lock:
+        if _manager is None:
+            ttl_s = env_int('SESSION_TTL_S', 7 * 24 * 3600)
+            store = session_store_from_url(url, ttl_s=ttl_s if ttl_s > 0 else None)
+            _manager = SessionManager(store, max_local=env_int('SESSION_LOCAL_MAX', 1000))
+            logging.info(f"Session state stored in {url}")
+        return _manager
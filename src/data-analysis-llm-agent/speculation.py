@@ -0,0 +1,428 @@
+"""
+Speculative prefetch of likely follow-up queries.
+
+While the model reads a query_db result and writes its answer, the database
+sits idle. With SPECULATION_ENABLED, every successful query_db call schedules a
+few likely next queries in the background, so the result cache already holds
+them when the follow-up question arrives:
+
+- follow-ups seen in other sessions: SQL that was run right after the same
+  (canonical) query, most frequent first;
+- templates over the ai4i2020 columns: for a query on Machinelogs, the
+  failure-mode breakdown, failure rate and sensor averages over the same
+  grouping (Type when it has none; aliases and ordinals in GROUP BY are
+  resolved against the SELECT list, aggregate groupings get no templates)
+  and the same filters.
+
+Speculative queries take query_db's normal path (rollups, column store,
+SQLite) and fill the result cache only: results that are already cached are
+skipped and the index advisor does not see them. They run outside the tool
+executor under their own caps. They only start while fewer than
+SPECULATION_MAX_BUSY tool calls are running, since speculation pays off only
+on otherwise idle database capacity; at most SPECULATION_MAX_CONCURRENCY run
+at once (further candidates are dropped, not queued), SPECULATION_MAX_QUERIES per
+trigger, SPECULATION_TIMEOUT_S per query (cancelled, which interrupts SQLite)
+and SPECULATION_BUDGET_S database seconds per minute. A query_db call for a
+query that is still being prefetched waits for that prefetch instead of
+running it again (and is then no longer cancelled at the timeout). A cache hit
+on, or a wait for, a prefetched result counts as used; stats() and the
+speculation metrics report how often that happens and the query time it saved.
+"""
+import asyncio
+import contextvars
+import logging
+import threading
+import time
+from collections import OrderedDict, deque
+
+from config import env_bool, env_float, env_int
+from metrics import SPECULATIVE_HITS, SPECULATIVE_QUERIES
+from query_cache import KEYWORDS, canonicalize_sql, tokenize_sql
+from tracing import trace
+
+TABLE = "machinelogs"
+FAILURE_MODES = ("TWF", "HDF", "PWF", "OSF", "RNF")
+SENSORS = (
+    ("Air temperature [K]", "avg_air_temperature"),
+    ("Process temperature [K]", "avg_process_temperature"),
+    ("Rotational speed [rpm]", "avg_rotational_speed"),
+    ("Torque [Nm]", "avg_torque"),
+    ("Tool wear [min]", "avg_tool_wear"),
+)
+CLAUSES = ("from", "where", "group", "having", "order", "limit")
+AGGREGATES = {"count", "sum", "avg", "min", "max", "total", "group_concat"}
+
+# Inside a speculative prefetch: its state, {"prefetched": bool, "joined": bool}
+_speculative = contextvars.ContextVar("speculative", default=None)
+
+
+def is_speculative():
+    """True inside a speculative prefetch (query_db only fills the cache then)."""
+    return _speculative.get() is not None
+
+
+def _clauses(sql_query):
+    """{clause: (kind, text) tokens} for a single-table SELECT; None for anything else (joins, subqueries, unions)."""
+    tokens = tokenize_sql(sql_query)
+    while tokens and tokens[-1] == ("op", ";"):
+        tokens.pop()
+    words = [text.lower() if kind == "word" else None for kind, text in tokens]
+    if not words or words[0] != "select" or words.count("select") > 1 or {"join", "union", "with"} & set(words):
+        return None
+    clauses = {"select": []}
+    current = "select"
+    depth = 0
+    i = 1
+    while i < len(tokens):
+        text = tokens[i][1]
+        if text == "(":
+            depth += 1
+        elif text == ")":
+            depth -= 1
+        if depth == 0 and words[i] in CLAUSES:
+            current = words[i]
+            clauses[current] = []
+            if current in ("group", "order") and i + 1 < len(tokens) and words[i + 1] == "by":
+                i += 1
+        else:
+            clauses[current].append(tokens[i])
+        i += 1
+    return clauses
+
+
+def _items(tokens):
+    """Top-level comma-separated items of a clause."""
+    items, current, depth = [], [], 0
+    for kind, text in tokens:
+        if text == "(":
+            depth += 1
+        elif text == ")":
+            depth -= 1
+        if depth == 0 and text == ",":
+            items.append(current)
+            current = []
+        else:
+            current.append((kind, text))
+    if current:
+        items.append(current)
+    return items
+
+
+def _name(token):
+    return token[1].strip('"`[]').lower() if token[0] in ("word", "qident") else None
+
+
+def _split_alias(item):
+    """(expression tokens, alias token or None) of a SELECT item."""
+    if len(item) >= 3 and item[-2][1].lower() == "as" and item[-1][0] in ("word", "qident"):
+        return item[:-2], item[-1]
+    if (len(item) >= 2 and item[-1][0] in ("word", "qident") and item[-1][1].lower() not in KEYWORDS
+            and (item[-2][1] == ")" or item[-2][0] in ("qident", "number", "string")
+                 or item[-2][0] == "word" and item[-2][1].lower() not in KEYWORDS)):
+        return item[:-1], item[-1]
+    return item, None
+
+
+def _groupings(clauses):
+    """
+    (SELECT list text, GROUP BY text) of the query's grouping with aliases and
+    ordinals replaced by the expressions they name; None when a grouping is an
+    aggregate or cannot be resolved.
+    """
+    selected = [_split_alias(item) for item in _items(clauses["select"])]
+    aliases = {_name(alias): expression for expression, alias in selected if alias is not None}
+    columns, groups = [], []
+    for item in _items(clauses.get("group") or [("word", "Type")]):
+        alias = None
+        if len(item) == 1 and item[0][0] == "number":
+            if not item[0][1].isdigit() or not 1 <= int(item[0][1]) <= len(selected):
+                return None
+            item, alias = selected[int(item[0][1]) - 1]
+        elif len(item) == 1 and _name(item[0]) in aliases:
+            alias = item[0]
+            item = aliases[_name(item[0])]
+        texts = [text for _, text in item]
+        if not texts or "*" in texts or any(
+                kind == "word" and text.lower() in AGGREGATES and texts[i + 1:i + 2] == ["("]
+                for i, (kind, text) in enumerate(item)):
+            return None
+        expression = " ".join(texts)
+        groups.append(expression)
+        columns.append(f"{expression} AS {alias[1]}" if alias is not None and [alias] != item else expression)
+    return ", ".join(columns), ", ".join(groups)
+
+
+def template_queries(sql_query):
+    """Follow-up queries over the ai4i2020 columns for a query on Machinelogs (empty for other queries)."""
+    clauses = _clauses(sql_query)
+    if clauses is None or len(clauses.get("from", ())) != 1:
+        return []
+    table = clauses["from"][0][1]
+    if table.strip('"`[]').lower() != TABLE:
+        return []
+    groupings = _groupings(clauses)
+    if groupings is None:
+        return []
+    group, group_by = groupings
+    where = f" WHERE {' '.join(text for _, text in clauses['where'])}" if clauses.get("where") else ""
+    tail = f" FROM {table}{where} GROUP BY {group_by}"
+    failure_modes = ", ".join(f'SUM("{mode}") AS {mode}' for mode in FAILURE_MODES)
+    sensors = ", ".join(f'ROUND(AVG("{column}"), 2) AS {alias}' for column, alias in SENSORS)
+    return [
+        f"SELECT {group}, {failure_modes}{tail}",
+        f'SELECT {group}, COUNT(*) AS machines, SUM("Machine failure") AS failures, '
+        f'ROUND(AVG("Machine failure") * 100, 2) AS failure_rate_pct{tail}',
+        f"SELECT {group}, {sensors}{tail}",
+    ]
+
+
+class Speculator:
+    """
+    Predicts and prefetches follow-up queries (see the module docstring).
+
+    Parameters:
+    run_query (coroutine function): query_db's implementation; called with the SQL.
+    max_concurrency (int): Speculative queries running at once in this process.
+    max_queries (int): Candidates prefetched per trigger.
+    timeout_s (float): Time allowed per speculative query.
+    budget_s (float): Database seconds speculation may spend per minute.
+    max_followups (int): Queries whose observed follow-ups are remembered.
+    busy (callable, optional): True while real queries keep the database busy; no speculation starts then.
+    """
+
+    def __init__(self, run_query, max_concurrency=2, max_queries=3, timeout_s=2.0, budget_s=10.0, max_followups=1000,
+                 busy=None):
+        self.run_query = run_query
+        self.busy = busy
+        self.max_concurrency = max_concurrency
+        self.max_queries = max_queries
+        self.timeout_s = timeout_s
+        self.budget_s = budget_s
+        self.max_followups = max_followups
+        self._followups = OrderedDict()  # canonical SQL -> {follow-up SQL: times seen}
+        self._prefetched = OrderedDict()  # result cache key -> execution time it will save
+        self._inflight = {}  # result cache key -> (future of the result, prefetch state, start time)
+        self._spent = deque()  # (monotonic time, seconds) of recent speculative queries
+        self._running = 0
+        self._tasks = set()
+        self._lock = threading.Lock()
+        self.triggers = 0
+        self.outcomes = {"prefetched": 0, "cached": 0, "failed": 0, "timeout": 0, "dropped": 0, "busy": 0, "budget": 0}
+        self.used = 0
+        self.saved_s = 0.0
+
+    def observe(self, previous_sql, sql_query):
+        """Remember that sql_query followed previous_sql in a session."""
+        key = canonicalize_sql(previous_sql) if previous_sql else None
+        if key is None or canonicalize_sql(sql_query) in (None, key):
+            return
+        with self._lock:
+            followups = self._followups.get(key)
+            if followups is None:
+                followups = self._followups[key] = {}
+            self._followups.move_to_end(key)
+            followups[sql_query] = followups.get(sql_query, 0) + 1
+            if len(followups) > 10:
+                del followups[min(followups, key=followups.get)]
+            while len(self._followups) > self.max_followups:
+                self._followups.popitem(last=False)
+
+    def candidates(self, sql_query):
+        """Likely next queries after sql_query: observed follow-ups first, then templates; deduplicated."""
+        key = canonicalize_sql(sql_query)
+        with self._lock:
+            followups = dict(self._followups.get(key) or {})
+        ranked = sorted(followups, key=followups.get, reverse=True) + template_queries(sql_query)
+        result = []
+        seen = {key}
+        for candidate in ranked:
+            candidate_key = canonicalize_sql(candidate)
+            if candidate_key is None or candidate_key in seen:
+                continue
+            seen.add(candidate_key)
+            result.append(candidate)
+            if len(result) >= self.max_queries:
+                break
+        return result
+
+    def after_query(self, previous_sql, sql_query):
+        """
+        Called when a session's query_db call succeeded: learn the transition
+        and prefetch likely next queries in the background. Never blocks.
+        """
+        self.observe(previous_sql, sql_query)
+        candidates = self.candidates(sql_query)
+        if not candidates:
+            return None
+        self.triggers += 1
+        # A fresh context: the prefetch is not part of the turn's trace or its tool deadline
+        task = contextvars.Context().run(asyncio.ensure_future, self._prefetch_all(sql_query, candidates))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    def _within_budget(self):
+        now = time.monotonic()
+        while self._spent and now - self._spent[0][0] > 60.0:
+            self._spent.popleft()
+        return sum(seconds for _, seconds in self._spent) < self.budget_s
+
+    def _count(self, outcome):
+        self.outcomes[outcome] += 1
+        SPECULATIVE_QUERIES.inc(outcome=outcome)
+
+    async def _prefetch_all(self, trigger_sql, candidates):
+        with trace("speculation", candidates=len(candidates)) as root:
+            for i, candidate in enumerate(candidates):
+                if self._running >= self.max_concurrency:
+                    # Stale by the time a slot frees up: drop the rest rather than queue
+                    for _ in candidates[i:]:
+                        self._count("dropped")
+                    break
+                if self.busy is not None and self.busy():
+                    for _ in candidates[i:]:
+                        self._count("busy")
+                    break
+                if not self._within_budget():
+                    for _ in candidates[i:]:
+                        self._count("budget")
+                    break
+                await self._prefetch(candidate)
+            root.set(outcomes=dict(self.outcomes))
+        if self.triggers % 20 == 0:
+            logging.info(f"Speculation stats: {self.stats()}")
+
+    async def _prefetch(self, sql_query):
+        self._running += 1
+        state = {"prefetched": False, "joined": False}
+        speculative_token = _speculative.set(state)
+        start = time.perf_counter()
+        outcome = "failed"
+        try:
+            task = asyncio.ensure_future(self.run_query(sql_query))
+            done, _ = await asyncio.wait({task}, timeout=self.timeout_s)
+            if not done and not state["joined"]:
+                # Cancelling interrupts the SQLite query
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+                outcome = "timeout"
+            else:
+                # A query_db call is waiting on this one: let it finish
+                result = await task
+                if state["prefetched"]:
+                    outcome = "prefetched"
+                elif not (isinstance(result, str) and result.startswith("Error")):
+                    outcome = "cached"
+        except Exception as error:
+            logging.warning(f"Speculative query failed: {error}")
+        finally:
+            self._spent.append((time.monotonic(), time.perf_counter() - start))
+            _speculative.reset(speculative_token)
+            self._running -= 1
+        self._count(outcome)
+
+    def begin_prefetch(self, key, state):
+        self._inflight[key] = (asyncio.get_running_loop().create_future(), state, time.perf_counter())
+
+    def end_prefetch(self, key, value, cost_s):
+        """value is None when the prefetch failed or was cancelled."""
+        inflight = self._inflight.pop(key, None)
+        if value is not None:
+            with self._lock:
+                self._prefetched[key] = cost_s
+                self._prefetched.move_to_end(key)
+                while len(self._prefetched) > 4 * self.max_followups:
+                    self._prefetched.popitem(last=False)
+        if inflight is not None and not inflight[0].done():
+            inflight[0].set_result(value)
+
+    async def join_prefetch(self, key):
+        """Result of the running prefetch of key, or None when there is none or it failed."""
+        inflight = self._inflight.get(key)
+        if inflight is None:
+            return None
+        future, state, started = inflight
+        state["joined"] = True
+        ran_s = time.perf_counter() - started
+        value = await asyncio.shield(future)
+        if value is not None:
+            with self._lock:
+                self._prefetched.pop(key, None)
+            self._credit(ran_s, "joined")
+        return value
+
+    def note_cache_hit(self, key):
+        """A query_db call was served from the cache; credit speculation if it put the result there."""
+        with self._lock:
+            cost_s = self._prefetched.pop(key, None)
+        if cost_s is not None:
+            self._credit(cost_s, "cached")
+
+    def _credit(self, saved_s, how):
+        self.used += 1
+        self.saved_s += saved_s
+        SPECULATIVE_HITS.inc(how=how)
+        logging.info(f"Speculative prefetch used ({how}): saved {saved_s:.3f}s")
+
+    def stats(self):
+        prefetched = self.outcomes["prefetched"]
+        return {
+            "triggers": self.triggers,
+            **self.outcomes,
+            "used": self.used,
+            "use_rate": self.used / prefetched if prefetched else 0.0,
+            "saved_s": self.saved_s,
+        }
+
+
+_speculator = None
+_speculator_lock = threading.Lock()
+
+
+def get_speculator():
+    """Process-wide Speculator, or None unless SPECULATION_ENABLED is set."""
+    global _speculator
+    if not env_bool('SPECULATION_ENABLED', False):
+        return None
+    with _speculator_lock:
+        if _speculator is None:
+            # Imported here: tools imports this module for the cache hooks
+            from executor import get_tool_executor
+            from tools import run_query
+
+            max_busy = env_int('SPECULATION_MAX_BUSY', 1)
+            _speculator = Speculator(
+                run_query,
+                max_concurrency=env_int('SPECULATION_MAX_CONCURRENCY', 2),
+                max_queries=env_int('SPECULATION_MAX_QUERIES', 3),
+                timeout_s=env_float('SPECULATION_TIMEOUT_S', 2.0),
+                budget_s=env_float('SPECULATION_BUDGET_S', 10.0),
+                busy=lambda: get_tool_executor().active >= max_busy,
+            )
+        return _speculator
+
+
+def begin_prefetch(key):
+    """A speculative query is about to run for result cache key."""
+    if _speculator is not None:
+        _speculator.begin_prefetch(key, _speculative.get())
+
+
+def end_prefetch(key, value, cost_s=0.0):
+    """The speculative query for key finished: value was cached, or None when it failed."""
+    state = _speculative.get()
+    if value is not None:
+        state["prefetched"] = True
+    if _speculator is not None:
+        _speculator.end_prefetch(key, value, cost_s)
+
+
+async def join_prefetch(key):
+    if _speculator is None:
+        return None
+    return await _speculator.join_prefetch(key)
+
+
+def note_cache_hit(key):
+    if _speculator is not None:
+        _speculator.note_cache_hit(key)
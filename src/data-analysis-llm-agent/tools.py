@@ -1,9 +1,20 @@
-import psycopg2
+import asyncio
+import logging
 import sqlite3
 import os
-import plotly.graph_objs as go
-import plotly.io as pio
-from utils import convert_to_json, json_to_markdown_table
+import sys
+import time
+from formatting import formatter_from_env
+from db_pool import get_sqlite_pool
+from pg_pool import get_postgres_pool
+from config import env_bool, env_int, env_str
+from query_cache import get_query_cache
+from rollups import get_rollup_store
+from index_advisor import get_index_advisor
+from charts import chart_key, decimate, get_figure_cache, render_png_in_background
+from tracing import annotate, span
+from speculation import begin_prefetch, end_prefetch, is_speculative, join_prefetch, note_cache_hit
+import result_encoding
 
 # function calling
 # avialable tools
@@ -67,124 +78,263 @@ tools_schema = [
                 "required": ["plot_type","x_values","y_values","plot_title","x_label","y_label"],
             },
         }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "read_result",
+            "description": "Read more rows of a large query result or a chart's data by its handle (tbl_... or fig_...)",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "handle": {"type": "string", "description": "handle given with the result"},
+                    "offset": {"type": "integer", "description": "first row, from 0"},
+                    "limit": {"type": "integer", "description": "number of rows"},
+                },
+                "required": ["handle"],
+            },
+        }
     }
 ]
 
 
-async def run_postgres_query(sql_query, markdown=True):
-    connection = None  # Initialize connection variable outside the try block
+async def cached_query(backend, sql_query, execute, variant=None):
+    """
+    Serve a query from the result cache, running execute() only on a miss.
+
+    execute() returns either (rows, column_names) or formatted text; variant
+    distinguishes cached text of the same query in different output shapes.
+    Speculative prefetches (see speculation.py) look entries up without
+    counting in the cache statistics; a miss on a query that is being
+    prefetched waits for the prefetch.
+    """
+    cache = get_query_cache(backend)
+    if cache is None:
+        return await execute()
+
+    key = cache.key(sql_query)
+    if key is not None and variant is not None:
+        key = f"{key}\x00{variant}"
+    speculative = is_speculative()
+    if speculative:
+        cached = cache.peek(key)
+        if cached is not None:
+            return cached
+    else:
+        cached = cache.get(key)
+        if cached is not None:
+            annotate(query_cache="hit")
+            note_cache_hit(key)
+            return cached
+        cached = await join_prefetch(key) if key is not None else None
+        annotate(query_cache="prefetch" if cached is not None else "miss")
+        if cached is not None:
+            return cached
+
+    start = time.perf_counter()
+    if speculative and key is not None:
+        begin_prefetch(key)
+    value = None
     try:
-        # Establish the connection
-        connection = psycopg2.connect(
-            dbname=os.getenv('DB_NAME'),
-            user=os.getenv('DB_USER'),
-            password=os.getenv('DB_PASSWORD'),
-            host=os.getenv('DB_HOST'),
-            port=os.getenv('DB_PORT')
-        )
-        print("Connected to the database!")
+        value = await execute()
+    finally:
+        cost_s = time.perf_counter() - start
+        if value is not None:
+            if isinstance(value, str):
+                cache.put_value(key, value, len(value), cost_s=cost_s)
+            else:
+                cache.put(key, value[0], value[1], cost_s=cost_s)
+        if speculative and key is not None:
+            end_prefetch(key, value, cost_s)
+    return value
 
-        # Create a cursor object
-        cursor = connection.cursor()
 
-        # Execute the query
-        cursor.execute(sql_query)
+async def run_postgres_query(sql_query, markdown=True):
+    try:
+        # Reuse a pooled connection; rows are read through a server-side cursor
+        async def fetch():
+            pool = await get_postgres_pool()
+            with span("db.postgres"):
+                return await pool.fetch(sql_query, max_rows=env_int('PG_MAX_ROWS', None))
 
-        # Fetch the column names
-        column_names = [desc[0] for desc in cursor.description]
+        result, column_names = await cached_query('postgres', sql_query, fetch)
 
-        # Fetch all rows
-        result = cursor.fetchall()
         if markdown:
-            # get result in json
-            json_data = convert_to_json(result,column_names)
-            markdown_data = json_to_markdown_table(json_data)
-
-            return markdown_data
+            # Size-capped markdown/CSV/JSON for the LLM
+            with span("result.format", rows=len(result)):
+                return formatter_from_env().write_rows(column_names, result)
 
         return result, column_names
-    except (Exception, psycopg2.Error) as error:
-        print("Error while executing the query:", error)
+    except Exception as error:
+        logging.warning(f"Error while executing the query: {error}")
         if markdown:
             return f"Error while executing the query: {error}"
         return [], []
 
-    finally:
-        # Close the cursor and connection
-        if connection:
-            cursor.close()
-            connection.close()
-            print("PostgreSQL connection is closed")
+
+async def timed_source_query(run, sql_query, *args):
+    """Run a query against the source table and hand its timing to the index advisor."""
+    start = time.perf_counter()
+    result = await run(sql_query, *args)
+    advisor = get_index_advisor()
+    # Speculative prefetches are not part of the workload the advisor tunes for
+    if advisor is not None and not is_speculative():
+        advisor.record_in_background(sql_query, time.perf_counter() - start)
+    return result
 
 
 async def run_sqlite_query(sql_query, markdown=True):
-    connection = None
     try:
-        # Establish the connection
-        db_path = os.path.join(os.path.dirname(__file__), '../data/ai4i2020.db')
-        print(db_path)
-        connection = sqlite3.connect(db_path)
+        # Run the query on the shared read-only pool, off the event loop
+        pool = get_sqlite_pool()
+        rollups = get_rollup_store()
+        columns = None
+        if db_backend() == 'columnar':
+            # numpy is only imported when the columnar backend is configured
+            from columnar import get_column_store
+            columns = get_column_store()
+        if markdown:
+            # Rows are streamed from the cursor into size-capped markdown/CSV/JSON for the LLM
+            formatter = formatter_from_env()
 
-        # Create a cursor object
-        cursor = connection.cursor()
+            async def execute_formatted():
+                # Aggregates over Type/failure modes/sensor bins are answered from precomputed rollups;
+                # rows are formatted as they are read, so these spans include result formatting
+                if rollups:
+                    with span("db.rollups") as db_span:
+                        text = await rollups.run_formatted(sql_query, formatter)
+                        db_span.set(served=text is not None)
+                    if text is not None:
+                        return text
+                if columns is not None:
+                    # Vectorized over the column store; unsupported SQL goes on to SQLite
+                    with span("db.columnar") as db_span:
+                        text = await columns.run_formatted(sql_query, formatter)
+                        db_span.set(served=text is not None)
+                    if text is not None:
+                        return text
+                with span("db.sqlite"):
+                    return await timed_source_query(pool.run_formatted, sql_query, formatter)
 
-        # Execute the query
-        cursor.execute(sql_query)
+            return await cached_query('sqlite', sql_query, execute_formatted, variant=formatter.signature())
 
-        # Fetch the column names
-        column_names = [desc[0] for desc in cursor.description]
+        async def execute():
+            result = await rollups.run(sql_query) if rollups else None
+            if result is None and columns is not None:
+                result = await columns.run(sql_query)
+            return result if result is not None else await timed_source_query(pool.run, sql_query)
 
-        # Fetch all rows
-        result = cursor.fetchall()
-        if markdown:
-            # get result in json
-            json_data = convert_to_json(result,column_names)
-            markdown_data = json_to_markdown_table(json_data)
-            return markdown_data
+        result, column_names = await cached_query('sqlite', sql_query, execute)
 
         return result, column_names
     except sqlite3.Error as error:
-        print("Error while executing the query:", error)
+        logging.warning(f"Error while executing the query: {error}")
         if markdown:
             return f"Error while executing the query: {error}"
         return [], []
 
-    finally:
-        # Close the cursor and connection
-        if connection:
-            cursor.close()
-            connection.close()
-            print("SQLite connection is closed")
+def db_backend():
+    """Backend behind the query_db tool: 'sqlite' (default), 'columnar' or 'postgres', from DB_BACKEND."""
+    return env_str('DB_BACKEND', 'sqlite').lower()
+
+
+async def run_query(sql_query, markdown=True):
+    if db_backend() == 'postgres':
+        return await run_postgres_query(sql_query, markdown=markdown)
+    return await run_sqlite_query(sql_query, markdown=markdown)
+
+
+async def read_result(handle, offset=0, limit=50):
+    """Rows of a result kept by handle when it was encoded for the model (see result_encoding.py)."""
+    return result_encoding.read_result(handle, offset, limit)
+
+
+def is_figure(value):
+    """True for plotly figures, without importing plotly when no chart was ever built."""
+    graph_objs = sys.modules.get("plotly.graph_objs")
+    return graph_objs is not None and isinstance(value, graph_objs.Figure)
+
 
 async def plot_chart(x_values, y_values, plot_title, x_label, y_label, plot_type='line', save_path="tmp/tmp.png"):
     """
     Generate a bar chart, line chart, or scatter plot based on input data using Plotly.
 
+    The figure is built on a worker thread so large series do not block the event loop.
+    See build_chart for parameters.
+    """
+    loop = asyncio.get_running_loop()
+    with span("chart.build", plot_type=plot_type, points=len(y_values)):
+        return await loop.run_in_executor(
+            None, cached_chart, x_values, y_values, plot_title, x_label, y_label, plot_type, save_path
+        )
+
+
+def cached_chart(x_values, y_values, plot_title, x_label, y_label, plot_type='line', save_path="tmp/tmp.png"):
+    """
+    build_chart behind the figure cache; identical arguments return the same figure.
+
+    With CHART_RENDER_PNG on, the figure is also written to save_path as a PNG on a
+    background thread (needs kaleido).
+    """
+    max_points = env_int('CHART_MAX_POINTS', 2000)
+    cache = get_figure_cache()
+    key = chart_key(x_values, y_values, plot_title, x_label, y_label, plot_type, max_points)
+    fig = cache.get(key) if cache is not None else None
+    if fig is None:
+        start = time.perf_counter()
+        fig = build_chart(x_values, y_values, plot_title, x_label, y_label, plot_type, save_path)
+        if cache is not None:
+            size = cache.put(key, fig)
+            logging.info(f"Built {plot_type} chart of {len(y_values)} points in {time.perf_counter() - start:.3f}s "
+                         f"({size} bytes)")
+    if save_path and env_bool('CHART_RENDER_PNG', False):
+        render_png_in_background(fig, save_path, key)
+    return fig
+
+
+def build_chart(x_values, y_values, plot_title, x_label, y_label, plot_type='line', save_path="tmp/tmp.png"):
+    """
+    Generate a bar chart, line chart, or scatter plot based on input data using Plotly.
+
     Parameters:
     x_values (array-like): Input values for the x-axis.
     y_values (array-like): Input values for the y-axis.
     plot_type (str, optional): Type of plot to generate ('bar', 'line', or 'scatter'). Default is 'line'.
-    save_path (str, optional): Path to save the plot image locally. If None, the plot image will not be saved locally.
+    save_path (str, optional): Path to save the plot image locally (see cached_chart). If None, the plot image will not be saved locally.
 
     Returns:
-    str: Data URI of the plot image.
+    plotly.graph_objs.Figure: The chart, with at most CHART_MAX_POINTS points for line and scatter plots.
     """
+    # Imported here so plotly is only loaded once a chart is actually drawn
+    import plotly.graph_objs as go
+
     # Validate input lengths
     if len(x_values) != len(y_values):
         raise ValueError("Lengths of x_values and y_values must be the same.")
 
-    # Define plotly trace based on plot_type
+    # Large series are downsampled (lines) or binned (scatter) before they reach the browser
+    points = len(y_values)
+    x_values, y_values, counts = decimate(plot_type, x_values, y_values, env_int('CHART_MAX_POINTS', 2000))
+    title = f'{plot_title} {plot_type.capitalize()} Chart'
+    if len(y_values) < points:
+        how = 'binned' if counts is not None else 'downsampled'
+        title += f'<br><sup>{points} points {how} to {len(y_values)}</sup>'
+
     # Define plotly trace based on plot_type
     if plot_type == 'bar':
         trace = go.Bar(x=x_values, y=y_values, marker=dict(color='#24C8BF', line=dict(width=1)))
     elif plot_type == 'scatter':
         trace = go.Scatter(x=x_values, y=y_values, mode='markers', marker=dict(color='#df84ff', size=10, opacity=0.7, line=dict(width=1)))
+        if counts is not None:
+            trace.update(text=[f'{count} points' for count in counts], marker_size=6)
     elif plot_type == 'line':
-        trace = go.Scatter(x=x_values, y=y_values, mode='lines+markers', marker=dict(color='#ff9900', size=8, line=dict(width=1)), line=dict(width=2, color='#ff9900'))
+        # Markers on every point only help for short series
+        mode = 'lines+markers' if len(y_values) <= 200 else 'lines'
+        trace = go.Scatter(x=x_values, y=y_values, mode=mode, marker=dict(color='#ff9900', size=8, line=dict(width=1)), line=dict(width=2, color='#ff9900'))
 
     # Create layout for the plot
     layout = go.Layout(
-        title=f'{plot_title} {plot_type.capitalize()} Chart',
+        title=title,
         title_font=dict(size=20, family='Arial', color='#333'),
         xaxis=dict(title=x_label, titlefont=dict(size=18), tickfont=dict(size=14), gridcolor='#f0f0f0'),
         yaxis=dict(title=y_label, titlefont=dict(size=18), tickfont=dict(size=14), gridcolor='#f0f0f0'),
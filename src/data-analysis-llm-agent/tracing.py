@@ -0,0 +1,356 @@
+"""
+Structured logging and per-turn tracing.
+
+Log records are handed to a queue on the calling thread and formatted and
+written (as JSON lines, to a size-rotated file) by a listener thread, so the
+event loop never waits on disk. Each chat turn runs in a trace; spans around
+the model call, every tool call, DB execution and result formatting nest under
+it through contextvars, so log records carry the trace and span id of the code
+that emitted them. When a turn ends its per-stage latency breakdown is logged,
+and with TRACE_EXPORT the spans are written to a JSON lines file or posted to
+an OpenTelemetry collector (OTLP/HTTP JSON) by a background thread.
+
+    with trace("turn", session=session_id):
+        with span("llm.completion", model=model):
+            ...
+"""
+import atexit
+import contextvars
+import json
+import logging
+import logging.handlers
+import queue
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+
+from config import env_int, env_str
+from metrics import observe_span
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+# LogRecord attributes that are not user supplied extras
+_RECORD_FIELDS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "trace_id", "span_id"}
+
+
+class Span:
+    """
+    One timed stage of a trace. Use as a context manager (see trace and span).
+
+    Attributes set with set() are exported with the span; the root span of a
+    trace also collects every finished span of its trace for the breakdown.
+    """
+
+    __slots__ = ("name", "trace_id", "span_id", "parent", "root", "attributes", "start_ns",
+                 "_start", "duration_s", "error", "finished", "_token")
+
+    def __init__(self, name, parent=None, attributes=None):
+        self.name = name
+        self.parent = parent
+        self.root = parent.root if parent is not None else self
+        self.trace_id = parent.trace_id if parent is not None else uuid.uuid4().hex
+        self.span_id = uuid.uuid4().hex[:16]
+        self.attributes = attributes or {}
+        self.duration_s = None
+        self.error = None
+        self.finished = [] if parent is None else None
+        self.start_ns = None
+        self._start = None
+        self._token = None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def __enter__(self):
+        self.start_ns = time.time_ns()
+        self._start = time.perf_counter()
+        self._token = _current_span.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.duration_s = time.perf_counter() - self._start
+        if exc_type is not None:
+            self.error = f"{exc_type.__name__}: {exc}"
+        self.root.finished.append(self)
+        observe_span(self)
+        exporter = get_span_exporter()
+        if exporter is not None:
+            exporter.export(self)
+        if self.parent is None:
+            # Logged while the span is still current, so the record carries its trace id
+            _log_breakdown(self)
+        _current_span.reset(self._token)
+        return False
+
+    def to_dict(self):
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent.span_id if self.parent is not None else None,
+            "name": self.name,
+            "start_ns": self.start_ns,
+            "duration_s": self.duration_s,
+            "attributes": self.attributes,
+            "error": self.error,
+        }
+
+
+def trace(name, **attributes):
+    """Start a new trace whose root span is name (e.g. one chat turn)."""
+    return Span(name, None, attributes)
+
+
+def span(name, **attributes):
+    """Child span of the current span, or a new trace when none is active."""
+    return Span(name, _current_span.get(), attributes)
+
+
+def current_span():
+    return _current_span.get()
+
+
+def annotate(**attributes):
+    """Set attributes on the current span, if any."""
+    current = _current_span.get()
+    if current is not None:
+        current.attributes.update(attributes)
+
+
+def stage_breakdown(root):
+    """{span name: [count, total seconds]} over the finished spans of a trace, root excluded."""
+    stages = {}
+    for finished in root.finished:
+        if finished is root:
+            continue
+        stage = stages.setdefault(finished.name, [0, 0.0])
+        stage[0] += 1
+        stage[1] += finished.duration_s
+    return stages
+
+
+def _log_breakdown(root):
+    stages = stage_breakdown(root)
+    summary = ", ".join(f"{name} {total:.3f}s" + (f" x{count}" if count > 1 else "")
+                        for name, (count, total) in stages.items())
+    logging.info(
+        f"Trace {root.name} {root.duration_s:.3f}s: {summary or 'no stages'}",
+        extra={"fields": {"duration_s": root.duration_s,
+                          "stages": {name: {"count": count, "total_s": total} for name, (count, total) in stages.items()}}},
+    )
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record: ts, level, logger, message, trace/span ids and extra fields."""
+
+    def format(self, record):
+        data = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if getattr(record, "trace_id", None):
+            data["trace_id"] = record.trace_id
+            data["span_id"] = record.span_id
+        for key, value in record.__dict__.items():
+            if key == "fields":
+                data.update(value)
+            elif key not in _RECORD_FIELDS:
+                data[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            data["exception"] = record.exc_text
+        return json.dumps(data, default=str)
+
+
+class TraceQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that stamps records with the emitting task's trace and span id."""
+
+    def prepare(self, record):
+        current = _current_span.get()
+        record = logging.makeLogRecord(record.__dict__)
+        record.trace_id = current.trace_id if current is not None else None
+        record.span_id = current.span_id if current is not None else None
+        # Resolve the message and traceback now: args and exc_info may not survive the hand-off
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+_listener = None
+_setup_lock = threading.Lock()
+
+
+def setup_logging():
+    """
+    Route the root logger through a queue to a rotating log file. Idempotent.
+
+    Settings: LOG_PATH (default chatbot.log), LOG_FORMAT (json or text),
+    LOG_LEVEL, LOG_MAX_BYTES and LOG_BACKUP_COUNT.
+    """
+    global _listener
+    with _setup_lock:
+        if _listener is not None:
+            return
+        file_handler = logging.handlers.RotatingFileHandler(
+            env_str('LOG_PATH', 'chatbot.log'),
+            maxBytes=env_int('LOG_MAX_BYTES', 10 * 1024 * 1024),
+            backupCount=env_int('LOG_BACKUP_COUNT', 5),
+            encoding="utf-8",
+        )
+        if env_str('LOG_FORMAT', 'json') == 'json':
+            file_handler.setFormatter(JsonFormatter())
+        else:
+            file_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
+
+        log_queue = queue.SimpleQueue()
+        root = logging.getLogger()
+        root.addHandler(TraceQueueHandler(log_queue))
+        root.setLevel(env_str('LOG_LEVEL', 'INFO').upper())
+        _listener = logging.handlers.QueueListener(log_queue, file_handler)
+        _listener.start()
+        atexit.register(shutdown_logging)
+
+
+def shutdown_logging():
+    """Flush queued records and stop the listener thread."""
+    global _listener
+    with _setup_lock:
+        if _listener is None:
+            return
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        root = logging.getLogger()
+        for handler in list(root.handlers):
+            if isinstance(handler, TraceQueueHandler):
+                root.removeHandler(handler)
+        _listener = None
+
+
+def otlp_payload(spans, service_name):
+    """OTLP/HTTP JSON body (ExportTraceServiceRequest) for a batch of span dicts."""
+    def attribute(key, value):
+        if isinstance(value, bool):
+            return {"key": key, "value": {"boolValue": value}}
+        if isinstance(value, int):
+            return {"key": key, "value": {"intValue": str(value)}}
+        if isinstance(value, float):
+            return {"key": key, "value": {"doubleValue": value}}
+        return {"key": key, "value": {"stringValue": str(value)}}
+
+    otlp_spans = []
+    for item in spans:
+        otlp_span = {
+            "traceId": item["trace_id"],
+            "spanId": item["span_id"],
+            "name": item["name"],
+            "kind": 1,
+            "startTimeUnixNano": str(item["start_ns"]),
+            "endTimeUnixNano": str(item["start_ns"] + int(item["duration_s"] * 1e9)),
+            "attributes": [attribute(key, value) for key, value in item["attributes"].items()],
+            "status": {"code": 2, "message": item["error"]} if item["error"] else {"code": 1},
+        }
+        if item["parent_id"]:
+            otlp_span["parentSpanId"] = item["parent_id"]
+        otlp_spans.append(otlp_span)
+    return {"resourceSpans": [{
+        "resource": {"attributes": [attribute("service.name", service_name)]},
+        "scopeSpans": [{"scope": {"name": "tracing"}, "spans": otlp_spans}],
+    }]}
+
+
+class SpanExporter:
+    """
+    Ships finished spans from a background thread, in batches.
+
+    Parameters:
+    target (str): A file path (one JSON span per line) or an http(s) URL of an
+        OTLP/HTTP collector, e.g. http://localhost:4318/v1/traces.
+    batch_size (int): Spans per write or request.
+    flush_interval_s (float): Longest time a span waits for its batch.
+    service_name (str): service.name resource attribute sent to collectors.
+    """
+
+    def __init__(self, target, batch_size=256, flush_interval_s=1.0, service_name="data-analysis-llm-agent"):
+        self.target = target
+        self.batch_size = batch_size
+        self.flush_interval_s = flush_interval_s
+        self.service_name = service_name
+        self.exported = 0
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=10000)
+        self._thread = threading.Thread(target=self._run, name="span-exporter", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def export(self, finished):
+        try:
+            self._queue.put_nowait(finished.to_dict())
+        except queue.Full:
+            # Tracing must never slow down or break a turn
+            self.dropped += 1
+
+    def _write(self, batch):
+        if self.target.startswith(("http://", "https://")):
+            # Imported here: urllib.request pulls in http.client and email, too slow for startup
+            import urllib.request
+
+            body = json.dumps(otlp_payload(batch, self.service_name)).encode("utf-8")
+            request = urllib.request.Request(self.target, data=body, headers={"Content-Type": "application/json"})
+            with urllib.request.urlopen(request, timeout=5) as response:
+                response.read()
+        else:
+            with open(self.target, "a", encoding="utf-8") as f:
+                f.writelines(json.dumps(item, default=str) + "\n" for item in batch)
+        self.exported += len(batch)
+
+    def _run(self):
+        while True:
+            batch = []
+            deadline = time.monotonic() + self.flush_interval_s
+            stop = False
+            while len(batch) < self.batch_size:
+                try:
+                    item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                batch.append(item)
+            if batch:
+                try:
+                    self._write(batch)
+                except Exception as error:
+                    self.dropped += len(batch)
+                    logging.warning(f"Span export to {self.target} failed: {error}")
+            if stop:
+                return
+
+    def close(self):
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join(timeout=5)
+
+
+_exporter = None
+_exporter_checked = False
+
+
+def get_span_exporter():
+    """Process-wide exporter for TRACE_EXPORT (file path or collector URL), or None when unset."""
+    global _exporter, _exporter_checked
+    if not _exporter_checked:
+        with _setup_lock:
+            if not _exporter_checked:
+                target = env_str('TRACE_EXPORT')
+                if target:
+                    _exporter = SpanExporter(target, service_name=env_str('TRACE_SERVICE_NAME', 'data-analysis-llm-agent'))
+                _exporter_checked = True
+    return _exporter
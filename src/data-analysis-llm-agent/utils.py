@@ -1,3 +1,4 @@
+import logging
 import sqlite3 
 
 EXTRA_SCHEMA_INFO = """
@@ -24,14 +25,14 @@ async def run_db_query(sql_query):
         
         return result, column_names
     except sqlite3.Error as error:
-        print("Error while executing the query:", error)
+        logging.warning(f"Error while executing the query: {error}")
         return [], []
     finally:
         # Close the cursor and connection
         if connection:
             cursor.close()
             connection.close()
-            print("SQLite connection is closed")
+            logging.debug("SQLite connection is closed")
 
 
 def generate_postgres_table_info_query(schema_table_pairs):